@@ -4,15 +4,70 @@
 This script takes an Oolite .dat file, scales it by a specified scale factor,
 and writes it out again (appending the scale factor to the name).
 
+Several factors, or ranges like 0.5:2:0.25 (start, stop and step, the stop
+value included), give one output per factor from a single parse of the file.
+
 Only the VERTEX section is modified. The rest of the file is passed through
 unchanged.
+
+With --transform, any affine transform is applied instead, and the result is
+written to "<name> transformed.dat". The transform is a chain of operations
+separated by semicolons, applied in order:
+
+  scale S | scale SX SY SZ     scale, uniformly or per axis
+  rotate x|y|z DEGREES         rotate around an axis
+  translate TX TY TZ           move
+  mirror x|y|z                 mirror along an axis
+  swap xy|yz|xz                swap two axes
+  recenter                     move the bounding box center to the origin
+  matrix M00 M01 ... M33       4x4 matrix, row by row, applied to (x y z 1)
+
+e.g. --transform "swap yz; rotate z 90; scale 2 1 1; recenter". Face normals,
+NORMALS and TANGENTS are multiplied by the inverse transpose of the matrix and
+renormalized, and the faces winding is reversed when the matrix determinant
+is negative. Other sections are passed through unchanged. A uniform positive
+scale, moved or not, changes none of them: everything after the vertices is
+then copied unchanged, as with a scale factor.
+
+With --meshbin, the parsed vertices are written to a .datscale.mbin file
+alongside the input file, and read back instead of scanning the input file
+again as long as it doesn't change.
+
+Usage: DatScale.py [-q|--quiet] [--stats json] [--meshbin] <file name> <scale factor> [<scale factor>...]
+       DatScale.py [-q|--quiet] [--stats json] [--meshbin] --transform <operations> <file name>
 """ 
 
-import sys, string, math, re
+import sys, string, math, re, array, itertools
+import multiprocessing.dummy
+import convstats
+import meshbin
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# Kind and layout version of the parsed data written in .mbin files. Bump the
+# version when the parsing changes, so older files are ignored.
+MESHBIN_KIND = "datscale"
+MESHBIN_VERSION = 1
+
+# Most outputs written at once when scaling by several factors.
+MAX_WRITE_THREADS = 4
 
 
 class DATLexer:
-	""" Tokens scanner for DAT files. """
+	""" Tokens scanner for DAT files.
+	Each token is found by one regular expression match, with the separators
+	and comments before it, instead of looking at the data one character at a
+	time. """
+	# Separators and comments, then a token. A token ends at a separator or
+	# at the beginning of a comment.
+	__tokenPattern = re.compile(r"((?:[ \r\n\t,]+|(?:#|//)[^\r\n]*)*)((?:[^ \r\n\t,#/]|/(?!/))*)")
+	# Same, the token running until the end of the line or a comment.
+	__lineTokenPattern = re.compile(r"((?:[ \r\n\t,]+|(?:#|//)[^\r\n]*)*)((?:[^\r\n#/]|/(?!/))*)")
+	
 	def __init__(self, data):
 		self.__data = data
 		self.__end = len(data)
@@ -20,10 +75,8 @@ class DATLexer:
 		self.__tokenLength = 0
 		self.__lineNumber = 1
 		self.__lastSeparator = ""
-		self.__isSeparatorChar = re.compile(r"[\ \r\n\t,]")
-		self.__isLineEnd = re.compile(r"[\r\n]")
-		self.__isNotLineEnd = re.compile(r"[^\r\n]")
-		self.__lastIsCR = False
+		self.__currentToken = ""
+		self.__lineCursor = 0
 	
 	def lineNumber(self):
 		""" Returns the line number at the beginning of the current token. """
@@ -39,7 +92,7 @@ class DATLexer:
 	
 	def nextToken(self):
 		""" Reads the next token. """
-		self.__advance(False)
+		self.__advance(self.__tokenPattern)
 		return self.currentToken()
 	
 	def expectLiteral(self, literal):
@@ -48,127 +101,447 @@ class DATLexer:
 	
 	def readInt(self):
 		""" Reads an integer. """
-		self.__advance(False)
+		self.__advance(self.__tokenPattern)
 		return int(self.currentToken())
 	
 	def readFloat(self):
 		""" Reads a floating-point number. """
-		self.__advance(False)
+		self.__advance(self.__tokenPattern)
 		return float(self.currentToken())
 	
+	def readFloats(self, count):
+		""" Reads count floating-point numbers in one pass, returned in an array('d'). """
+		matches = list(itertools.islice(self.__tokenPattern.finditer(self.__data, self.tokenEnd()), count))
+		if matches:
+			self.__setToken(matches[-1])
+		# float raises ValueError on the empty token found at the end of the data.
+		return array.array("d", [float(match.group(2)) for match in matches])
+	
 	def readUntilNewLine(self):
 		""" Reads until the beginning of a new line or the beginning of a comment. """
-		sef.__advance(True)
+		self.__advance(self.__lineTokenPattern)
 		return self.currentToken()
 		
 	def atEnd(self):
 		""" Tests whether the lexer has reached the end of its data. """
 		return self.__cursor == self.__end
 	
+	def tokenEnd(self):
+		""" Returns the offset of the end of the current token in the data. """
+		return self.__cursor + self.__tokenLength
 	
-	def __advance(self, untilEOL):
-		self.__cursor += self.__tokenLength
-		assert self.__cursor < self.__end
-		initialCursor = self.__cursor
-		
-		# Find beginning of token.
-		while 1:
-			self.__skipWhile(self.__isSeparatorChar)
-			
-			if not self.atEnd() and self.__commentAt(self.__cursor):
-				self.__skipWhile(self.__isNotLineEnd)
-			else:
-				break
-		
-		self.__lastSeparator = self.__data[initialCursor:self.__cursor]
+	
+	def __advance(self, pattern):
+		self.__setToken(pattern.match(self.__data, self.tokenEnd()))
+	
+	def __setToken(self, match):
+		self.__lastSeparator = match.group(1)
+		self.__currentToken = match.group(2)
+		self.__cursor = match.start(2)
+		self.__tokenLength = len(self.__currentToken)
 		
-		# Find length of token.
-		endCursor = None
-		if untilEOL:
-			endCursor = self.__scanTokenLength(self.__isLineEnd)
+		# Count the CR, LF and CR LF line ends up to the token.
+		skipped = self.__data[self.__lineCursor:self.__cursor]
+		self.__lineCursor = self.__cursor
+		self.__lineNumber += skipped.count("\n") + skipped.count("\r") - skipped.count("\r\n")
+	
+
+# Section header, like 'NAMES 2' or 'END'.
+sectionPattern = re.compile(r"([A-Z][A-Z]+)([ ]+.*)?$")
+# Comment at the end of a line.
+commentPattern = re.compile(r"\s*(#|//).*")
+# Separators between numbers.
+separatorPattern = re.compile(r"[\s,]+")
+
+axisIndexes = {"x": 0, "y": 1, "z": 2}
+
+
+def parseFactors(arguments):
+	""" Parses scale factors, like "2" or "0.5:2:0.25" for 0.5, 0.75 ... 2.
+	Returns the list of factors, without duplicates.
+	Raises ValueError on bad factors or ranges. """
+	factors = []
+	for argument in arguments:
+		if ":" in argument:
+			bounds = argument.split(":")
+			if len(bounds) != 3:
+				raise ValueError("Expected a range like START:STOP:STEP, not \"" + argument + "\".")
+			start, stop, step = [float(bound) for bound in bounds]
+			if step <= 0 or stop < start:
+				raise ValueError("Bad range \"" + argument + "\".")
+			# The stop value is included, despite rounding errors.
+			count = int(math.floor((stop - start) / step + 1e-9)) + 1
+			values = [round(start + index * step, 10) for index in range(count)]
 		else:
-			endCursor = self.__scanTokenLength(self.__isSeparatorChar)
-		
-		self.__tokenLength = endCursor - self.__cursor
-		self.__currentToken = self.__data[self.__cursor:endCursor]
-	
-	
-	def __skipWhile(self, matcher):
-		while 1:
-			if self.__cursor == self.__end:
-				return
-			
-			curr = self.__data[self.__cursor]
-			if not matcher.match(curr):
-				return
-			
-			if self.__isNotLineEnd.match(curr):
-				self.__lastIsCR = False
-			else:
-				if curr != '\n' or not self.__lastIsCR:
-					self.__lineNumber = self.__lineNumber + 1
-				self.__lastIsCR = curr == '\r'
-			
-			self.__cursor = self.__cursor + 1
-	
-	def __scanTokenLength(self, endCriterion):
-		endCursor = self.__cursor + 1
-		while endCursor < self.__end and not endCriterion.match(self.__data[endCursor]) and not self.__commentAt(endCursor):
-			endCursor = endCursor + 1
-		return endCursor
-	
-	def __commentAt(self, offset):
-		if self.__data[offset] == '#':
-			return True
-		if offset + 1 < self.__end and self.__data[offset] == '/' and self.__data[offset + 1] == '/':
-			return True
-		return False
-	
-
-if len(sys.argv) != 3:
+			values = [float(argument)]
+		for value in values:
+			if value not in factors:
+				factors.append(value)
+	return factors
+
+def identityMatrix():
+	""" Returns a 4x4 identity matrix, as a list of rows. """
+	return [[float(row == column) for column in range(4)] for row in range(4)]
+
+def multiplyMatrices(a, b):
+	""" Returns the 4x4 matrix a.b: b is applied first. """
+	return [[sum(a[row][k] * b[k][column] for k in range(4)) for column in range(4)] for row in range(4)]
+
+def rotationMatrix(axis, degrees):
+	""" Returns the matrix of a rotation around the x, y or z axis. Multiples of 90 degrees give exact matrices. """
+	if degrees % 90 == 0:
+		cos, sin = [(1.0, 0.0), (0.0, 1.0), (-1.0, 0.0), (0.0, -1.0)][int(degrees // 90) % 4]
+	else:
+		cos, sin = math.cos(math.radians(degrees)), math.sin(math.radians(degrees))
+	first, second = [(1, 2), (2, 0), (0, 1)][axisIndexes[axis]]
+	matrix = identityMatrix()
+	matrix[first][first] = cos
+	matrix[first][second] = -sin
+	matrix[second][first] = sin
+	matrix[second][second] = cos
+	return matrix
+
+def parseTransform(spec):
+	""" Parses a chain of operations like "scale 2 1 1; rotate z 90; recenter".
+	Returns a list of (name, arguments) tuples.
+	Raises ValueError on unknown operations or bad arguments. """
+	operations = []
+	for text in spec.split(";"):
+		tokens = text.split()
+		if not tokens:
+			continue
+		name, arguments = tokens[0].lower(), tokens[1:]
+		if name in ("scale", "translate", "matrix"):
+			counts = {"scale": (1, 3), "translate": (3,), "matrix": (16,)}[name]
+			if len(arguments) not in counts:
+				raise ValueError("\"" + name + "\" expects " + " or ".join(str(count) for count in counts) + " numbers.")
+			arguments = [float(argument) for argument in arguments]
+		elif name == "rotate":
+			if len(arguments) != 2 or arguments[0].lower() not in axisIndexes:
+				raise ValueError("\"rotate\" expects an axis and an angle in degrees.")
+			arguments = [arguments[0].lower(), float(arguments[1])]
+		elif name == "mirror":
+			if len(arguments) != 1 or arguments[0].lower() not in axisIndexes:
+				raise ValueError("\"mirror\" expects an axis.")
+			arguments = [arguments[0].lower()]
+		elif name == "swap":
+			if len(arguments) != 1 or len(arguments[0]) != 2 or not set(arguments[0].lower()) <= set(axisIndexes) or arguments[0][0] == arguments[0][1]:
+				raise ValueError("\"swap\" expects two axes, like xy.")
+			arguments = [arguments[0].lower()]
+		elif name == "recenter":
+			if arguments:
+				raise ValueError("\"recenter\" expects no argument.")
+		else:
+			raise ValueError("Unknown transform operation \"" + name + "\".")
+		operations.append((name, arguments))
+	if not operations:
+		raise ValueError("Empty transform.")
+	return operations
+
+def composeTransform(operations, vertices):
+	""" Returns the 4x4 matrix of a chain of operations, as returned by parseTransform. vertices are needed by "recenter". """
+	matrix = identityMatrix()
+	for name, arguments in operations:
+		step = identityMatrix()
+		if name == "scale":
+			scales = arguments * 3 if len(arguments) == 1 else arguments
+			for axis in range(3):
+				step[axis][axis] = scales[axis]
+		elif name == "translate":
+			for axis in range(3):
+				step[axis][3] = arguments[axis]
+		elif name == "rotate":
+			step = rotationMatrix(arguments[0], arguments[1])
+		elif name == "mirror":
+			step[axisIndexes[arguments[0]]][axisIndexes[arguments[0]]] = -1.0
+		elif name == "swap":
+			first, second = axisIndexes[arguments[0][0]], axisIndexes[arguments[0][1]]
+			step[first], step[second] = step[second], step[first]
+		elif name == "matrix":
+			step = [arguments[row * 4:row * 4 + 4] for row in range(4)]
+		elif name == "recenter":
+			points = transformPoints(vertices, matrix)
+			for axis in range(3):
+				coordinates = points[axis::3]
+				if coordinates:
+					step[axis][3] = -(min(coordinates) + max(coordinates)) / 2.0
+		matrix = multiplyMatrices(step, matrix)
+	return matrix
+
+def normalMatrix(matrix):
+	""" Returns the inverse transpose of the 3x3 linear part of a 4x4 matrix, and its determinant.
+	Raises ValueError if the matrix is singular. """
+	(a, b, c), (d, e, f), (g, h, i) = [row[:3] for row in matrix[:3]]
+	determinant = a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+	if determinant == 0:
+		raise ValueError("The transform matrix is singular.")
+	# Transpose of the inverse: the cofactors divided by the determinant.
+	cofactors = [[e * i - f * h, f * g - d * i, d * h - e * g],
+	             [c * h - b * i, a * i - c * g, b * g - a * h],
+	             [b * f - c * e, c * d - a * f, a * e - b * d]]
+	return [[value / determinant for value in row] for row in cofactors], determinant
+
+def isUniformScale(matrix):
+	""" Tests whether the linear part of a 4x4 matrix is a uniform positive scale, which changes neither the directions nor the winding. """
+	factor = matrix[0][0]
+	return factor > 0 and all(matrix[row][column] == (factor if row == column else 0) for row in range(3) for column in range(3))
+
+def transformPoints(values, matrix):
+	""" Applies a 4x4 matrix to flat x, y, z coordinates, in one vectorized pass if NumPy is available. Returns an array('d'). """
+	if numpy is not None:
+		points = numpy.frombuffer(values, numpy.float64).reshape(-1, 3)
+		linear = numpy.array([row[:3] for row in matrix[:3]])
+		translation = numpy.array([row[3] for row in matrix[:3]])
+		result = array.array("d")
+		result.fromstring((points.dot(linear.T) + translation).tostring())
+		return result
+	(a, b, c, tx), (d, e, f, ty), (g, h, i, tz) = matrix[:3]
+	result = array.array("d")
+	for index in range(0, len(values), 3):
+		x, y, z = values[index], values[index + 1], values[index + 2]
+		result.extend((a * x + b * y + c * z + tx, d * x + e * y + f * z + ty, g * x + h * y + i * z + tz))
+	return result
+
+def transformDirections(values, matrix):
+	""" Applies a 3x3 matrix to flat x, y, z directions and renormalizes them, in one vectorized pass if NumPy is available. Null directions stay null. Returns an array('d'). """
+	if numpy is not None:
+		directions = numpy.frombuffer(values, numpy.float64).reshape(-1, 3).dot(numpy.array(matrix).T)
+		lengths = numpy.sqrt((directions * directions).sum(axis=1))
+		lengths[lengths == 0] = 1.0
+		result = array.array("d")
+		result.fromstring((directions / lengths[:, None]).tostring())
+		return result
+	(a, b, c), (d, e, f), (g, h, i) = matrix
+	result = array.array("d")
+	for index in range(0, len(values), 3):
+		x, y, z = values[index], values[index + 1], values[index + 2]
+		x, y, z = a * x + b * y + c * z, d * x + e * y + f * z, g * x + h * y + i * z
+		length = math.sqrt(x * x + y * y + z * z) or 1.0
+		result.extend((x / length, y / length, z / length))
+	return result
+
+def transformTail(tail, directionMatrix, flip):
+	""" Rewrites the part of a DAT file following the vertices.
+	Face normals, NORMALS and TANGENTS are transformed by directionMatrix, all at once, and faces and their texture coordinates are reversed if flip is true. Other lines, and comments, are passed through unchanged. """
+	lines = tail.splitlines(True)
+	section = None
+	directions = array.array("d")
+	# (line index, section, tokens) of the lines to rewrite.
+	rewritten = []
+	for index, line in enumerate(lines):
+		content = commentPattern.sub("", line.rstrip("\r\n")).strip()
+		header = sectionPattern.match(content)
+		if header:
+			section = header.group(1)
+			continue
+		if not content:
+			continue
+		if section == "FACES":
+			tokens = separatorPattern.split(content)
+			directions.extend(float(token) for token in tokens[3:6])
+		elif section in ("NORMALS", "TANGENTS"):
+			tokens = separatorPattern.split(content)
+			directions.extend(float(token) for token in tokens[:3])
+		elif section == "TEXTURES" and flip:
+			tokens = content.split()
+		else:
+			continue
+		rewritten.append((index, section, tokens))
+	
+	directions = transformDirections(directions, directionMatrix)
+	direction = 0
+	for index, section, tokens in rewritten:
+		line = lines[index].rstrip("\r\n")
+		comment = commentPattern.search(line)
+		# Comment and line end of the original line.
+		end = (comment.group(0) if comment else "") + lines[index][len(line):]
+		if section == "TEXTURES":
+			points = [tokens[point:point + 2] for point in range(3, len(tokens), 2)]
+			points.reverse()
+			lines[index] = tokens[0] + "\t" + " ".join(tokens[1:3]) + "\t" + "\t".join(" ".join(point) for point in points) + end
+			continue
+		x, y, z = directions[direction:direction + 3]
+		direction += 3
+		if section == "FACES":
+			indexes = tokens[7:7 + int(tokens[6])]
+			if flip:
+				indexes.reverse()
+			lines[index] = ",".join(tokens[:3]) + ",\t" + '% .5f,% .5f,% .5f' % (x, y, z) + ",\t" + tokens[6] + ",\t" + ",".join(indexes) + end
+		else:
+			lines[index] = '% .5f,% .5f,% .5f' % (x, y, z) + end
+	return "".join(lines)
+
+
+quiet = False
+statsFormat = None
+useMeshbin = False
+transformSpec = None
+arguments = []
+argIterator = iter(sys.argv[1:])
+for arg in argIterator:
+	if arg in ("-q", "--quiet"):
+		quiet = True
+	elif arg == "--stats":
+		statsFormat = next(argIterator, "")
+	elif arg.startswith("--stats="):
+		statsFormat = arg.split("=", 1)[1]
+	elif arg == "--meshbin":
+		useMeshbin = True
+	elif arg == "--transform":
+		transformSpec = next(argIterator, "")
+	elif arg.startswith("--transform="):
+		transformSpec = arg.split("=", 1)[1]
+	else:
+		arguments.append(arg)
+
+if transformSpec is None and len(arguments) < 2:
 	print "Expected two arguments, file name and scale factor."
 	exit(1)
 
-inputFileName = sys.argv[1]
-factor = float(sys.argv[2])
+if transformSpec is not None:
+	if len(arguments) != 1:
+		print "Expected one argument with --transform, file name."
+		exit(1)
+	try:
+		operations = parseTransform(transformSpec)
+	except ValueError, e:
+		print e
+		exit(1)
+	factors = [1.0]
+else:
+	try:
+		factors = parseFactors(arguments[1:])
+	except ValueError, e:
+		print e
+		exit(1)
+
+if statsFormat is not None and statsFormat not in convstats.STATS_FORMATS:
+	print "Unknown statistics format \"" + statsFormat + "\"."
+	exit(1)
 
-outputFileName = ""
+# The progress messages don't mix with the statistics.
+if statsFormat:
+	messageFile = sys.stderr
+else:
+	messageFile = sys.stdout
+
+inputFileName = arguments[0]
+
+baseFileName = ""
 outputFileComponents = inputFileName.rsplit(".", 1)
 if len(outputFileComponents) == 1 or outputFileComponents[1].lower() != "dat":
-	outputFileName = inputFileName
+	baseFileName = inputFileName
 else:
-	outputFileName = outputFileComponents[0]
+	baseFileName = outputFileComponents[0]
 
-outputFileName += " x " + str(factor) + ".dat";
+if transformSpec is None:
+	outputFileNames = [baseFileName + " x " + str(factor) + ".dat" for factor in factors]
+else:
+	outputFileNames = [baseFileName + " transformed.dat"]
 
-print "Scaling \"" + inputFileName + "\" by " + str(factor) + " to \"" + outputFileName + "\"..."
+if not quiet:
+	for factor, outputFileName in zip(factors, outputFileNames):
+		if transformSpec is None:
+			print >> messageFile, "Scaling \"" + inputFileName + "\" by " + str(factor) + " to \"" + outputFileName + "\"..."
+		else:
+			print >> messageFile, "Transforming \"" + inputFileName + "\" to \"" + outputFileName + "\"..."
+
+if statsFormat:
+	stats = convstats.FileStats("DatScale.py", inputFileName)
+else:
+	stats = convstats.NULL_STATS
 
+stats.stage("read")
 nVerts = 0
 inputFile = open(inputFileName, "r")
 fileData = inputFile.read()
-lexer = DATLexer(fileData)
 
-lexer.expectLiteral("NVERTS")
-nverts = lexer.readInt()
-lexer.expectLiteral("NFACES")
-nfaces = lexer.readInt()
-lexer.expectLiteral("VERTEX")
+mbinFileName = meshbin.file_name(inputFileName, MESHBIN_KIND)
+mesh = None
+if useMeshbin:
+	source = meshbin.source_info(inputFileName)
+	# With NumPy, the vertices are used in place from the mapped file, read-only.
+	mesh = meshbin.load(mbinFileName, MESHBIN_KIND, MESHBIN_VERSION, source, in_place=True)
 
-outputFile = open(outputFileName, "w")
-outputFile.write("// " + inputFileName + " rescaled by a factor of " + str(factor) + "\n\n")
-outputFile.write("NVERTS " + str(nverts) + "\nNFACES " + str(nfaces) + "\n\nVERTEX\n");
+if mesh is None:
+	lexer = DATLexer(fileData)
+	
+	lexer.expectLiteral("NVERTS")
+	nverts = lexer.readInt()
+	lexer.expectLiteral("NFACES")
+	nfaces = lexer.readInt()
+	lexer.expectLiteral("VERTEX")
+	vertices = lexer.readFloats(3 * nverts)
+	tail = lexer.tokenEnd()
+else:
+	# Counts, vertices and where the rest of the file starts, as found by a
+	# previous run.
+	nverts = mesh.meta["nverts"]
+	nfaces = mesh.meta["nfaces"]
+	vertices = mesh["vertices"]
+	tail = mesh.meta["tail"]
+	if not quiet:
+		print >> messageFile, "Parsed vertices read from \"" + mbinFileName + "\"."
 
+# Everything after the vertices, separators and comments included, is copied
+# as is in every output.
+tailData = fileData[tail:]
+points = vertices
+if transformSpec is not None:
+	stats.stage("transform")
+	matrix = composeTransform(operations, vertices)
+	try:
+		directionMatrix, determinant = normalMatrix(matrix)
+	except ValueError, e:
+		print e
+		exit(1)
+	points = transformPoints(vertices, matrix)
+	if not isUniformScale(matrix):
+		tailData = transformTail(tailData, directionMatrix, determinant < 0)
 
-for i in range(nverts):
-	x = lexer.readFloat() * factor
-	y = lexer.readFloat() * factor
-	z = lexer.readFloat() * factor
-	
-	outputFile.write('% 5f,% .5f,% .5f\n' % (x, y, z))
-	#outputFile.write(str(x * factor) + ", " + str(y * factor) + ", " + str(z * factor) + "\n")
+def writeOutput(factor, outputFileName):
+	""" Writes the vertices scaled by factor and the rest of the file to outputFileName. """
+	if transformSpec is None:
+		header = "// " + inputFileName + " rescaled by a factor of " + str(factor) + "\n\n"
+	else:
+		header = "// " + inputFileName + " transformed by \"" + transformSpec + "\"\n\n"
+	outputFile = open(outputFileName, "w")
+	outputFile.write(header)
+	outputFile.write("NVERTS " + str(nverts) + "\nNFACES " + str(nfaces) + "\n\nVERTEX\n");
+	lines = []
+	for i in range(0, 3 * nverts, 3):
+		x = points[i] * factor
+		y = points[i + 1] * factor
+		z = points[i + 2] * factor
+		
+		lines.append('% 5f,% .5f,% .5f\n' % (x, y, z))
+		#outputFile.write(str(x * factor) + ", " + str(y * factor) + ", " + str(z * factor) + "\n")
+	outputFile.write("".join(lines))
+	outputFile.write(tailData)
+	outputFile.close()
+
+stats.stage("write")
+if len(factors) == 1:
+	writeOutput(factors[0], outputFileNames[0])
+else:
+	# The writes of one output overlap with the formatting of the others.
+	pool = multiprocessing.dummy.Pool(min(len(factors), MAX_WRITE_THREADS))
+	pool.map(lambda job: writeOutput(*job), zip(factors, outputFileNames))
+	pool.close()
+	pool.join()
 
+for outputFileName in outputFileNames:
+	stats.add_output(outputFileName)
 
-while not lexer.atEnd():
-	token = lexer.nextToken();
-	outputFile.write(lexer.lastSeparator())
-	outputFile.write(token)
+if useMeshbin and mesh is None:
+	stats.stage("meshbin")
+	meshbin.MeshBin(MESHBIN_KIND, MESHBIN_VERSION,
+	                {"nverts": nverts, "nfaces": nfaces, "tail": tail}, [],
+	                [("vertices", vertices)]).write(mbinFileName, source)
+	stats.add_output(mbinFileName)
+	stats.end()
+stats.count("vertices", nverts)
+stats.count("faces", nfaces)
+if statsFormat:
+	stats.finish()
+	convstats.emit(stats, statsFormat)
@@ -14,6 +14,7 @@ and surface normals calculated for each triangle.
 """
 
 import sys, string, math
+import mtlindex
 
 def vertex_reference(n, nv):
 	if (n < 0):
@@ -47,7 +48,7 @@ for inputfilename in inputfilenames:
 	uvsForFace=[]
 	textureCounter = 0
 	interpretTexture = 0
-	materials = {}
+	libraries = []
 	max_v = [0.0, 0.0, 0.0]
 	min_v = [0.0, 0.0, 0.0]
 	# find materials from mtllib
@@ -63,22 +64,9 @@ for inputfilename in inputfilenames:
 				path[-1] = tokens[1]
 				materialfilename = string.join(path,'/')
 				print "going to open material library file: %s" % materialfilename
-				infile = open( materialfilename, "r")
-				mlines = infile.read().splitlines(0)
-				newMaterial = 0
-				for mline in mlines:
-					tokens1 = string.split(mline)
-					if (tokens1 != []):
-						if (tokens1[0] == 'newmtl'):
-							newMaterialName = tokens1[1]
-							newMaterial = 1
-						if (tokens1[0] == 'map_Kd'):
-							if (newMaterial):
-								materials[newMaterialName] = tokens1[1]
-								print "Material %s -> %s" % (newMaterialName, tokens1[1])
-							newMaterial = 0
-	#print "materials :"
-	#print materials
+				# parsed once for all the files, later libraries take precedence
+				libraries.insert(0, mtlindex.load_library(materialfilename, use_cache=False))
+	materials = {}
 	# find geometry vertices first
 	for line in lines:
 		tokens = string.split(line)
@@ -135,8 +123,15 @@ for inputfilename in inputfilenames:
 					smoothing_group = 0
 			if (tokens[0] == 'usemtl'):
 				textureName = tokens[1]
-				if (materials.has_key(textureName)):
-					textureName = materials[textureName]
+				# look up only the materials used
+				if (not materials.has_key(textureName)):
+					materials[textureName] = textureName
+					for library in libraries:
+						if (library.diffuse_maps.has_key(textureName)):
+							materials[textureName] = library.diffuse_maps[textureName]
+							print "Material %s -> %s" % (textureName, materials[textureName])
+							break
+				textureName = materials[textureName]
 				interpretTexture = 1
 				texture.append(textureName)
 				uvsForTexture[textureName] = n_verts * [[]]
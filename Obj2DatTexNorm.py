@@ -13,6 +13,9 @@ and exports a .dat file containing the same trimesh.
 
 This version generates files with per-vertex normals, for Oolite 1.74 and later
 only.
+
+It can also be imported: convert_file and convert_files take the options as
+an argument, e.g. convert_file('ship.obj', default_options(pretty_output=True)).
 """
 
 
@@ -21,10 +24,53 @@ import os
 import string
 import argparse
 import math
-import decimal
+import time
+import array
+import multiprocessing
+
+import convstats
+import convcache
+import convwatch
+import meshbin
+import mtlindex
+import numformat
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional: triangles are then checked one at a time.
+    numpy = None
+
+
+# Options changing the output, part of the conversion cache key.
+CACHE_KEY_OPTIONS = ('winding_mode', 'flip_normals', 'include_face_normals',
+                     'rename_materials', 'pretty_output', 'no_texture_split',
+                     'triangulation', 'weld')
+
+# Source files of the code shaping the output, part of the conversion cache
+# key.
+SOURCE_FILE_NAMES = (__file__, numformat.__file__, mtlindex.__file__)
 
+# Polygon triangulation modes: triangle fans, ear clipping, or fans for convex
+# polygons and ear clipping for the others.
+TRIANGULATION_MODES = ('fan', 'earclip', 'auto')
 
-args = None
+# Triangles checked by each NumPy pass of classify_triangles, bounding the size
+# of the temporary arrays.
+TRIANGLES_PER_CHUNK = 16384
+
+# Kind and layout version of the parsed data written in .mbin files. Bump the
+# version when the parsing changes, so older files are ignored.
+MESHBIN_KIND = 'obj2dat'
+MESHBIN_VERSION = 1
+
+# Face corner index of a missing texture coordinate or normal.
+NO_INDEX = -0x80000000
+
+
+class ConversionError(Exception):
+    """Raised when an OBJ file can't be converted."""
+    pass
 
 
 #
@@ -119,10 +165,155 @@ def average_normal(n1, n2, n3):
     return vector_normalize(vector_add(n1, vector_add(n2, n3)))
 
 
+#
+# Triangulation
+#
+def fan_triangles(n):
+    """ fan_triangles
+        Return the corner indices of the triangle fan (0 1 2) (0 2 3) ...
+        (0 n-2 n-1) of an n-gon.
+    """
+    return [(0, k, k + 1) for k in xrange(1, n - 1)]
+
+
+def project_polygon(points):
+    """ project_polygon
+        Project a 3D polygon on the coordinate plane closest to its own plane,
+        found with Newell's method.
+        Return the list of 2D points, and twice the signed area of the 2D
+        polygon.
+    """
+    nx = ny = nz = 0.0
+    for i in xrange(len(points)):
+        x1, y1, z1 = points[i - 1]
+        x2, y2, z2 = points[i]
+        nx += (y1 - y2) * (z1 + z2)
+        ny += (z1 - z2) * (x1 + x2)
+        nz += (x1 - x2) * (y1 + y2)
+    if abs(nx) >= abs(ny) and abs(nx) >= abs(nz):
+        flat = [(y, z) for x, y, z in points]
+    elif abs(ny) >= abs(nz):
+        flat = [(z, x) for x, y, z in points]
+    else:
+        flat = [(x, y) for x, y, z in points]
+    area = 0.0
+    for i in xrange(len(flat)):
+        area += flat[i - 1][0] * flat[i][1] - flat[i][0] * flat[i - 1][1]
+    return flat, area
+
+
+def corner_turn(a, b, c):
+    """ corner_turn
+        Return the z component of (b - a) x (c - b) for 2D points: positive
+        for a counterclockwise turn at b.
+    """
+    return (b[0] - a[0]) * (c[1] - b[1]) - (b[1] - a[1]) * (c[0] - b[0])
+
+
+def is_polygon_convex(flat, area):
+    """ is_polygon_convex
+        Test whether a projected polygon turns the same way at each corner.
+        Straight corners make it fail: fans would give flat triangles next
+        to them, ear clipping doesn't.
+    """
+    tolerance = 1e-9 * abs(area)
+    orientation = 1.0 if area > 0 else -1.0
+    for i in xrange(len(flat)):
+        if corner_turn(flat[i - 2], flat[i - 1], flat[i]) * orientation <= tolerance:
+            return False
+    return True
+
+
+def ear_clip_triangles(flat, area):
+    """ ear_clip_triangles
+        Triangulate a simple polygon, convex or not, by ear clipping. The
+        triangles keep the polygon winding.
+        Return the corner indices of the triangles, or None if no ear can be
+        found, as with self-intersecting polygons.
+    """
+    n = len(flat)
+    tolerance = 1e-12 * abs(area)
+    orientation = 1.0 if area > 0 else -1.0
+    previous = [i - 1 for i in xrange(n)]
+    previous[0] = n - 1
+    following = [i + 1 for i in xrange(n)]
+    following[n - 1] = 0
+    
+    def turn(i):
+        return corner_turn(flat[previous[i]], flat[i], flat[following[i]]) * orientation
+    
+    reflex = set(i for i in xrange(n) if turn(i) <= tolerance)
+    
+    def is_ear(i):
+        if i in reflex:
+            return False
+        a, b, c = flat[previous[i]], flat[i], flat[following[i]]
+        for j in reflex:
+            if j == previous[i] or j == following[i]:
+                continue
+            p = flat[j]
+            # Inside or on the edges of the triangle.
+            if (corner_turn(a, b, p) * orientation >= 0 and corner_turn(b, c, p) * orientation >= 0
+                    and corner_turn(c, a, p) * orientation >= 0):
+                return False
+        return True
+    
+    triangles = []
+    i = 0
+    remaining = n
+    tries = 0
+    while remaining > 3:
+        if is_ear(i):
+            triangles.append((previous[i], i, following[i]))
+            before, after = previous[i], following[i]
+            following[before] = after
+            previous[after] = before
+            remaining -= 1
+            tries = 0
+            for j in (before, after):
+                if j in reflex and turn(j) > tolerance:
+                    reflex.discard(j)
+            i = after
+        else:
+            i = following[i]
+            tries += 1
+            if tries > remaining:
+                return None
+    triangles.append((previous[i], i, following[i]))
+    return triangles
+
+
+def triangulate(points, mode):
+    """ triangulate
+        Split a polygon into triangles.
+        points are the polygon corner positions, and mode one of
+        TRIANGULATION_MODES. Concave polygons which can't be ear clipped are
+        split as fans.
+        Return a list of (a, b, c) corner indices.
+    """
+    n = len(points)
+    if n == 3 or mode == 'fan':
+        return fan_triangles(n)
+    flat, area = project_polygon(points)
+    if area == 0 or (mode == 'auto' and is_polygon_convex(flat, area)):
+        return fan_triangles(n)
+    return ear_clip_triangles(flat, area) or fan_triangles(n)
+
+
 
 #
 # Output formatting
 #
+def clean_vectors(vectors):
+    """ clean_vectors
+        Iterate over the vectors cleaned by clean_vector, giving back the
+        vector itself when it is clean already.
+    """
+    for v in vectors:
+        c = clean_vector(v)
+        yield v if c == v else c
+
+
 def clean_vector(v):
     """ clean_vector
         "Cleans" a vector by converting any negative zeros or values that will
@@ -139,57 +330,57 @@ def clean_vector(v):
     return clean_number(x), clean_number(y), clean_number(z)
 
 
-def format_number(n):
-    """ format_number
-        Format a float with up to five decimal places, making it as short as
-        possible without discarding information.
-        
-        Based on accepted answer by samplebias at
-        http://stackoverflow.com/questions/5807952/removing-trailing-zeros-in-python
-    """
-    try:
-        dec = decimal.Decimal('%.5f' % n)
-    except:
-        return 'bad'
-    tup = dec.as_tuple()
-    delta = len(tup.digits) + tup.exponent
-    digits = ''.join(str(d) for d in tup.digits)
-    if delta <= 0:
-        zeros = abs(tup.exponent) - len(tup.digits)
-        val = '0.' + ('0' * zeros) + digits
+def format_vector(v, options):
+    if options.pretty_output:
+        return '% .5f,% .5f,% .5f' % v
     else:
-        val = digits[:delta] + ('0' * tup.exponent) + '.' + digits[delta:]
-    val = val.rstrip('0')
-    if val[-1] == '.':
-        val = val[:-1]
-    
-    if tup.sign:
-        return '-' + val
+        return ' '.join(map(numformat.format_number, v))
+
+
+def format_normal(n, options):
+    if options.flip_normals:
+        return format_vector(vector_flip(n), options)
     else:
-        return val
+        return format_vector(n, options)
 
 
-def format_vector(v):
-    if args.pretty_output:
-        return '% .5f,% .5f,% .5f' % v
+def format_vectors(vectors, options):
+    """ format_vectors
+        Format a sequence of vectors like format_vector, all at once.
+        Returns a list of lines.
+    """
+    if options.pretty_output:
+        return ['% .5f,% .5f,% .5f\n' % v for v in vectors]
     else:
-        x, y, z = v
-        return '%s %s %s' % (format_number(x), format_number(y), format_number(z))
+        flat = array.array('d')
+        for v in vectors:
+            flat.extend(v)
+        return [row + '\n' for row in numformat.format_rows(flat, 3)]
 
 
-def format_normal(n):
-    if args.flip_normals:
-        return format_vector(vector_flip(n))
+def format_normals(normals, options):
+    """ format_normals
+        Format a sequence of normals like format_normal, all at once.
+        Returns a list of lines.
+    """
+    if options.flip_normals:
+        return format_vectors((vector_flip(n) for n in normals), options)
     else:
-        return format_vector(n)
+        return format_vectors(normals, options)
 
 
-def format_textcoord(st):
-    if args.pretty_output:
-        return '% .5f,% .5f' % st
+def format_textcoords(coordinates, options):
+    """ format_textcoords
+        Format a sequence of texture coordinate pairs, all at once.
+        Returns a list of strings.
+    """
+    if options.pretty_output:
+        return ['% .5f,% .5f' % st for st in coordinates]
     else:
-        s, t = st
-        return '%s %s' % (format_number(s), format_number(t))
+        flat = array.array('d')
+        for st in coordinates:
+            flat.extend(st)
+        return numformat.format_rows(flat, 2)
 
 
 #
@@ -240,9 +431,9 @@ Available modes:
 argParser = argparse.ArgumentParser(description='''Convert OBJ meshes to Oolite DAT format.
                                                    This tool preserves normals (face directions for lighting purposes)
                                                    stored in the OBJ file, rather than making Oolite recalculate them.''')
-argParser.add_argument('files', nargs='+',
+argParser.add_argument('files', nargs='*',
                   help='the files to convert')
-argParser.add_argument('-w', '--winding-mode', type=int, default=2, metavar='MODE', dest='winding_mode',
+argParser.add_argument('-w', '--winding-mode', type=int, default=2, choices=range(4), metavar='MODE', dest='winding_mode',
                   help='''Specify winding mode (default: %(default)s). Winding determines which side of a triangle is out.
                           Run %(prog)s --list-winding-modes for more information.''')
 argParser.add_argument('-f', '--flip-normals', action='store_true', dest='flip_normals',
@@ -253,17 +444,195 @@ argParser.add_argument('-m', '--preserve-material-names', action='store_false',
                        help='Keep abstract material names from material library, instead of renaming materials after their diffuse map. Only use if you\'ll be creating material dictionaries.')
 argParser.add_argument('-p', '--pretty-output', action='store_true', dest='pretty_output',
                        help='Create a file that\'s easier for humans to read, but larger and slower to parse')
+argParser.add_argument('--triangulation', choices=TRIANGULATION_MODES, default='auto',
+                       help='How to split polygons with more than three corners into triangles: fan (fastest, for convex polygons only), earclip (ear clipping, for any simple polygon) or auto (fan for convex polygons, ear clipping for the others) (default: %(default)s)')
 argParser.add_argument('--no-texture-split', action='store_true', help='Don\'t split vertices if texture coordinates differ (matches behaviour pre-github issue 184)')
+argParser.add_argument('--no-weld', action='store_false', dest='weld',
+                       help='Don\'t merge vertices referenced with different OBJ indices but having the same position, normal and texture coordinates; faster on very large meshes, but the output may have more vertices')
+
+argParser.add_argument('--no-numpy', action='store_false', dest='use_numpy',
+                       help='Don\'t use NumPy to check the triangles, even if it is installed')
+argParser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                       help='Convert the files on a pool of N processes; 0 uses one process per CPU (default: %(default)s, the files are converted one after the other)')
+argParser.add_argument('-q', '--quiet', action='store_true',
+                       help='Don\'t print progress messages; warnings are still printed')
+argParser.add_argument('--stats', choices=convstats.STATS_FORMATS, metavar='FORMAT',
+                       help='Print per-file conversion statistics (stage timings, counts and sizes); FORMAT is one of %(choices)s; progress messages and warnings then go to the standard error')
+argParser.add_argument('--no-cache', action='store_false', dest='cache',
+                       help='Always convert, don\'t use the conversion cache')
+argParser.add_argument('--cache-dir', metavar='DIR',
+                       help='Conversion cache directory (default: $OOLITE_CONVERTERS_CACHE or ~/.cache/oolite-mesh-converters)')
+argParser.add_argument('--cache-size', type=int, default=convcache.DEFAULT_CACHE_SIZE, metavar='MB',
+                       help='Conversion cache size limit in MiB; least recently used entries are removed above it (default: %(default)s)')
+argParser.add_argument('--watch', metavar='DIR',
+                       help='After converting the given files, watch the DIR tree and convert OBJ files again when they or their material libraries change; Ctrl+C stops watching')
+argParser.add_argument('--meshbin', action='store_true',
+                       help='Write the parsed OBJ content to a .obj2dat.mbin binary file alongside the DAT file, and read it back instead of parsing the OBJ file again as long as it doesn\'t change')
 
 argParser.add_argument('-L', '--list-winding-modes', action=_ListWindingModesAction,
                        help=argparse.SUPPRESS)
 
-args = argParser.parse_args()
+
+
+def default_options(**overrides):
+    """ default_options
+        Return the options of a command line giving none, as an
+        argparse.Namespace, with some of them overridden; the names are the
+        attributes of the parsed command line, e.g.
+        default_options(winding_mode=0, pretty_output=True).
+        Raises TypeError for an unknown option.
+    """
+    options = argParser.parse_args([])
+    for name, value in overrides.items():
+        if not hasattr(options, name):
+            raise TypeError('Unknown option %s' % name)
+        setattr(options, name, value)
+    return options
 
 
 #
 # Processing helpers
 #
+def log(message, options):
+    """ log
+        Print a progress message, unless the quiet option is set; on the
+        standard error with the stats option, so the standard output only
+        holds the statistics.
+    """
+    if not options.quiet:
+        print >> message_stream(options), message
+
+
+def warn(message, options):
+    """ warn
+        Print a warning, on the standard error with the stats option.
+    """
+    print >> message_stream(options), message
+
+
+def message_stream(options):
+    """ message_stream
+        Return the file the progress messages, warnings and summary are
+        printed to: the standard error with the stats option, the standard
+        output otherwise.
+    """
+    return sys.stderr if options.stats else sys.stdout
+
+
+def material_library_file_names(input_file_name, lines):
+    """ material_library_file_names
+        Return the paths of the material libraries referenced by the mtllib
+        lines of an OBJ file.
+    """
+    path = os.path.dirname(input_file_name)
+    file_names = []
+    for line in lines:
+        if 'mtllib' not in line:
+            continue
+        tokens = string.split(line)
+        if len(tokens) > 1 and tokens[0] == 'mtllib':
+            file_names.append(os.path.join(path, tokens[1]))
+    return file_names
+
+
+def read_material_library(material_file_name, options):
+    """ read_material_library
+        Return the ('newmtl' or 'map_Kd', name) pairs of a material library,
+        in file order. Libraries are parsed once per run, and kept in the
+        cache directory unless the cache is off.
+    """
+    return mtlindex.load_library(material_file_name, options.cache_dir, options.cache).entries
+
+
+class ObjGeometry(object):
+    """ ObjGeometry
+        The content of an OBJ file as found by the parsing pass, kept in
+        compact arrays: material libraries, raw vertex, normal and texture
+        coordinates, and a list of operations. Operations are material
+        selections (-1 - index in material_names) or faces (number of
+        corners, their (v, vt, vn) indices being in corners).
+        Written to .mbin files, and read back instead of parsing the text
+        again.
+    """
+    
+    def __init__(self, mesh=None):
+        self.loaded = mesh is not None
+        if mesh is None:
+            self.material_libraries = []
+            self.material_names = []
+            self.vertices = array.array('d')
+            self.normals = array.array('d')
+            self.uvs = array.array('d')
+            self.operations = array.array('i')
+            self.corners = array.array('i')
+        else:
+            n_libraries = mesh.meta['material_libraries']
+            self.material_libraries = mesh.names[:n_libraries]
+            self.material_names = mesh.names[n_libraries:]
+            self.vertices = mesh['vertices']
+            self.normals = mesh['normals']
+            self.uvs = mesh['uvs']
+            self.operations = mesh['operations']
+            self.corners = mesh['corners']
+    
+    def to_meshbin(self):
+        """ to_meshbin
+            Return the parsed content as a meshbin.MeshBin object.
+        """
+        return meshbin.MeshBin(MESHBIN_KIND, MESHBIN_VERSION,
+                               {'material_libraries': len(self.material_libraries)},
+                               self.material_libraries + self.material_names,
+                               [('vertices', self.vertices), ('normals', self.normals),
+                                ('uvs', self.uvs), ('operations', self.operations),
+                                ('corners', self.corners)])
+    
+    def read(self, lines, material_library_found=None):
+        """ read
+            Read the mtllib, v, vn, vt, usemtl and f lines in one pass.
+            material_library_found is called with each mtllib file name when
+            it is first referenced. Faces with less than three corners are
+            ignored.
+        """
+        material_libraries = self.material_libraries
+        material_names = self.material_names
+        vertices_extend = self.vertices.extend
+        normals_extend = self.normals.extend
+        uvs_extend = self.uvs.extend
+        operations_append = self.operations.append
+        corners_append = self.corners.append
+        material_index = {}
+        for line in lines:
+            tokens = line.split()
+            if tokens == []:
+                continue
+            keyword = tokens[0]
+            if keyword == 'v':
+                vertices_extend((float(tokens[1]), float(tokens[2]), float(tokens[3])))
+            elif keyword == 'f':
+                if len(tokens) >= 4:
+                    operations_append(len(tokens) - 1)
+                    for token in tokens[1:]:
+                        bits = token.split('/')
+                        corners_append(int(bits[0]))
+                        corners_append(int(bits[1]) if len(bits) > 1 and bits[1] > '' else NO_INDEX)
+                        corners_append(int(bits[2]) if len(bits) > 2 and bits[2] > '' else NO_INDEX)
+            elif keyword == 'vn':
+                normals_extend((float(tokens[1]), float(tokens[2]), float(tokens[3])))
+            elif keyword == 'vt':
+                uvs_extend((float(tokens[1]), float(tokens[2])))
+            elif keyword == 'usemtl':
+                name = tokens[1]
+                if name not in material_index:
+                    material_index[name] = len(material_names)
+                    material_names.append(name)
+                operations_append(-1 - material_index[name])
+            elif keyword == 'mtllib':
+                name = tokens[1]
+                if material_library_found is not None and name not in material_libraries:
+                    material_library_found(name)
+                material_libraries.append(name)
+
+
 def vertex_reference(n, nv):
     if n < 0:
         return n + nv
@@ -271,45 +640,43 @@ def vertex_reference(n, nv):
         return n - 1
 
 
-resolved_vertex_count = 0
-def resolve_vertex(v, vn, tc, index_for_vert_norm_and_tex, vertex_lines_out, normals_lines_out):
-    """ resolve_vertex
-        Returns a unique index for each (vertex, normal) pair. When a new pair
-        is seen, a new index is generated and the relevant lines are added to
-        the output buffers for the VERTEX and NORMALS sections.
-        
-        This is necessary because OBJ uses separate index spaces for vertex
-        positions and normals, but DAT requires one index per pair.
-    """
-    global resolved_vertex_count
-    v = clean_vector(v)
-    vn = clean_vector(vn)
-    key = v, vn, tc
-    if key in index_for_vert_norm_and_tex:
-        return index_for_vert_norm_and_tex[key]
-    else:
-        result = resolved_vertex_count
-        resolved_vertex_count = resolved_vertex_count + 1
+def value_ids(values):
+    """ value_ids
+        Number the distinct values of a sequence, in order of first occurrence.
         
-        index_for_vert_norm_and_tex[key] = result
+        OBJ uses separate index spaces for vertex positions, texture
+        coordinates and normals, but DAT requires one index per combination.
+        Corners are resolved on the numbers of their position, texture
+        coordinates and normal values, so that equal values given twice in the
+        OBJ file still make one vertex.
         
-        vertex_lines_out.append(format_vector(v) + '\n')
-        if not is_vector_normalized(vn):
-            print 'Bug: writing unnormalized normal %s' % format_normal(vn)
-        normals_lines_out.append(format_normal(vn) + '\n')
-        
-        return result
+        Returns an array of the number of each value, and the count of
+        distinct values.
+    """
+    ids = {}
+    numbers = array.array('l', [ids.setdefault(value, len(ids)) for value in values])
+    return numbers, len(ids)
 
 
-def should_reverse_winding(v1, v2, v3, normal):
+def check_indices(indices, count, kind, file_name):
+    """ check_indices
+        Raise ConversionError unless all the zero-based indices are in
+        range(count).
+    """
+    if len(indices) and (min(indices) < 0 or max(indices) >= count):
+        raise ConversionError('%s: %s index out of range' % (file_name, kind))
+
+
+def should_reverse_winding(v1, v2, v3, normal, winding_mode):
     """ should_reverse_winding
         Determine whether to reverse the winding of the triangle (v1, v2, v3)
-        based on current winding mode and face normal.
+        based on the winding mode and face normal.
+        Raises ValueError for an unknown winding mode.
     """
-    if args.winding_mode == 0:
+    if winding_mode == 0:
         return False
     
-    elif args.winding_mode == 1:
+    elif winding_mode == 1:
         return True
     
     else:
@@ -317,7 +684,7 @@ def should_reverse_winding(v1, v2, v3, normal):
         if normal == (0, 0, 0):
             normal = vector_flip(calculatedNormal)
         
-        if args.winding_mode == 2:
+        if winding_mode == 2:
             # Guess, using the assumptions that normals should point more "outwards"
             # than "inwards".
             if (vector_dot_product(normal, calculatedNormal) < 0.0):
@@ -325,21 +692,147 @@ def should_reverse_winding(v1, v2, v3, normal):
             else:
                 return False
         
-        elif args.winding_mode == 3:
+        elif winding_mode == 3:
             # Buggy calculation traditionally used by Oolite.
             if (normal[0] * calculatedNormal[0] < 0.0) or (normal[1] * calculatedNormal[1] < 0.0) or (normal[2] * calculatedNormal[2] < 0.0):
                 return True
             else:
                 return False
     
-    print 'Unknown normal winding mode %u' % (args.winding_mode)
-    exit(-1)
+    raise ValueError('Unknown normal winding mode %u' % (winding_mode))
+
+
+def classify_triangles(vertex, normal, triangle_vertices, triangle_normals, options):
+    """ classify_triangles
+        Find the triangles which are not degenerate, their face normals and
+        whether to reverse their winding, for all the triangles at once.
+        triangle_vertices and triangle_normals are arrays of three position
+        indices and three normal indices per triangle.
+        Returns the list of the indices of the triangles kept, the list of
+        their face normals (None unless face normals are written) and the list
+        of the winding reversals.
+    """
+    kept = []
+    face_normals = []
+    reverse = []
+    if options.use_numpy and numpy is not None and len(triangle_vertices):
+        positions = numpy.array(vertex, numpy.float64).reshape(-1, 3)
+        normals = numpy.array(normal, numpy.float64).reshape(-1, 3)
+        for start in xrange(0, len(triangle_vertices), 3 * TRIANGLES_PER_CHUNK):
+            end = start + 3 * TRIANGLES_PER_CHUNK
+            chunk_kept, chunk_face_normals, chunk_reverse = classify_triangles_numpy(
+                positions, normals, triangle_vertices[start:end], triangle_normals[start:end], options)
+            kept.extend((chunk_kept + start // 3).tolist())
+            if chunk_face_normals is not None:
+                face_normals.extend(chunk_face_normals)
+            reverse.extend(chunk_reverse.tolist())
+        if not options.include_face_normals:
+            face_normals = None
+        return kept, face_normals, reverse
+    
+    for t in xrange(len(triangle_vertices) // 3):
+        v1 = vertex[triangle_vertices[3 * t]]
+        v2 = vertex[triangle_vertices[3 * t + 1]]
+        v3 = vertex[triangle_vertices[3 * t + 2]]
+        d0 = (v2[0] - v1[0], v2[1] - v1[1], v2[2] - v1[2])
+        d1 = (v3[0] - v2[0], v3[1] - v2[1], v3[2] - v2[2])
+        xp = (d0[1] * d1[2] - d0[2] * d1[1], d0[2] * d1[0] - d0[0] * d1[2], d0[0] * d1[1] - d0[1] * d1[0])
+        det = math.sqrt(xp[0]*xp[0] + xp[1]*xp[1] + xp[2]*xp[2])
+        if (det > 0):
+            face_normal = average_normal(normal[triangle_normals[3 * t]],
+                                         normal[triangle_normals[3 * t + 1]],
+                                         normal[triangle_normals[3 * t + 2]])
+            kept.append(t)
+            face_normals.append(face_normal)
+            reverse.append(should_reverse_winding(v1, v2, v3, face_normal, options.winding_mode))
+    if not options.include_face_normals:
+        face_normals = None
+    return kept, face_normals, reverse
+
+
+def normalize_rows(vectors):
+    """ normalize_rows
+        Normalize each row of an n x 3 NumPy array like vector_normalize,
+        with the same rounding.
+    """
+    x, y, z = vectors[:, 0], vectors[:, 1], vectors[:, 2]
+    magnitudes = numpy.sqrt(x * x + y * y + z * z)
+    if (magnitudes == 0.0).any():
+        raise ZeroDivisionError('float division by zero')
+    return vectors * (1.0 / magnitudes)[:, numpy.newaxis]
+
+
+def cross_rows(a, b):
+    """ cross_rows
+        Cross products of the rows of two n x 3 NumPy arrays, computed like
+        vector_cross_product.
+    """
+    return numpy.column_stack((a[:, 1] * b[:, 2] - b[:, 1] * a[:, 2],
+                               a[:, 2] * b[:, 0] - b[:, 2] * a[:, 0],
+                               a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1]))
+
+
+def classify_triangles_numpy(positions, normals, triangle_vertices, triangle_normals, options):
+    """ classify_triangles_numpy
+        classify_triangles with NumPy array operations over a chunk of
+        triangles. positions and normals are n x 3 NumPy arrays. Each operation
+        rounds like the scalar code, so the decisions are the same.
+        Returns the NumPy arrays of the indices of the triangles kept and of
+        their winding reversals, and the list of their face normals (None
+        unless face normals are written).
+    """
+    corners = positions[numpy.frombuffer(triangle_vertices, 'l').reshape(-1, 3)]
+    v1, v2, v3 = corners[:, 0], corners[:, 1], corners[:, 2]
+    with numpy.errstate(over='ignore', invalid='ignore'):
+        # Not degenerate if the magnitude of (v2 - v1) x (v3 - v2) is positive.
+        xp = cross_rows(v2 - v1, v3 - v2)
+        kept = numpy.flatnonzero(xp[:, 0] * xp[:, 0] + xp[:, 1] * xp[:, 1] + xp[:, 2] * xp[:, 2] > 0)
+        v1, v2, v3 = v1[kept], v2[kept], v3[kept]
+        
+        corner_normals = normals[numpy.frombuffer(triangle_normals, 'l').reshape(-1, 3)[kept]]
+        face_normals = normalize_rows(corner_normals[:, 0] + (corner_normals[:, 1] + corner_normals[:, 2]))
+        
+        if options.winding_mode == 0:
+            reverse = numpy.zeros(len(kept), bool)
+        elif options.winding_mode == 1:
+            reverse = numpy.ones(len(kept), bool)
+        elif options.winding_mode in (2, 3):
+            calculated_normals = normalize_rows(cross_rows(v2 - v3, v1 - v2))
+            directions = face_normals.copy()
+            unknown = (directions == 0.0).all(axis=1)
+            directions[unknown] = 0 - calculated_normals[unknown]
+            products = directions * calculated_normals
+            if options.winding_mode == 2:
+                reverse = products[:, 0] + products[:, 1] + products[:, 2] < 0.0
+            else:
+                reverse = (products < 0.0).any(axis=1)
+        elif len(kept):
+            raise ValueError('Unknown normal winding mode %u' % (options.winding_mode))
+        else:
+            reverse = numpy.zeros(0, bool)
+    
+    if options.include_face_normals:
+        face_normals = [tuple(n) for n in face_normals.tolist()]
+    else:
+        face_normals = None
+    return kept, face_normals, reverse
 
 
 #
 # Grand processing loop
 #
-for input_file_name in args.files:
+def convert_file(input_file_name, options=None, stats=None):
+    """ convert_file
+        Convert an OBJ file to a DAT file written alongside it.
+        options are as returned by default_options, which gives them when
+        None. stats is the convstats.FileStats recording the conversion, if
+        any.
+    """
+    if options is None:
+        options = default_options()
+    if stats is None:
+        stats = convstats.NULL_STATS
+    
     # Select output name and open files
     output_file_name = input_file_name.lower().replace('.obj', '.dat')
     if output_file_name == input_file_name:
@@ -347,16 +840,42 @@ for input_file_name in args.files:
     input_display_name = os.path.basename(input_file_name)
     output_display_name = os.path.basename(output_file_name)
     
-    print input_display_name + ' -> ' + output_display_name
+    log(input_display_name + ' -> ' + output_display_name, options)
     
-    input_file = open(input_file_name, 'r')
-    lines = input_file.read().splitlines(0)
-    output_file = open(output_file_name, 'w')
+    stats.stage('read')
+    mbin_file_name = meshbin.file_name(input_file_name, MESHBIN_KIND)
+    mesh = None
+    if options.meshbin:
+        source = meshbin.source_info(input_file_name)
+        mesh = meshbin.load(mbin_file_name, MESHBIN_KIND, MESHBIN_VERSION, source)
+    geometry = ObjGeometry(mesh)
+    path = os.path.dirname(input_file_name)
+    if geometry.loaded:
+        log('  Parsed OBJ content read from %s' % os.path.basename(mbin_file_name), options)
+        material_file_names = [os.path.join(path, name) for name in geometry.material_libraries]
+    elif options.cache:
+        # Quick scan of the mtllib lines for the cache key: the file is only
+        # parsed on a cache miss.
+        material_file_names = obj_dependencies(input_file_name)
+    
+    cache = None
+    write_file_name = output_file_name
+    if options.cache:
+        stats.stage('cache')
+        cache = convcache.ConversionCache(options.cache_dir, options.cache_size)
+        cache_options = dict((name, getattr(options, name)) for name in CACHE_KEY_OPTIONS)
+        cache_key = cache.key(os.path.basename(__file__), None, input_file_name,
+                              material_file_names, cache_options, SOURCE_FILE_NAMES)
+        hit = cache.restore(cache_key, [output_file_name])
+        stats.count('cache_hit', int(hit))
+        if hit:
+            log('  Restored from cache', options)
+            stats.add_output(output_file_name)
+            return
+        # The output file is left untouched if its content doesn't change.
+        write_file_name = convcache.partial_name(output_file_name)
     
     ### Set up state used in parsing and generating output
-    vertex_lines_out = ['VERTEX\n']
-    faces_lines_out = ['FACES\n']
-    normals_lines_out = ['NORMALS\n']
     vertex_count = 0
     face_count = 0
     normal_count = 0
@@ -364,220 +883,420 @@ for input_file_name in args.files:
     vertex=[]
     uv=[]
     normal=[]
-    face=[]
+    face = array.array('l')
     texture=[]
     texture_for_face=[]
-    texcoords_for_face=[]
+    texcoords_for_face = array.array('l')
     interpret_texture = 0
     material_rename = {}
-    index_for_vert_norm_and_tex = {}
+    resolved_index = {}
+    resolved_corners = array.array('l')
     names_lines_out = []
     materials_used = []
     max_v = [0.0, 0.0, 0.0]
     min_v = [0.0, 0.0, 0.0]
     
+    ### Parse the OBJ file, reading material libraries when first referenced
+    material_libraries = {}
+    if not geometry.loaded:
+        stats.stage('parse')
+        def material_library_found(name):
+            material_file_name = os.path.join(path, name)
+            material_libraries[material_file_name] = read_material_library(material_file_name, options)
+        
+        input_file = open(input_file_name, 'rU')
+        try:
+            geometry.read(input_file, material_library_found)
+        finally:
+            input_file.close()
+    material_file_names = [os.path.join(path, name) for name in geometry.material_libraries]
+    
     ### Find materials from material library
-    for line in lines:
-        tokens = string.split(line)
-        if tokens != []:
-            if tokens[0] == 'mtllib':
-                path = os.path.dirname(input_file_name)
-                material_file_name = os.path.join(path, tokens[1])
-                print '  Material library file: %s' % material_file_name
-                material_file = open(material_file_name, 'r')
+    stats.stage('materials')
+    for material_file_name in material_file_names:
+        log('  Material library file: %s' % material_file_name, options)
+        if material_file_name not in material_libraries:
+            material_libraries[material_file_name] = read_material_library(material_file_name, options)
+        new_material = False
+        for material_keyword, material_argument in material_libraries[material_file_name]:
+            if material_keyword == 'newmtl':
+                new_material_name = material_argument
+                if options.rename_materials:
+                    # Let map_Kd handler deal with material table.
+                    # FIXME: produce cleaner results if there is no diffuse map.
+                    new_material = True
+                else:
+                    # Store material key in used material list and (if using short names) the rename table.
+                    materials_used.append(new_material_name)
+                    if not options.pretty_output:
+                        material_rename[new_material_name] = len(material_rename)
+                        names_lines_out.append(new_material_name + '\n')
+            
+            if material_keyword == 'map_Kd':
+                # If this is the first diffuse map for this material...
+                if new_material:
+                    # Add it to the used materials list and rename table.
+                    name = material_argument
+                    materials_used.append(name)
+                    log('  Material %s -> %s' % (new_material_name, name), options)
+                    if options.pretty_output:
+                        material_rename[new_material_name] = name
+                    else:
+                        material_rename[new_material_name] = len(material_rename)
+                        names_lines_out.append(name + '\n')
                 new_material = False
-                for material_line in material_file.read().splitlines(0):
-                    material_tokens = string.split(material_line)
-                    if material_tokens != []:
-                        if material_tokens[0] == 'newmtl':
-                            new_material_name = material_tokens[1]
-                            if args.rename_materials:
-                                # Let map_Kd handler deal with material table.
-                                # FIXME: produce cleaner results if there is no diffuse map.
-                                new_material = True
-                            else:
-                                # Store material key in used material list and (if using short names) the rename table.
-                                materials_used.append(new_material_name)
-                                if not args.pretty_output:
-                                    material_rename[new_material_name] = len(material_rename)
-                                    names_lines_out.append(new_material_name + '\n')
-                        
-                        if material_tokens[0] == 'map_Kd':
-                            # If this is the first diffuse map for this material...
-                            if new_material:
-                                # Add it to the used materials list and rename table.
-                                name = material_tokens[1]
-                                materials_used.append(name)
-                                print '  Material %s -> %s' % (new_material_name, name)
-                                if args.pretty_output:
-                                    material_rename[new_material_name] = name
-                                else:
-                                    material_rename[new_material_name] = len(material_rename)
-                                    names_lines_out.append(name + '\n')
-                            new_material = False
-                material_file.close()
-    
-    ### Parse vertices
-    for line in lines:
-        tokens = string.split(line)
-        if tokens != []:
-            if tokens[0] == 'v':
-                vertex_count = vertex_count + 1
-                # Negate x value for vertex to compensate for different coordinate conventions.
-                x = -float(tokens[1])
-                y = float(tokens[2])
-                z = float(tokens[3])
-                vertex.append((x, y, z))
-                if x > max_v[0]: max_v[0] = x
-                if y > max_v[1]: max_v[1] = y
-                if z > max_v[2]: max_v[2] = z
-                if x < min_v[0]: min_v[0] = x
-                if y < min_v[1]: min_v[1] = y
-                if z < min_v[2]: min_v[2] = z
-                    
-            if tokens[0] == 'vn':
-                normal_count = normal_count + 1
-                x = -float(tokens[1])
-                y = float(tokens[2])
-                z = float(tokens[3])
-                n = (x, y, z)
-                if not is_vector_normalized(n):
-                    print 'Warning: read unnormalized normal %s' % format_vector(n)
-                normal.append(vector_normalize((x, y, z)))
-                
-            if tokens[0] == 'vt':
-                uv.append((float(tokens[1]), 1.0 - float(tokens[2])))
     
-    ### Parse faces
-    group_token = 0
-    for line in lines:
-        tokens = string.split(line)
-        if (tokens != []):
-            if (tokens[0] == 'usemtl'):
-                textureName = tokens[1]
-                if (material_rename.has_key(textureName)):
-                    textureName = material_rename[textureName]
-                interpret_texture = 1
-                texture.append(textureName)
+    ### Process vertices
+    stats.stage('process_vertices')
+    coordinates = geometry.vertices
+    for i in xrange(0, len(coordinates), 3):
+        vertex_count = vertex_count + 1
+        # Negate x value for vertex to compensate for different coordinate conventions.
+        x = -coordinates[i]
+        y = coordinates[i + 1]
+        z = coordinates[i + 2]
+        vertex.append((x, y, z))
+        if x > max_v[0]: max_v[0] = x
+        if y > max_v[1]: max_v[1] = y
+        if z > max_v[2]: max_v[2] = z
+        if x < min_v[0]: min_v[0] = x
+        if y < min_v[1]: min_v[1] = y
+        if z < min_v[2]: min_v[2] = z
+    
+    coordinates = geometry.normals
+    for i in xrange(0, len(coordinates), 3):
+        normal_count = normal_count + 1
+        x = -coordinates[i]
+        y = coordinates[i + 1]
+        z = coordinates[i + 2]
+        n = (x, y, z)
+        if not is_vector_normalized(n):
+            warn('Warning: read unnormalized normal %s' % format_vector(n, options), options)
+        normal.append(vector_normalize((x, y, z)))
+    
+    coordinates = geometry.uvs
+    for i in xrange(0, len(coordinates), 2):
+        uv.append((coordinates[i], 1.0 - coordinates[i + 1]))
+    
+    ### Process faces
+    stats.stage('process_faces')
+    uv_count = len(uv)
+    uv_slots = uv_count + 1
+    
+    if options.weld:
+        # Merge the corners with equal values.
+        position_ids = value_ids(clean_vectors(vertex))[0]
+        uv_ids, uv_slots = value_ids(uv)
+        uv_ids.append(uv_slots)
+        uv_slots += 1
+        normal_ids, normal_slots = value_ids(clean_vectors(normal))
+    else:
+        position_ids = xrange(vertex_count)
+        uv_ids = xrange(uv_slots)
+        normal_ids = xrange(normal_count)
+        normal_slots = normal_count
+    
+    def resolve_corner(v, vt, vn):
+        # Index of the output vertex of the (position, texture coordinates,
+        # normal) ids, packed into one integer key. vt is uv_count when
+        # texture coordinates don't split vertices.
+        key = (position_ids[v] * uv_slots + uv_ids[vt]) * normal_slots + normal_ids[vn]
+        index = resolved_index.get(key)
+        if index is None:
+            index = resolved_index[key] = len(resolved_corners) // 3
+            resolved_corners.extend((v, vt, vn))
+        return index
+    
+    # Position, texture coordinates and normal indices of the triangles,
+    # three per triangle, and their material (None if not textured).
+    triangle_vertices = array.array('l')
+    triangle_texcoords = array.array('l')
+    triangle_normals = array.array('l')
+    triangle_textures = []
+    vt1 = vt2 = vt3 = vn1 = vn2 = vn3 = NO_INDEX
+    
+    corners = geometry.corners
+    # OBJ indices count from 1, or back from -1 for the last element.
+    position_indices = corners[0::3]
+    if len(position_indices) and (min(position_indices) < -vertex_count or max(position_indices) > vertex_count
+                                  or 0 in position_indices):
+        raise ConversionError('%s: vertex index out of range' % input_display_name)
+    del position_indices
+    first_corner = 0
+    for operation in geometry.operations:
+        if operation < 0:
+            textureName = geometry.material_names[-1 - operation]
+            if (material_rename.has_key(textureName)):
+                textureName = material_rename[textureName]
+            interpret_texture = 1
+            texture.append(textureName)
+        
+        else:
+            if operation == 3 or options.triangulation == 'fan':
+                triangles = fan_triangles(operation)
+            else:
+                triangles = triangulate([vertex[vertex_reference(corners[3 * corner], vertex_count)]
+                                         for corner in xrange(first_corner, first_corner + operation)],
+                                        options.triangulation)
+            for c1, c2, c3 in triangles:
+                bits = corners[3 * (first_corner + c1):3 * (first_corner + c1) + 3]
+                v1 = vertex_reference(bits[0], vertex_count)
+                if (bits[1] != NO_INDEX): vt1 = vertex_reference(bits[1], uv_count)
+                if (bits[2] != NO_INDEX): vn1 = vertex_reference(bits[2], normal_count)
+                
+                bits = corners[3 * (first_corner + c2):3 * (first_corner + c2) + 3]
+                v2 = vertex_reference(bits[0], vertex_count)
+                if (bits[1] != NO_INDEX): vt2 = vertex_reference(bits[1], uv_count)
+                if (bits[2] != NO_INDEX): vn2 = vertex_reference(bits[2], normal_count)
+                
+                bits = corners[3 * (first_corner + c3):3 * (first_corner + c3) + 3]
+                v3 = vertex_reference(bits[0], vertex_count)
+                if (bits[1] != NO_INDEX):
+                    vt3 = vertex_reference(bits[1], uv_count)
+                else:
+                    if interpret_texture:
+                        warn('File does not provide texture coordinates! Materials will not be exported.', options)
+                    interpret_texture = 0
+                if (bits[2] != NO_INDEX): vn3 = vertex_reference(bits[2], normal_count)
+                
+                if interpret_texture and not (0 <= vt1 < uv_count and 0 <= vt2 < uv_count and 0 <= vt3 < uv_count):
+                    raise ConversionError('%s: texture coordinate index out of range' % input_display_name)
+                triangle_vertices.extend((v1, v2, v3))
+                triangle_texcoords.extend((vt1, vt2, vt3))
+                triangle_normals.extend((vn1, vn2, vn3))
+                triangle_textures.append(textureName if interpret_texture else None)
             
-            if (tokens[0] == 'f'):
-                while (len(tokens) >=4):
-                    bits = string.split(tokens[1], '/')
-                    v1 = vertex_reference(int(bits[0]), vertex_count)
-                    if (bits[1] > ''): vt1 = vertex_reference(int(bits[1]), vertex_count)
-                    if (bits[2] > ''): vn1 = vertex_reference(int(bits[2]), normal_count)
-                    
-                    bits = string.split(tokens[2], '/')
-                    v2 = vertex_reference(int(bits[0]), vertex_count)
-                    if (bits[1] > ''): vt2 = vertex_reference(int(bits[1]), vertex_count)
-                    if (bits[2] > ''): vn2 = vertex_reference(int(bits[2]), normal_count)
-                    
-                    bits = string.split(tokens[3], '/')
-                    v3 = vertex_reference(int(bits[0]), vertex_count)
-                    if (bits[1] > ''):
-                        vt3 = vertex_reference(int(bits[1]), vertex_count)
-                    else:
-                        if interpret_texture:
-                            print 'File does not provide texture coordinates! Materials will not be exported.'
-                        interpret_texture = 0
-                    if (bits[2] > ''): vn3 = vertex_reference(int(bits[2]), normal_count)
-                    
-                    d0 = (vertex[v2][0] - vertex[v1][0], vertex[v2][1] - vertex[v1][1], vertex[v2][2] - vertex[v1][2])
-                    d1 = (vertex[v3][0] - vertex[v2][0], vertex[v3][1] - vertex[v2][1], vertex[v3][2] - vertex[v2][2])
-                    xp = (d0[1] * d1[2] - d0[2] * d1[1], d0[2] * d1[0] - d0[0] * d1[2], d0[0] * d1[1] - d0[1] * d1[0])
-                    det = math.sqrt(xp[0]*xp[0] + xp[1]*xp[1] + xp[2]*xp[2])
-                    if (det > 0):
-                        if interpret_texture and not args.no_texture_split:
-                            tc1 = uv[vt1]
-                            tc2 = uv[vt2]
-                            tc3 = uv[vt3]
-                        else:
-                            tc1 = None
-                            tc2 = None
-                            tc3 = None
-                        rv1 = resolve_vertex(vertex[v1], normal[vn1], tc1, index_for_vert_norm_and_tex, vertex_lines_out, normals_lines_out)
-                        rv2 = resolve_vertex(vertex[v2], normal[vn2], tc2, index_for_vert_norm_and_tex, vertex_lines_out, normals_lines_out)
-                        rv3 = resolve_vertex(vertex[v3], normal[vn3], tc3, index_for_vert_norm_and_tex, vertex_lines_out, normals_lines_out)
-                        face_normal = average_normal(normal[vn1], normal[vn2], normal[vn3])
-                        
-                        if should_reverse_winding(vertex[v1], vertex[v2], vertex[v3], face_normal):
-                            # If reversing, swap first and third vertex index and tex coord.
-                            # Note that we don't need to swap normals here, because they're
-                            # indexed in the same sequence as vertices, but texture coords
-                            # are stored separately with the faces.
-                            temp = rv1
-                            rv1 = rv3
-                            rv3 = temp
-                            temp = vt1
-                            vt1 = vt3
-                            vt3 = temp
-                        
-                        if args.include_face_normals:
-                            face_normal_str = format_normal(face_normal)
-                        else:
-                            face_normal_str = '0 0 0'
-                        
-                        face_count = face_count + 1
-                        face.append((rv1, rv2, rv3))
-                        faces_lines_out.append('0 0 0\t%s\t3\t%d %d %d\n' % (face_normal_str, rv1, rv2, rv3))
-                        
-                        if interpret_texture:
-                            texture_for_face.append(textureName)
-                            texcoords_for_face.append([uv[vt1], uv[vt2], uv[vt3]])
-                    
-                    tokens = tokens[:2]+tokens[3:]
+            first_corner += operation
+    
+    if NO_INDEX in triangle_normals:
+        raise ConversionError('%s: face without normals' % input_display_name)
+    check_indices(triangle_normals, normal_count, 'normal', input_display_name)
+    
+    ### Drop degenerate triangles and fix their winding
+    stats.stage('classify_triangles')
+    kept_triangles, face_normals, reverse = classify_triangles(vertex, normal, triangle_vertices, triangle_normals, options)
+    
+    ### Resolve vertices: number the output vertices, one per distinct
+    ### position, texture coordinates and normal (or index triple if told
+    ### not to weld).
+    stats.stage('resolve_vertices')
+    for i, t in enumerate(kept_triangles):
+        v1, v2, v3 = triangle_vertices[3 * t:3 * t + 3]
+        vt1, vt2, vt3 = triangle_texcoords[3 * t:3 * t + 3]
+        vn1, vn2, vn3 = triangle_normals[3 * t:3 * t + 3]
+        textureName = triangle_textures[t]
+        if textureName is not None and not options.no_texture_split:
+            rv1 = resolve_corner(v1, vt1, vn1)
+            rv2 = resolve_corner(v2, vt2, vn2)
+            rv3 = resolve_corner(v3, vt3, vn3)
+        else:
+            rv1 = resolve_corner(v1, uv_count, vn1)
+            rv2 = resolve_corner(v2, uv_count, vn2)
+            rv3 = resolve_corner(v3, uv_count, vn3)
+        
+        if reverse[i]:
+            # If reversing, swap first and third vertex index and tex coord.
+            # Note that we don't need to swap normals here, because they're
+            # indexed in the same sequence as vertices, but texture coords
+            # are stored separately with the faces.
+            rv1, rv3 = rv3, rv1
+            vt1, vt3 = vt3, vt1
+        
+        face_count = face_count + 1
+        face.extend((rv1, rv2, rv3))
+        
+        if textureName is not None:
+            texture_for_face.append(textureName)
+            texcoords_for_face.extend((vt1, vt2, vt3))
+    
+    resolved_vertex_count = len(resolved_corners) // 3
+    
+    ### Format output.
+    stats.stage('format')
+    vertex_lines_out = ['VERTEX\n'] + format_vectors((clean_vector(vertex[v]) for v in resolved_corners[0::3]), options)
+    for vn in resolved_corners[2::3]:
+        n = clean_vector(normal[vn])
+        if not is_vector_normalized(n):
+            warn('Bug: writing unnormalized normal %s' % format_normal(n, options), options)
+    normals_lines_out = ['NORMALS\n'] + format_normals((clean_vector(normal[vn]) for vn in resolved_corners[2::3]), options)
+    if options.include_face_normals:
+        face_normal_strs = [line[:-1] for line in format_normals(face_normals, options)]
+    else:
+        face_normal_strs = ['0 0 0'] * face_count
+    faces_lines_out = ['FACES\n'] + ['0 0 0\t%s\t3\t%d %d %d\n' % (face_normal_strs[i], face[3 * i], face[3 * i + 1], face[3 * i + 2])
+                                     for i in xrange(face_count)]
     
     ### Write output.
-    output_file.write('// Converted by Obj2DatTexNorm.py Wavefront OBJ file conversion script\n')
-    output_file.write('// (c) 2005-2013 By Giles Williams and Jens Ayton\n')
-    output_file.write('// \n')
-    output_file.write('// original file: "%s"\n' % input_display_name)
-    output_file.write('// \n')
-    output_file.write('// model size: %.3f x %.3f x %.3f\n' % (max_v[0]-min_v[0], max_v[1]-min_v[1], max_v[2]-min_v[2]))
-    output_file.write('// \n')
-    output_file.write('// materials used: %s\n' % materials_used)
-    output_file.write('// \n')
-    output_file.write('NVERTS %d\n' % resolved_vertex_count)
-    output_file.write('NFACES %d\n' % face_count)
-    output_file.write('\n')
-    output_file.writelines(vertex_lines_out)
-    output_file.write('\n')
-    output_file.writelines(faces_lines_out)
-    output_file.write('\n')
-    
-    # Check that we have textures for every vertex
-    ok_to_write_texture = 1
-    if len(texture_for_face) != len(face):
-        ok_to_write_texture = 0
-    if len(texcoords_for_face) != len(face):
-        ok_to_write_texture = 0
-    for texture in texture_for_face:
-        if texture == '':
+    stats.stage('write')
+    output_file = open(write_file_name, 'w')
+    try:
+        output_file.write('// Converted by Obj2DatTexNorm.py Wavefront OBJ file conversion script\n')
+        output_file.write('// (c) 2005-2013 By Giles Williams and Jens Ayton\n')
+        output_file.write('// \n')
+        output_file.write('// original file: "%s"\n' % input_display_name)
+        output_file.write('// \n')
+        output_file.write('// model size: %.3f x %.3f x %.3f\n' % (max_v[0]-min_v[0], max_v[1]-min_v[1], max_v[2]-min_v[2]))
+        output_file.write('// \n')
+        output_file.write('// materials used: %s\n' % materials_used)
+        output_file.write('// \n')
+        output_file.write('NVERTS %d\n' % resolved_vertex_count)
+        output_file.write('NFACES %d\n' % face_count)
+        output_file.write('\n')
+        output_file.writelines(vertex_lines_out)
+        output_file.write('\n')
+        output_file.writelines(faces_lines_out)
+        output_file.write('\n')
+        
+        # Check that we have textures for every vertex
+        ok_to_write_texture = 1
+        if len(texture_for_face) != face_count:
             ok_to_write_texture = 0
-    
-    # If we're all clear then write out the texture uv coordinates.
-    if ok_to_write_texture:
-        output_file.write('TEXTURES\n')
-        for i in range(0, len(face)):
-            facet = face[i]
-            texture = texture_for_face[i]
-            output_file.write('%s\t1.0 1.0\t%s\t%s\t%s\n' %
-                              (texture, format_textcoord(texcoords_for_face[i][0]),
-                               format_textcoord(texcoords_for_face[i][1]),
-                               format_textcoord(texcoords_for_face[i][2])))
-    output_file.write('\n')
-    
-    # Write NAMES section if used (textures in place and not pretty printing)
-    if len(names_lines_out) != 0:
-        output_file.write('NAMES %u\n' % len(names_lines_out))
-        output_file.writelines(names_lines_out)
+        if len(texcoords_for_face) != 3 * face_count:
+            ok_to_write_texture = 0
+        for texture in texture_for_face:
+            if texture == '':
+                ok_to_write_texture = 0
+        
+        # If we're all clear then write out the texture uv coordinates.
+        if ok_to_write_texture:
+            output_file.write('TEXTURES\n')
+            # Formatted a few thousand faces at a time: there are three texture
+            # coordinates per face.
+            for start in xrange(0, face_count, numformat.ROWS_PER_CHUNK):
+                end = min(start + numformat.ROWS_PER_CHUNK, face_count)
+                texcoords = format_textcoords((uv[vt] for vt in texcoords_for_face[3 * start:3 * end]), options)
+                output_file.writelines(['%s\t1.0 1.0\t%s\t%s\t%s\n' %
+                                        (texture_for_face[start + i], texcoords[3 * i], texcoords[3 * i + 1], texcoords[3 * i + 2])
+                                        for i in xrange(end - start)])
         output_file.write('\n')
-    
-    output_file.writelines(normals_lines_out)
-    output_file.write('\n')
-    output_file.write('END\n')
+        
+        # Write NAMES section if used (textures in place and not pretty printing)
+        if len(names_lines_out) != 0:
+            output_file.write('NAMES %u\n' % len(names_lines_out))
+            output_file.writelines(names_lines_out)
+            output_file.write('\n')
+        
+        output_file.writelines(normals_lines_out)
+        output_file.write('\n')
+        output_file.write('END\n')
+    except Exception:
+        # Don't leave a partial output file behind.
+        output_file.close()
+        os.remove(write_file_name)
+        raise
     output_file.close()
-    input_file.close()
+    
+    if options.meshbin and not geometry.loaded:
+        stats.stage('meshbin')
+        geometry.to_meshbin().write(mbin_file_name, source)
+        stats.add_output(mbin_file_name)
+    
+    if cache:
+        convcache.replace_if_changed(write_file_name, output_file_name)
+        stats.stage('cache')
+        cache.store(cache_key, [output_file_name])
+        stats.end()
+    
+    stats.add_output(output_file_name)
+    stats.count('vertices', vertex_count)
+    stats.count('normals', normal_count)
+    stats.count('texture_coordinates', len(uv))
+    stats.count('materials', len(materials_used))
+    stats.count('faces', face_count)
+    stats.count('output_vertices', resolved_vertex_count)
+
+
+def obj_dependencies(input_file_name):
+    """ obj_dependencies
+        Return the material libraries an OBJ file depends on.
+    """
+    input_file = open(input_file_name, 'rU')
+    try:
+        return material_library_file_names(input_file_name, input_file)
+    finally:
+        input_file.close()
+
+
+def _convert_job(job):
+    """ _convert_job
+        Convert a file and catch its errors, possibly on a process pool
+        worker. job is an (input file name, options) pair.
+        Returns an (input file name, error message or None, seconds,
+        statistics record or None) tuple.
+    """
+    input_file_name, options = job
+    start = time.time()
+    error = None
+    stats = None
+    if options.stats:
+        stats = convstats.FileStats(os.path.basename(__file__), input_file_name)
+    try:
+        convert_file(input_file_name, options, stats)
+    except Exception as exc:
+        # One bad file must not stop the whole batch.
+        error = ' '.join(('%s: %s' % (exc.__class__.__name__, exc)).splitlines())
+    record = None
+    if stats:
+        stats.finish(error)
+        record = stats.as_dict()
+    return input_file_name, error, time.time() - start, record
+
+
+def convert_files(input_file_names, options=None):
+    """ convert_files
+        Convert OBJ files, one after the other or on a pool of options.jobs
+        processes, then print the summary and the statistics as asked by
+        options.
+        Returns the number of files which could not be converted.
+    """
+    if options is None:
+        options = default_options()
+    jobs = [(input_file_name, options) for input_file_name in input_file_names]
+    n_jobs = options.jobs or multiprocessing.cpu_count()
+    if n_jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(n_jobs, len(jobs)))
+        try:
+            results = pool.map(_convert_job, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_convert_job(job) for job in jobs]
+    
+    if not options.quiet:
+        convstats.print_summary(results, message_stream(options))
+    if options.stats:
+        for result in results:
+            convstats.emit(result[3], options.stats)
+    return len([result for result in results if result[1]])
+
+
+def main():
+    """ main
+        Convert the files given on the command line, then watch a directory
+        tree if asked to.
+    """
+    options = argParser.parse_args()
+    if not (options.files or options.watch):
+        argParser.error('no file to convert and no directory to watch')
+    if options.watch and not os.path.isdir(options.watch):
+        argParser.error('%s is not a directory' % options.watch)
+    if options.jobs < 0:
+        argParser.error('the number of jobs can\'t be negative')
+    
+    failed = 0
+    if options.files:
+        failed = convert_files(options.files, options)
+    
+    if options.watch:
+        convwatch.Watcher(options.watch, ('.obj',), ('.mtl',), obj_dependencies,
+                          lambda input_file_names: convert_files(input_file_names, options),
+                          log=lambda message: log(message, options)).run()
+    
+    if failed:
+        sys.exit('Error: %d file(s) could not be converted.' % failed)
+    log('Done.\n', options)
 
 
-print 'Done.\n'
+if __name__ == '__main__':
+    main()
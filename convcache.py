@@ -0,0 +1,244 @@
+#!/usr/bin/python
+#
+# -*- coding: utf-8 -*-
+#
+"""
+Content-addressed conversion cache shared by the converters.
+
+The cache key is a SHA-1 digest over:
+* the converter name, version and source code;
+* the input file name and content;
+* the sidecar files (.mtl, .oti...) names and contents, or their absence;
+* the options changing the output.
+
+Each entry is a directory named like the key, holding a copy of each output
+file. On a hit, the outputs are restored, but the ones already holding the
+same bytes are left untouched, so tools relying on modification times don't
+rebuild anything.
+
+Entries are evicted least recently used first when the cache grows over its
+size limit. The last use of an entry is its directory modification time.
+
+The cache directory defaults to the OOLITE_CONVERTERS_CACHE environment
+variable value, or '~/.cache/oolite-mesh-converters'.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+
+DEFAULT_CACHE_DIR = os.environ.get("OOLITE_CONVERTERS_CACHE",
+                                   os.path.join(os.path.expanduser("~"), ".cache",
+                                                "oolite-mesh-converters"))
+
+# Cache size limit, in MiB.
+DEFAULT_CACHE_SIZE = 256
+
+# Bytes read at once when hashing and comparing files.
+READ_BLOCK_SIZE = 1 << 20
+
+# Suffix of the files the converters write before 'replace_if_changed'.
+PARTIAL_SUFFIX = ".part"
+
+
+def file_digest(file_name, digest=None):
+    """Hashes a file content.
+    :file_name: string: The file path.
+    :digest: hashlib object: Updated with the file content if given, a new
+        SHA-1 one is used otherwise. Defaults to None.
+    Returns the digest object.
+    """
+    if digest is None:
+        digest = hashlib.sha1()
+    with open(file_name, "rb") as in_fd:
+        for block in iter(lambda: in_fd.read(READ_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest
+
+
+def same_content(file_name_1, file_name_2):
+    """Returns True if both files exist and hold the same bytes."""
+    if not (os.path.isfile(file_name_1) and os.path.isfile(file_name_2)):
+        return False
+    if os.path.getsize(file_name_1) != os.path.getsize(file_name_2):
+        return False
+    with open(file_name_1, "rb") as fd_1, open(file_name_2, "rb") as fd_2:
+        while True:
+            block_1 = fd_1.read(READ_BLOCK_SIZE)
+            if block_1 != fd_2.read(READ_BLOCK_SIZE):
+                return False
+            if not block_1:
+                return True
+
+
+def replace_if_changed(new_file_name, file_name):
+    """Moves 'new_file_name' to 'file_name', unless 'file_name' already holds
+    the same bytes. 'new_file_name' is removed in both cases.
+    :new_file_name: string: The freshly written file path.
+    :file_name: string: The final file path.
+    Returns True if 'file_name' was replaced.
+    """
+    if same_content(new_file_name, file_name):
+        os.remove(new_file_name)
+        return False
+    if os.path.exists(file_name):
+        # 'os.rename' doesn't replace existing files on Windows.
+        os.remove(file_name)
+    os.rename(new_file_name, file_name)
+    return True
+
+
+def partial_name(file_name):
+    """Returns the name to write 'file_name' to before 'replace_if_changed'."""
+    return file_name + PARTIAL_SUFFIX
+
+
+def _dir_size(dir_name):
+    """Returns the size of the files in 'dir_name', in bytes."""
+    return sum(os.path.getsize(os.path.join(dir_name, name))
+               for name in os.listdir(dir_name))
+
+
+class ConversionCache(object):
+    """An on-disk conversion outputs cache."""
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_CACHE_SIZE):
+        """:cache_dir: string: The cache directory. Defaults to
+            DEFAULT_CACHE_DIR.
+        :max_size: int: The cache size limit, in MiB. Defaults to
+            DEFAULT_CACHE_SIZE.
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_size * 1048576
+
+    @staticmethod
+    def key(tool, version, input_file_name, sidecar_file_names=(), options=None,
+            source_file_names=()):
+        """Computes a cache key.
+        :tool: string: The converter name.
+        :version: string: The converter version.
+        :input_file_name: string: The converted file path.
+        :sidecar_file_names: iterable of strings: The other files the
+            conversion reads. Missing ones are part of the key too.
+            Defaults to an empty tuple.
+        :options: dict: The options changing the output. Must be JSON
+            serializable. Defaults to None.
+        :source_file_names: iterable of strings: The converter source file
+            and the ones of the modules shaping its output, hashed so any
+            code change invalidates the entries. Compiled module names, as
+            in '__file__', stand for their source. Defaults to an empty
+            tuple.
+        Returns a string.
+        """
+        digest = hashlib.sha1()
+        header = {"tool": tool, "version": version,
+                  "input": os.path.basename(input_file_name),
+                  "sidecars": [os.path.basename(name) for name in sidecar_file_names],
+                  "options": options or {}}
+        digest.update(json.dumps(header, sort_keys=True).encode("utf-8"))
+        for source_file_name in source_file_names:
+            source_file_name = os.path.splitext(source_file_name)[0] + ".py"
+            if os.path.isfile(source_file_name):
+                file_digest(source_file_name, digest)
+        for file_name in [input_file_name] + list(sidecar_file_names):
+            if os.path.isfile(file_name):
+                digest.update(b"\0file\0")
+                file_digest(file_name, digest)
+            else:
+                digest.update(b"\0missing\0")
+        return digest.hexdigest()
+
+    def _entry_dir(self, key):
+        """Returns the directory of the 'key' entry."""
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def restore(self, key, output_file_names):
+        """Restores the outputs of a cache entry.
+        Outputs already holding the right bytes are not rewritten.
+        :key: string: As returned by 'key'.
+        :output_file_names: list of strings: The output file paths, in the
+            same order as when stored.
+        Returns True on a cache hit, False otherwise.
+        """
+        entry_dir = self._entry_dir(key)
+        cached = [os.path.join(entry_dir, str(index))
+                  for index in range(len(output_file_names))]
+        if not all(os.path.isfile(name) for name in cached):
+            return False
+        for cached_name, file_name in zip(cached, output_file_names):
+            if not same_content(cached_name, file_name):
+                new_file_name = partial_name(file_name)
+                shutil.copyfile(cached_name, new_file_name)
+                replace_if_changed(new_file_name, file_name)
+        # Mark the entry as recently used.
+        os.utime(entry_dir, None)
+        return True
+
+    def store(self, key, output_file_names):
+        """Stores outputs in the cache, then evicts old entries if needed.
+        :key: string: As returned by 'key'.
+        :output_file_names: list of strings: The output file paths.
+        """
+        entry_dir = self._entry_dir(key)
+        parent_dir = os.path.dirname(entry_dir)
+        if not os.path.isdir(parent_dir):
+            try:
+                os.makedirs(parent_dir)
+            except OSError:
+                # Created meanwhile by another process.
+                if not os.path.isdir(parent_dir):
+                    raise
+        # Fill a temporary directory, then rename it: concurrent runs never
+        # see half written entries.
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=parent_dir)
+        try:
+            for index, file_name in enumerate(output_file_names):
+                shutil.copyfile(file_name, os.path.join(tmp_dir, str(index)))
+            if os.path.isdir(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Stored meanwhile by another process.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """Returns a list of (float:last_use, int:size, string:entry_dir)
+        tuples, one per cache entry."""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, name)
+                if name.startswith(".tmp_") or not os.path.isdir(entry_dir):
+                    continue
+                try:
+                    entries.append((os.path.getmtime(entry_dir), _dir_size(entry_dir),
+                                    entry_dir))
+                except OSError:
+                    # Evicted meanwhile by another process.
+                    pass
+        return entries
+
+    def evict(self):
+        """Removes the least recently used entries until the cache size is
+        under its limit.
+        Returns the number of removed entries.
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
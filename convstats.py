@@ -0,0 +1,182 @@
+#!/usr/bin/python
+#
+# -*- coding: utf-8 -*-
+#
+"""
+Conversion statistics shared by the converters.
+
+A 'FileStats' object is created for each converted file. Stages are timed
+one after the other, like laps: 'stage("parse_faces")' ends the running stage
+and starts a new one, 'end()' ends the running one.
+Counts (vertices, faces...) and the input and output files byte sizes are
+recorded alongside the timings.
+
+'emit' writes the record as a single JSON object line, so a run over several
+files produces a JSON lines stream one can feed to dashboards:
+
+{"tool": "dat2obj.py", "input": "ship.dat", "input_bytes": 1234,
+ "outputs": {"ship.obj": 2345, "ship.mtl": 123}, "output_bytes": 2468,
+ "seconds": 0.012, "stages": {"read_sections": 0.002, ...},
+ "counts": {"vertices": 42, ...}, "error": null}
+
+'print_summary' writes the table of the files of a batch, with their time and
+conversion error, if any.
+"""
+
+import os
+import sys
+import json
+import time
+from collections import OrderedDict
+
+
+# Values accepted by the converters '--stats' option.
+STATS_FORMATS = ("json",)
+
+
+def _file_size(file_name):
+    """Returns the size of 'file_name' in bytes, or None if it can't be read.
+    :file_name: string: The file path.
+    """
+    try:
+        return os.path.getsize(file_name)
+    except OSError:
+        return None
+
+
+class FileStats(object):
+    """Timings and counts recorded while converting a file."""
+
+    def __init__(self, tool, input_file_name):
+        """:tool: string: The converter name.
+        :input_file_name: string: The converted file path.
+        """
+        self.tool = tool
+        self.input_file_name = input_file_name
+        self.output_file_names = []
+        self.stages = OrderedDict()
+        self.counts = OrderedDict()
+        self.error = None
+        self._start = time.time()
+        self._stage = None
+        self._stage_start = None
+        self._seconds = None
+
+    def stage(self, name):
+        """Ends the running stage, if any, and starts the 'name' one.
+        Time spent in stages started several times is summed.
+        :name: string: The stage name.
+        """
+        self.end()
+        self._stage = name
+        self._stage_start = time.time()
+
+    def end(self):
+        """Ends the running stage, if any."""
+        if self._stage is not None:
+            elapsed = time.time() - self._stage_start
+            self.stages[self._stage] = self.stages.get(self._stage, 0.0) + elapsed
+            self._stage = None
+
+    def count(self, name, value):
+        """Records the 'name' count.
+        :name: string: What is counted.
+        :value: int: The count.
+        """
+        self.counts[name] = value
+
+    def add_output(self, file_name):
+        """Records a written file. Its size is read by 'as_dict'.
+        :file_name: string: The output file path.
+        """
+        self.output_file_names.append(file_name)
+
+    def finish(self, error=None):
+        """Ends the running stage and stops the file wall time.
+        :error: string: The conversion error, if any. Defaults to None.
+        """
+        self.end()
+        self.error = error
+        self._seconds = time.time() - self._start
+
+    def as_dict(self):
+        """Returns the record as an OrderedDict, ready to be serialized."""
+        if self._seconds is None:
+            self.finish(self.error)
+        outputs = OrderedDict((file_name, _file_size(file_name))
+                              for file_name in self.output_file_names)
+        return OrderedDict((("tool", self.tool),
+                            ("input", self.input_file_name),
+                            ("input_bytes", _file_size(self.input_file_name)),
+                            ("outputs", outputs),
+                            ("output_bytes", sum(size for size in outputs.values() if size)),
+                            ("seconds", round(self._seconds, 6)),
+                            ("stages", OrderedDict((name, round(seconds, 6))
+                                                   for name, seconds in self.stages.items())),
+                            ("counts", self.counts),
+                            ("error", self.error)))
+
+
+class NullStats(object):
+    """Drop-in for 'FileStats' when no statistics are wanted."""
+
+    def stage(self, name):
+        """Does nothing."""
+        pass
+
+    def end(self):
+        """Does nothing."""
+        pass
+
+    def count(self, name, value):
+        """Does nothing."""
+        pass
+
+    def add_output(self, file_name):
+        """Does nothing."""
+        pass
+
+    def finish(self, error=None):
+        """Does nothing."""
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+def emit(record, fmt="json", std=sys.stdout):
+    """Writes a record.
+    :record: FileStats or dict: The record, as returned by
+        'FileStats.as_dict' for a dict.
+    :fmt: string: One of STATS_FORMATS. Defaults to 'json'.
+    :std: object: The file object to write to. Defaults to sys.stdout.
+    """
+    if isinstance(record, FileStats):
+        record = record.as_dict()
+    if fmt not in STATS_FORMATS:
+        raise ValueError("Unknown statistics format '%s'." % fmt)
+    std.write(json.dumps(record) + "\n")
+    std.flush()
+
+
+def print_summary(results, std=sys.stdout):
+    """Writes the time spent on each file of a batch and the conversion
+    errors.
+    :results: list of tuples: (string:input_file_name, string:error_or_None,
+        float:seconds, dict:statistics_or_None) ones, as returned by the
+        converters '_convert_job' functions.
+    :std: object: The file object to write to. Defaults to sys.stdout.
+    """
+    name_width = max([len("File")] + [len(result[0]) for result in results])
+    lines = ["* Summary",
+             "  %-*s  %10s  %s" % (name_width, "File", "Time (s)", "Status"),
+             "  %s  %s  %s" % ("-" * name_width, "-" * 10, "-" * 6)]
+    total = 0.0
+    for input_file_name, error, elapsed, _ in results:
+        total += elapsed
+        lines.append("  %-*s  %10.3f  %s" % (name_width, input_file_name, elapsed,
+                                            "ERROR: %s" % error if error else "OK"))
+    failed = len([result for result in results if result[1]])
+    lines.append("  %s file(s), %s failed, %.3f s" % (len(results), failed, total))
+    std.write("\n".join(lines) + "\n")
+    std.flush()
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+#
+# -*- coding: utf-8 -*-
+#
+"""
+Watch mode shared by the converters.
+
+A 'Watcher' polls a directory tree and calls back the converter with the
+models to convert again:
+* models whose content changed;
+* models whose sidecar files (.mtl, .oti...) changed, were created or
+  removed. A material library shared by several OBJ files triggers the
+  conversion of exactly the files referencing it.
+
+Files are compared by content hash: saving a file without changing it, or
+touching it, doesn't trigger anything. Bursts of writes are debounced: a file
+is only looked at once its size and modification time didn't change for
+'debounce' seconds.
+
+Polling is used instead of OS notifications so it works the same everywhere
+without extra dependency.
+"""
+
+import os
+import time
+
+from convcache import file_digest
+
+
+# Seconds between two directory scans.
+WATCH_INTERVAL = 0.5
+
+# Seconds a file must stay unchanged before being looked at.
+WATCH_DEBOUNCE = 1.0
+
+
+def _no_log(msg):
+    """Default 'log' function: drops 'msg'."""
+    pass
+
+
+def _digest(file_name):
+    """Returns the hex digest of 'file_name', or None if it can't be read."""
+    try:
+        return file_digest(file_name).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+class Watcher(object):
+    """Polls a directory tree and converts the changed models."""
+
+    def __init__(self, root_dir, model_extensions, sidecar_extensions,
+                 dependencies, convert, interval=WATCH_INTERVAL,
+                 debounce=WATCH_DEBOUNCE, log=None, extra_file_names=()):
+        """:root_dir: string: The directory to watch, recursively.
+        :model_extensions: iterable of strings: The extensions of the files
+            to convert, like '.obj'. Case insensitive.
+        :sidecar_extensions: iterable of strings: The extensions of the files
+            models depend on, like '.mtl'. Case insensitive.
+        :dependencies: callable: Called with a model path, returns the paths
+            of the sidecar files it depends on, existing or not.
+        :convert: callable: Called with a sorted list of the model paths to
+            convert.
+        :interval: float: Seconds between two scans. Defaults to
+            WATCH_INTERVAL.
+        :debounce: float: Seconds a file must stay unchanged before being
+            looked at. Defaults to WATCH_DEBOUNCE.
+        :log: callable: Called with each progress message. Defaults to None.
+        :extra_file_names: iterable of strings: Sidecar files watched even if
+            out of 'root_dir', like a shared .plist. Defaults to an empty
+            tuple.
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.model_extensions = tuple(ext.lower() for ext in model_extensions)
+        self.extensions = self.model_extensions + tuple(ext.lower() for ext in sidecar_extensions)
+        self.dependencies = dependencies
+        self.convert = convert
+        self.interval = interval
+        self.debounce = debounce
+        self.log = log or _no_log
+        self.extra_file_names = [os.path.abspath(name) for name in extra_file_names]
+        # path: (mtime, size) found by the last scan.
+        self.states = {}
+        # path: content digest when last looked at.
+        self.digests = {}
+        # path: time of the last change seen, for files not looked at yet.
+        self.pending = {}
+        # model path: sidecar paths, and sidecar path: set of model paths.
+        self.sidecars = {}
+        self.dependents = {}
+
+    def is_model(self, file_name):
+        """Returns True if 'file_name' is a model to convert."""
+        return file_name.lower().endswith(self.model_extensions)
+
+    def scan(self):
+        """Returns a dict like {path: (mtime, size)} for the watched files."""
+        states = {}
+        for dir_name, _, file_names in os.walk(self.root_dir):
+            for name in file_names:
+                if not name.lower().endswith(self.extensions):
+                    continue
+                path = os.path.join(dir_name, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # Removed meanwhile.
+                    continue
+                states[path] = (stat.st_mtime, stat.st_size)
+        for path in self.extra_file_names:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            states[path] = (stat.st_mtime, stat.st_size)
+        return states
+
+    def _set_sidecars(self, model):
+        """Updates the dependency maps of 'model'."""
+        for sidecar in self.sidecars.pop(model, ()):
+            self.dependents.get(sidecar, set()).discard(model)
+        if not os.path.isfile(model):
+            return
+        sidecars = [os.path.abspath(name) for name in self.dependencies(model)]
+        self.sidecars[model] = sidecars
+        for sidecar in sidecars:
+            self.dependents.setdefault(sidecar, set()).add(model)
+
+    def start(self):
+        """Records the current state of the tree. Nothing is converted."""
+        self.states = self.scan()
+        self.pending = {}
+        for path in self.states:
+            self.digests[path] = _digest(path)
+            if self.is_model(path):
+                self._set_sidecars(path)
+
+    def poll(self):
+        """Scans the tree once and converts the models needing it.
+        Returns the sorted list of converted model paths.
+        """
+        now = time.time()
+        states = self.scan()
+        for path in set(self.states).union(states):
+            if states.get(path) != self.states.get(path):
+                self.pending[path] = now
+        self.states = states
+
+        to_convert = set()
+        for path, changed in self.pending.items():
+            if now - changed < self.debounce:
+                continue
+            del self.pending[path]
+            digest = _digest(path) if path in states else None
+            if digest == self.digests.get(path):
+                continue
+            if digest is None:
+                self.digests.pop(path, None)
+            else:
+                self.digests[path] = digest
+            if self.is_model(path):
+                self._set_sidecars(path)
+                if digest is not None:
+                    self.log("* Changed: %s" % path)
+                    to_convert.add(path)
+            else:
+                dependents = self.dependents.get(path, set())
+                if dependents:
+                    self.log("* Changed: %s, used by %s model(s)" % (path, len(dependents)))
+                to_convert.update(model for model in dependents if model in states)
+
+        to_convert = sorted(to_convert)
+        if to_convert:
+            self.convert(to_convert)
+        return to_convert
+
+    def run(self):
+        """Watches the tree until interrupted by Ctrl+C."""
+        self.start()
+        self.log("* Watching %s (Ctrl+C to stop)" % self.root_dir)
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.poll()
+        except KeyboardInterrupt:
+            self.log("* Stopped watching %s" % self.root_dir)
@@ -35,8 +35,26 @@ __version__ = "1.0.2"
 import os
 import sys
 import re
+import mmap
 import pprint
+import time
+import multiprocessing
+import array
 from collections import OrderedDict
+from itertools import imap, chain
+from cStringIO import StringIO
+
+import convstats
+import convcache
+import convwatch
+import plistindex
+import meshbin
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional: VERTEX and NORMALS are then parsed line by line.
+    numpy = None
 
 
 __prog_name__ = os.path.basename(__file__)
@@ -45,10 +63,57 @@ __help__ = """%s
 
 Converts Oolite .dat files into Wavefromt .obj and .mtl ones.
 
-%s <.dat_file_name_1> [[<.dat_file_name_2 [...]] [--debug]
+%s <.dat_file_name_1> [[<.dat_file_name_2 [...]] [--debug] [--quantize-uv]
+    [--jobs N] [--no-numpy] [--no-mmap] [--quiet] [--stats FORMAT]
+    [--no-cache] [--cache-dir DIR] [--cache-size MB] [--watch DIR]
+    [--plist PLIST] [--meshbin]
 
 -h --help       Print this screen and exits regardless other options.
    --debug      Writes output files.
+-j --jobs N     Convert the files on a pool of N processes. 0 uses one
+                process per CPU. Defaults to 1: files are converted one
+                after the other in the current process. On a pool, the
+                progress messages are prefixed with the file name.
+   --no-mmap    Read the .dat files line by line instead of memory-mapping
+                them.
+   --no-numpy   Don't use NumPy to parse vertex and normals, even if it is
+                installed.
+   --quantize-uv
+                Merge texture coordinates which differ only past the 6th
+                decimal using integer keys instead of formatted strings.
+-q --quiet      Don't print the progress messages. Errors are still printed.
+   --stats FORMAT
+                Print the conversion statistics of each file: wall time and
+                item counts of each stage, input and output sizes. 'json'
+                is the only FORMAT: one JSON object a line and a file. The
+                progress messages then go to the standard error, so the
+                standard output only holds the statistics.
+   --no-cache   Always convert, don't use the conversion cache.
+   --cache-dir DIR
+                The conversion cache directory. Defaults to the
+                OOLITE_CONVERTERS_CACHE environment variable, or
+                '~/.cache/oolite-mesh-converters'.
+   --cache-size MB
+                The conversion cache size limit, in MiB. The least recently
+                used entries are removed above it. Defaults to %s.
+   --watch DIR  After converting the given files, if any, watch the DIR tree
+                and convert the .dat files again when their content or the
+                one of their .oti file changes. Ctrl+C stops watching.
+   --plist PLIST
+                Read the texture file names from the materials of the PLIST
+                entries (like shipdata.plist) using each .dat file as model,
+                instead of .oti files. The .dat files without entry still
+                use their .oti file. The PLIST index is cached in the cache
+                directory, and only built again when PLIST changes.
+   --meshbin    Write the parsed .dat content to a .dat2obj.mbin binary file
+                alongside the .obj one, and read it back instead of parsing
+                the .dat file again, as long as the .dat file doesn't change.
+
+The conversion cache is keyed by the .dat and .oti files contents, the program
+version and the options changing the output. Cached outputs are restored
+instead of converting again. Outputs already holding the right content are
+never rewritten, so their modification time doesn't change.
+The cache is not used with '--debug'.
 
 When '--debug' is given, several dump files are witten and contain the program
 internal data:
@@ -58,29 +123,57 @@ internal data:
 .tex    Textures data.
 .txm    Textures aliases/real names map.
 
-""" % (__authors__, __prog_name__)
+""" % (__authors__, __prog_name__, convcache.DEFAULT_CACHE_SIZE)
+
+
+#--------------------------------- DAT SYNTAX --------------------------------
+# A section starts with an upper case name at the beginning of a line,
+# optionally followed by arguments.
+SECTION_RE = re.compile(r"([A-Z][A-Z]+)([ ]+.*)?$")
+
+# Same as SECTION_RE, but to search a whole memory-mapped file.
+MAPPED_SECTION_RE = re.compile(r"^([A-Z][A-Z]+)([ ]+[^\r\n]*)?\r?$", re.M)
+
+# Size of the pieces of memory-mapped sections decoded at once to count their
+# lines.
+MAPPED_CHUNK_SIZE = 1 << 20
+
+# Comments start with '#' or '//' and end with the line.
+COMMENT_RE = re.compile(r"\s*(#|//).*")
 
 
 #-------------------------- OUTPUT FILES TEMPLATES ---------------------------
 COMMON_HEADER = """# Exported with Dat2ObjTex.py (C) Giles Williams 2005 - Kaks 2008
 # Revamped by D.C.-G. 2018."""
 
-OBJ_TEMPLATE = """{header}
+# The .obj file is streamed: this header, then the vertex, texture
+# coordinates and normals lines, then each faces group, each one followed by
+# a new line. The file ends with an empty line.
+OBJ_HEADER_TEMPLATE = """{header}
 mtllib {mtl_lib_file}
 o {obj_name}
 # {n_verts} vertices, {n_faces} faces, {n_norms} normals
-{vertex_lines}
-{tex_lines}
-{norms_lines}
-{faces_lines}
-
 """
 
-FACES_TEMPLATE = """g {obj_name}_{tex_name}
+FACES_HEADER_TEMPLATE = """g {obj_name}_{tex_name}
 usemtl {tex_name}
-{faces_lines}
 """
 
+# Number of lines joined and written at once in the .obj file.
+WRITE_CHUNK_LINES = 4096
+
+# Output files buffer size, in bytes.
+WRITE_BUFFER_SIZE = 1 << 16
+
+# Formats of the .obj VERTEX and NORMALS lines.
+VERTEX_FORMAT = "v %.6f %.6f %.6f"
+NORMALS_FORMAT = "vn %.6f %.6f %.6f"
+
+# Kind and layout version of the parsed data written in .mbin files. Bump
+# the version when the parsing changes, so older files are ignored.
+MESHBIN_KIND = "dat2obj"
+MESHBIN_VERSION = 1
+
 MATERIAL_TEMPLATE = """{header}
 # Material number {mat_num}
 {materials}
@@ -129,6 +222,21 @@ def _exit(msg):
     __exit(msg)
 
 
+def _log(msg):
+    """Prints a progress message on the standard output.
+    :msg: string: Message to display.
+    """
+    print msg
+
+
+def _log_stderr(msg):
+    """Prints a progress message on the standard error, the standard output
+    being kept for the '--stats' records.
+    :msg: string: Message to display.
+    """
+    print >> sys.stderr, msg
+
+
 def _error(msg, code=1):
     """Display '! ! ! ERROR:' followed by 'msg' then exit program with 'code'.
     :msg: string: Message to display.
@@ -139,18 +247,83 @@ def _error(msg, code=1):
     __exit("! ! ! ERROR: %s" % msg, code, sys.stderr)
 
 
+def _pop_flag(name):
+    """Removes the 'name' flag from sys.argv.
+    :name: string: The flag to look for.
+    Returns True if the flag was found, False otherwise.
+    """
+    if name in sys.argv:
+        sys.argv.remove(name)
+        return True
+    return False
+
+
+def _pop_value(names, default, cast=str):
+    """Removes an option and its value from sys.argv.
+    The value can follow the option name ('--name value') or be joined to it
+    with an equal sign ('--name=value').
+    :names: tuple of strings: The option names to look for.
+    :default: object: The value to return if the option is not found.
+    :cast: callable: Converts the value found. Defaults to 'str'.
+    Returns the option value.
+    """
+    for i, arg in enumerate(sys.argv[1:], 1):
+        name, sep, value = arg.partition("=")
+        if name not in names:
+            continue
+        if sep:
+            del sys.argv[i]
+        else:
+            if i + 1 >= len(sys.argv):
+                _error("Option '%s' needs a value." % name)
+            value = sys.argv[i + 1]
+            del sys.argv[i:i + 2]
+        try:
+            return cast(value)
+        except ValueError:
+            _error("Bad value '%s' for option '%s'." % (value, name))
+    return default
+
+
 def check_cli():
     """Reads sys.argv and process arguments.
-    Returns a tuple: (bool:debug_mode, list:input_file_names).
+    Returns a tuple: (dict:options, list:input_file_names).
     """
     if "--help" in sys.argv or "-h" in sys.argv:
         _exit(__help__)
-    debug = False
-    if "--debug" in sys.argv:
-        debug = True
-        sys.argv.remove("--debug")
+    options = dict(DEFAULT_OPTIONS)
+    options.update({"debug": _pop_flag("--debug"),
+                    "mmap": not _pop_flag("--no-mmap"),
+                    "numpy": not _pop_flag("--no-numpy") and numpy is not None,
+                    "jobs": _pop_value(("-j", "--jobs"), 1, int),
+                    "quiet": _pop_flag("-q") | _pop_flag("--quiet"),
+                    "stats": _pop_value(("--stats",), None),
+                    "cache": not _pop_flag("--no-cache"),
+                    "cache_dir": _pop_value(("--cache-dir",), None),
+                    "cache_size": _pop_value(("--cache-size",),
+                                             convcache.DEFAULT_CACHE_SIZE, int),
+                    "watch": _pop_value(("--watch",), None),
+                    "plist": _pop_value(("--plist",), None),
+                    "meshbin": _pop_flag("--meshbin")})
+    if _pop_flag("--quantize-uv"):
+        options["quantize_uv"] = 6
+    if options["jobs"] < 0:
+        _error("The number of jobs can't be negative.")
+    if options["stats"] not in (None,) + convstats.STATS_FORMATS:
+        _error("Unknown statistics format '%s'." % options["stats"])
+    if options["watch"] is not None and not os.path.isdir(options["watch"]):
+        _error("'%s' is not a directory." % options["watch"])
+    if options["plist"] is not None:
+        if not os.path.isfile(options["plist"]):
+            _error("'%s' is not a file." % options["plist"])
+        try:
+            # Built once here, the conversions get it from the disk cache.
+            plistindex.load_index(options["plist"], options["cache_dir"],
+                                  options["cache"])
+        except plistindex.PlistError as exc:
+            _error("Can't read '%s': %s" % (options["plist"], exc))
     input_file_names = sys.argv[1:]
-    return debug, input_file_names
+    return options, input_file_names
 
 
 def split_line(line):
@@ -162,6 +335,56 @@ def split_line(line):
     return line.split()
 
 
+def _vector_row(line):
+    """Builds a VERTEX, NORMALS or TANGENTS row.
+    :line: string: The line to convert.
+    Returns a tuple of three floats, or the tuple of strings found in :line
+    if it does not contain three values."""
+    tokens = split_line(line)
+    if len(tokens) == 3:
+        return float(tokens[0]), float(tokens[1]), float(tokens[2])
+    return tuple(tokens)
+
+
+def _face_row(line):
+    """Builds a FACES row.
+    :line: string: The line to convert.
+    Returns the list of the face point indexes as ints, or None if the line
+    does not contain a face definition."""
+    tokens = split_line(line)
+    if len(tokens) > 9:
+        # color_data and normal_data are not (yet) used...
+        ## color_data = tokens[0:3]
+        ## normal_data = tokens[3:6]
+        n_points = int(tokens[6])
+        return [int(point) for point in tokens[7:7 + n_points]]
+    return None
+
+
+def _texture_row(line):
+    """Builds a TEXTURES row.
+    :line: string: The line to convert.
+    Returns a tuple: (string:texture_name, list:(u, v)_float_tuples)."""
+    # It may happen that some lines uses more than one tab to separate
+    # values, so let's remove empty elements in the split result.
+    tokens = filter(None, line.split("\t"))
+    points = []
+    pa = points.append
+    for point in tokens[2:]:
+        u_coord, v_coord = point.split()[:2]
+        pa((float(u_coord), float(v_coord)))
+    return tokens[0], points
+
+
+# Converters used by 'iter_rows' to build the typed rows of each section.
+# Sections not listed here give their data lines as is.
+ROW_TYPES = {"VERTEX": _vector_row,
+             "NORMALS": _vector_row,
+             "TANGENTS": _vector_row,
+             "FACES": _face_row,
+             "TEXTURES": _texture_row}
+
+
 def build_file_path(dir_name, file_name, ext):
     """Rebuilds a file path.
     :dir_name: string: The directory where the file lies.
@@ -198,33 +421,129 @@ def _check_nentries(sections, num_def, dat_def):
     :dat_def: string: The name of the object in :sections to check the entries
         number in.
     """
-    print "  * Checking %s" % num_def
     nentries = int(sections[num_def]["arguments"].split()[0])
-    if nentries == len(sections[dat_def]["data"]):
+    section = sections[dat_def]
+    if isinstance(section, MappedSection):
+        # Counted without decoding and keeping the lines.
+        count = section.count_lines()
+    else:
+        count = len(section["data"])
+    if nentries == count:
         return True
     return False
 
 
-def _parse_vn(lines, out_format):
+def _parse_vn(lines, out_format, count=None):
     """Used to parse data which have same input shape and return same type of
     objects.
-    :lines: list of string: Data to be parsed.
+    :lines: list of strings: Data to be parsed.
     :format: string: Format to be used to build the result.
+    :count: int: The number of entries declared in the .dat file header.
+        When given and NumPy is available, the data is parsed in one
+        vectorized pass. Defaults to None.
     Returns a tuple:
-    (int:number, list:lines_out)
+    (int:number, list_like:lines_out)
     Used by parse_VERTEX and parse_NORMALS.
     """
-    number = 0
-    lines_out = []
-    loa = lines_out.append
-    for line in lines:
-        coordinates = split_line(line)
-        if len(coordinates) == 3:
-            number += 1
-            loa(out_format % (-float(coordinates[0]),
-                              float(coordinates[1]),
-                              float(coordinates[2])))
-    return number, lines_out
+    return _format_vn(_vector_coordinates(lines, count), out_format)
+
+
+def _vector_coordinates(lines, count=None):
+    """Parses VERTEX or NORMALS data lines. The x coordinates are negated.
+    Lines which don't contain three values are skipped.
+    :lines: list of strings: Data to be parsed.
+    :count: int: The number of entries declared in the .dat file header.
+        When given and NumPy is available, the data is parsed in one
+        vectorized pass. Defaults to None.
+    Returns a float64 NumPy array shaped (n, 3) if parsed with NumPy, a list
+    of (x, y, z) float tuples otherwise.
+    """
+    if count and numpy is not None:
+        coordinates = _vector_array(lines, count)
+        if coordinates is not None:
+            return coordinates
+    coordinates = []
+    ca = coordinates.append
+    for row in imap(_vector_row, lines):
+        if len(row) == 3:
+            ca((-row[0], row[1], row[2]))
+    return coordinates
+
+
+def _format_vn(coordinates, out_format):
+    """Builds the .obj lines of VERTEX or NORMALS coordinates.
+    :coordinates: array or list: As returned by '_vector_coordinates'.
+    :out_format: string: Format of one line, taking three floats.
+    Returns a tuple:
+    (int:number, list_like:lines_out)
+    """
+    if numpy is not None and isinstance(coordinates, numpy.ndarray):
+        return len(coordinates), VectorLines(coordinates, out_format)
+    return len(coordinates), [out_format % xyz for xyz in coordinates]
+
+
+def _vector_array(lines, count):
+    """Parses VERTEX or NORMALS data lines in a NumPy array.
+    The x coordinates are negated.
+    :lines: list of strings: Data to be parsed.
+    :count: int: The number of entries declared in the .dat file header.
+    Returns a float64 array shaped (:count, 3), or None if the data does not
+    contain exactly :count lines of three numbers.
+    """
+    if len(lines) != count:
+        return None
+    text = "\n".join(lines)
+    # Lines without three values are skipped by the Python parser: the values
+    # of misaligned lines must not be regrouped in threes.
+    split = split_line if "," in text else type(text).split
+    if set(imap(len, imap(split, lines))) != {3}:
+        return None
+    if "," in text:
+        text = text.replace(",", " ")
+    # 'fromstring' stops at the first bad value, so anything unexpected ends
+    # in a size mismatch.
+    values = numpy.fromstring(text, dtype=numpy.float64, sep=" ")
+    if values.size != 3 * count:
+        return None
+    coordinates = values.reshape(count, 3)
+    numpy.negative(coordinates[:, 0], out=coordinates[:, 0])
+    return coordinates
+
+
+class VectorLines(object):
+    """Lines of a VERTEX or NORMALS section, kept as a NumPy array and
+    formatted in bulk when they are read.
+    Behaves like the list of lines built by '_parse_vn'."""
+    __slots__ = ("coordinates", "out_format")
+
+    def __init__(self, coordinates, out_format):
+        """:coordinates: array: float64 array shaped (n, 3).
+        :out_format: string: Format of one line, taking three floats."""
+        self.coordinates = coordinates
+        self.out_format = out_format
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            for line in chunk.split("\n"):
+                yield line
+
+    def __repr__(self):
+        return "<VectorLines %s x '%s'>" % (len(self), self.out_format)
+
+    def chunks(self, size=4096):
+        """Formats the lines by blocks.
+        :size: int: The maximum number of lines in a block.
+            Defaults to 4096.
+        Yields strings containing up to :size lines joined by new lines.
+        """
+        coordinates = self.coordinates
+        for start in xrange(0, len(coordinates), size):
+            block = coordinates[start:start + size]
+            block_format = "\n".join((self.out_format,) * len(block))
+            yield block_format % tuple(block.ravel().tolist())
 
 
 def _get_tex_name(tex_map, idx, suffix="_auv"):
@@ -266,51 +585,46 @@ def check_names(sections):
 
 
 #-------------------------- DATA PARSING FUNCTIONS ---------------------------
-def parse_textures(lines):
+def parse_textures(rows, quantize=None):
     """Parses the TEXTUES data and build new data to be used later and written
     in .obj file.
-    :lines: list of strings: The TEXTURES lines as found in the .dat file.
+    :rows: iterable of tuples: The TEXTURES rows as given by 'iter_rows'.
+    :quantize: int: Number of decimals to round texture coordinates to before
+        merging them. The merge is done on integer keys, so no string is built
+        for already known coordinates.
+        Defaults to None: coordinates are merged on their .obj representation.
     Returns a tuple:
     (dict:textures_references, list:.obj_file_textures)"""
-    print "  * Parsing textures"
-
-    def tex_index(tex, vts):
-        """Returns the index of 'tex' in 'vts' or -1 if not found.
-        :tex: string: Preformated string to be found.
-        :vts: list of preformatted strings: Where to find 'tex'.
-        Returns a signed int."""
-        if tex in vts:
-            return vts.index(tex)
-        return -1
-
-    tex_refs = {}
     named = OrderedDict()
     numbered = OrderedDict()
-    vts = []
-    vtsa = vts.append
+    # Maps a texture coordinates key to its index in 'tex_lines_out'.
+    vt_indexes = {}
+    vt_get = vt_indexes.get
     tex_lines_out = []
     tloa = tex_lines_out.append
+    scale = None
+    if quantize is not None:
+        scale = 10 ** quantize
     n_faces = 0
-    for line in lines:
-        # It may happen that some lines uses more than one tab to separate
-        # values, so let's remove empty elements in the split result.
-        tokens = filter(None, line.split("\t"))
-        tex_name = tokens[0]
-        if tex_name not in named.keys():
-            named[tex_name] = {}
-        if n_faces not in numbered.keys():
-            numbered[n_faces] = {}
-        tex_for_face = named[tex_name]
-        points = tokens[2:]
+    for tex_name, points in rows:
+        tex_for_face = named.setdefault(tex_name, {})
         tff = []
+        tffa = tff.append
 
-        for point in points:
-            v_data = point.split()
-            vt_data = '%.6f %.6f' % (float(v_data[0]), 1 - float(v_data[1]))
-            if vt_data not in vts:
-                vtsa(vt_data)
+        for u_coord, v_coord in points:
+            v_coord = 1 - v_coord
+            if scale is None:
+                key = vt_data = '%.6f %.6f' % (u_coord, v_coord)
+            else:
+                key = (int(round(u_coord * scale)), int(round(v_coord * scale)))
+                vt_data = None
+            index = vt_get(key)
+            if index is None:
+                index = vt_indexes[key] = len(tex_lines_out)
+                if vt_data is None:
+                    vt_data = '%.6f %.6f' % (u_coord, v_coord)
                 tloa("vt %s" % vt_data)
-            tff[len(tff):] = [tex_index(vt_data, vts)]
+            tffa(index)
         tex_for_face[n_faces] = tff
         numbered[n_faces] = tff, tex_name
         n_faces += 1
@@ -318,78 +632,48 @@ def parse_textures(lines):
     return tex_refs, tex_lines_out
 
 
-def parse_vertex(lines):
+def parse_vertex(lines, count=None):
     """Parses the VERTEX data and return new data to be written in .obj file.
     :lines: list of strings: The VERTEX lines as found in the .dat file.
+    :count: int: The NVERTS value, used to parse the data with NumPy.
+        Defaults to None.
     Returns a tuple:
-    (int:number_of_vertex, list:.obj_file_vertex)"""
-    print "  * Parsing vertex"
-    return _parse_vn(lines, "v %.6f %.6f %.6f")
+    (int:number_of_vertex, list_like:.obj_file_vertex)"""
+    return _parse_vn(lines, VERTEX_FORMAT, count)
 
 
-def parse_normals(lines):
+def parse_normals(lines, count=None):
     """Parses the NORMALS data and return new data to be written in .obj file.
     :lines: list of strings: The NORMALS lines as found in the .dat file.
+    :count: int: The NVERTS value, used to parse the data with NumPy.
+        Defaults to None.
     Returns a tuple:
-    (int:number_of_normals, list:.obj_file_normals)"""
-    print "  * Parsing normals"
-    return _parse_vn(lines, "vn %.6f %.6f %.6f")
+    (int:number_of_normals, list_like:.obj_file_normals)"""
+    return _parse_vn(lines, NORMALS_FORMAT, count)
 
 
-def parse_faces(lines, tex_for_face, n_normals):
+def parse_faces(rows, tex_for_face, n_normals):
     """Parses the FACES data and new data to be written in .obj file.
-    :lines: list of strings: The FACES lines as found in the .dat file.
+    :rows: iterable of lists: The FACES rows as given by 'iter_rows'.
     :tex_for_face: dict: Contains texture information as parsed by
         'parse_textures'.
     :n_normals: int: The number of lines in NORMALS .dat file entry.
     Returns a tuple:
     (int:number_of_faces, dict:faces_groups)
-    dict:faces_groups contains lists of lines to be written in the .obj file,
+    dict:faces_groups contains the FaceLines to be written in the .obj file,
     according to the texture they belong to."""
-    print "  * Parsing faces"
-
-    def build_face_no_norm(p_d, f_i, *args):
-        """Builds a 'face' without mormal reference.
-        :p_d: int: Point data.
-        :f_i: int: Face 'info'.
-        Returns a string: '<:p_d + 1>/<:f_i + 1>/ '.
-        """
-        # *args are unused, don't keep them.
-        del args
-        return "%s/%s/ " % (p_d + 1, f_i + 1)
-
-    def build_face_norm(p_d, f_i, n_i):
-        """Builds a 'face' with mormal reference.
-        :p_d: int: Point data.
-        :f_i: int: Face 'info'.
-        :n: int: The normal reference index.
-        returs a string: '<:p_d + 1>/<:f_i + 1>/<n_i + 1> '.
-        """
-        return "%s/%s/%s " % (p_d + 1, f_i + 1, n_i + 1)
-
-    build_face = build_face_no_norm
-    if n_normals:
-        build_face = build_face_norm
-
     n_faces = 0
     faces_groups = OrderedDict()
 
     tex_numbered = tex_for_face["numbered"]
     tex_named = tex_for_face["named"]
-    for line in lines:
-        tokens = split_line(line)
-        if len(tokens) > 9:
-            # color_data and normal_data are not (yet) used...
-            # normal_data will be used to write 'vn' entries in the .obj file.
-            ## color_data = tokens[0:3]
-            ## normal_data = tokens[3:6]
-            n_points = int(tokens[6])
-            point_data = tokens[7:]
-            faces = ""
+    for point_data in rows:
+        if point_data is not None:
             face_info = tex_numbered[n_faces]
             tex_name = face_info[-1]
-            if tex_name not in faces_groups.keys():
-                faces_groups[tex_name] = []
+            group = faces_groups.get(tex_name)
+            if group is None:
+                group = faces_groups[tex_name] = FaceLines(bool(n_normals))
 
             # Verify the face data in also in the 'named' texture data.
             verif = tex_named.get(tex_name)
@@ -402,30 +686,94 @@ def parse_faces(lines, tex_for_face, n_normals):
             if err:
                 raise KeyError(err)
 
-            floa = faces_groups[tex_name].append
-            f_i = face_info[0]
-            for i in xrange(n_points):
-                faces += build_face(int(point_data[i]), f_i[i], n_faces)
-            floa("f %s" %faces)
+            group.add(point_data, face_info[0], n_faces)
             n_faces += 1
 
     return n_faces, faces_groups
 
 
-def parse_names(lines, oti_file_name):
-    """Parses the NAMES data.
-    :lines: array of strings: The data to be parsed.
+class FaceLines(object):
+    """Lines of a group of faces, kept as arrays of 1-based indices and
+    formatted in bulk when they are read, like 'VectorLines'.
+    Each line is 'f ' followed by a '<point>/<texture>/<normal> ' or a
+    '<point>/<texture>/ ' item per face point."""
+    __slots__ = ("indices", "sizes", "with_normals")
+
+    def __init__(self, with_normals):
+        """:with_normals: bool: Whether the items hold a normal index."""
+        self.indices = array.array("i")
+        self.sizes = array.array("i")
+        self.with_normals = with_normals
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            for line in chunk.split("\n"):
+                yield line
+
+    def __repr__(self):
+        return "<FaceLines %s>" % len(self)
+
+    def add(self, points, tex_points, face):
+        """Adds a face line.
+        :points: list of ints: The face point indexes.
+        :tex_points: list of ints: The texture coordinates index of each
+            point.
+        :face: int: The face index, which is also its normal index.
+        """
+        extend = self.indices.extend
+        if self.with_normals:
+            for i, point in enumerate(points):
+                extend((point + 1, tex_points[i] + 1, face + 1))
+        else:
+            for i, point in enumerate(points):
+                extend((point + 1, tex_points[i] + 1))
+        self.sizes.append(len(points))
+
+    def chunks(self, size=4096):
+        """Formats the lines by blocks.
+        :size: int: The maximum number of lines in a block.
+            Defaults to 4096.
+        Yields strings containing up to :size lines joined by new lines.
+        """
+        item_format = "%s/%s/%s " if self.with_normals else "%s/%s/ "
+        width = 3 if self.with_normals else 2
+        line_formats = {}
+        indices = self.indices
+        sizes = self.sizes
+        position = 0
+        for start in xrange(0, len(sizes), size):
+            block_sizes = sizes[start:start + size]
+            for n_points in set(block_sizes).difference(line_formats):
+                line_formats[n_points] = "f " + item_format * n_points
+            block_format = "\n".join([line_formats[n_points] for n_points in block_sizes])
+            end = position + width * sum(block_sizes)
+            yield block_format % tuple(indices[position:end])
+            position = end
+
+
+def read_oti(oti_file_name):
+    """Reads the real texture file names from a .oti file.
     :oti_file_name: string: The .oti file to read texture file names from.
-    Returns a dict like:
-    {"line_index": "alias": "<texture_alias>", "name": "<texture_file_name>"}
+    Returns a list of strings, empty if the file does not exist.
     """
-    print "  * Parsing names"
-    # Read the real texture file names form the file.
     real_names = []
     if os.path.isfile(oti_file_name):
         with open(oti_file_name, "rU") as oti_fd:
             real_names = oti_fd.read().splitlines()
+    return real_names
 
+
+def parse_names(lines, real_names):
+    """Parses the NAMES data.
+    :lines: array of strings: The data to be parsed.
+    :real_names: list of strings: The real texture file names, in the same
+        order than :lines, as found in .oti files.
+    Returns a dict like:
+    {"line_index": "alias": "<texture_alias>", "name": "<texture_file_name>"}
+    """
     names = {}
     for i, line in enumerate(lines):
         name = "."
@@ -435,35 +783,224 @@ def parse_names(lines, oti_file_name):
     return names
 
 
+def plist_tex_names(aliases, materials):
+    """Returns the real texture file names of the NAMES aliases.
+    :aliases: array of strings: The NAMES section data.
+    :materials: dict: The model materials, as found in the
+        'plistindex.load_index' result.
+    Returns a list of strings, in the same order than :aliases.
+    """
+    return [materials.get(alias, alias) for alias in aliases]
+
+
 #------------------------------ CORE FUNCTIONS -------------------------------
-def get_sections(data):
-    """Parses 'data' to get the sections defined in.
-    :data: string: Raw .dat file content.
+class ConversionError(Exception):
+    """Raised when a .dat file can't be converted."""
+    pass
+
+
+# Options used by 'convert' when not given. 'check_cli' builds the program
+# options from these ones.
+DEFAULT_OPTIONS = {"debug": False,
+                   "jobs": 1,
+                   "mmap": True,
+                   "numpy": numpy is not None,
+                   "quantize_uv": None,
+                   "quiet": False,
+                   "stats": None,
+                   "cache": False,
+                   "cache_dir": None,
+                   "cache_size": convcache.DEFAULT_CACHE_SIZE,
+                   "watch": None,
+                   "plist": None,
+                   "meshbin": False}
+
+
+def _no_log(msg):
+    """Default 'log' function: drops :msg."""
+    pass
+
+
+def progress_log(options):
+    """Returns the 'log' function matching 'options': '_no_log' with
+    '--quiet', '_log_stderr' with '--stats', '_log' otherwise.
+    :options: dictionary: Options as returned by 'check_cli'.
+    """
+    if options["quiet"]:
+        return _no_log
+    return _log_stderr if options["stats"] else _log
+
+
+def tokenize_dat(lines):
+    """Scans .dat file lines once, and yields the sections as they are found.
+    Comments ('#' and '//' ones) and empty lines are removed from the
+    sections data.
+    :lines: iterable of strings: The .dat file lines. Can be an opened file.
+    Yields tuples like:
+    (string:section_name, string:arguments, list:data_lines)
+    """
+    name = None
+    arguments = None
+    data = []
+    da = data.append
+    match_section = SECTION_RE.match
+    strip_comment = COMMENT_RE.sub
+    for line in lines:
+        line = line.rstrip("\r\n")
+        res = match_section(line)
+        if res:
+            if name is not None:
+                yield name, arguments, data
+            name, arguments = res.groups()
+            data = []
+            da = data.append
+            continue
+        if name is None:
+            # Nothing to keep before the first section.
+            continue
+        if "#" in line or "//" in line:
+            # Get rid of potential comments at the end of a line.
+            line = strip_comment("", line)
+        if line:
+            da(line)
+    if name is not None:
+        yield name, arguments, data
+
+
+def _data_lines(lines):
+    """Removes comments and empty lines from section data lines.
+    :lines: iterable of strings: The lines to clean.
+    Returns a list of strings.
+    """
+    data = []
+    da = data.append
+    strip_comment = COMMENT_RE.sub
+    for line in lines:
+        if "#" in line or "//" in line:
+            line = strip_comment("", line)
+        if line:
+            da(line)
+    return data
+
+
+class MappedSection(dict):
+    """A section of a memory-mapped .dat file.
+    Behaves like the sections dicts built by 'read_sections', but its 'data'
+    lines are decoded from the mapping only when they are first read.
+    'lines' and 'count_lines' read them without keeping them."""
+
+    def __init__(self, mapping, arguments, start, end):
+        """:mapping: mmap: The mapped .dat file.
+        :arguments: string: What follows the section name.
+        :start: int: Offset of the section data in :mapping.
+        :end: int: Offset of the end of the section data in :mapping."""
+        super(MappedSection, self).__init__(arguments=arguments)
+        self.mapping = mapping
+        self.start = start
+        self.end = end
+
+    def __missing__(self, key):
+        if key != "data":
+            raise KeyError(key)
+        data = self["data"] = self.lines()
+        return data
+
+    def lines(self):
+        """Returns the data lines, decoded again unless already read as
+        'data'."""
+        if "data" in self:
+            return self["data"]
+        return _data_lines(self.mapping[self.start:self.end].splitlines())
+
+    def count_lines(self):
+        """Returns the number of data lines, decoding them by chunks of about
+        MAPPED_CHUNK_SIZE bytes."""
+        count = 0
+        mapping = self.mapping
+        start = self.start
+        while start < self.end:
+            end = mapping.find("\n", min(start + MAPPED_CHUNK_SIZE, self.end) - 1, self.end)
+            end = self.end if end < 0 else end + 1
+            count += len(_data_lines(mapping[start:end].splitlines()))
+            start = end
+        return count
+
+    def get(self, key, default=None):
+        if key == "data":
+            return self[key]
+        return super(MappedSection, self).get(key, default)
+
+
+def map_sections(file_name):
+    """Memory-maps a .dat file and finds the sections defined in.
+    Only the sections offsets are read, see 'MappedSection'.
+    :file_name: string: The .dat file path.
+    Returns an OrderedDict like the one returned by 'read_sections', which
+    is empty if the file is empty or no section could be found.
+    """
+    sections = OrderedDict()
+    with open(file_name, "rb") as in_fd:
+        try:
+            mapping = mmap.mmap(in_fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped.
+            return sections
+    section = None
+    for res in MAPPED_SECTION_RE.finditer(mapping):
+        if section is not None:
+            section.end = res.start()
+        section = MappedSection(mapping, res.group(2), res.end(), len(mapping))
+        sections[res.group(1)] = section
+    if not sections:
+        mapping.close()
+    return sections
+
+
+def unmap_sections(sections):
+    """Closes the memory mapping of sections returned by 'map_sections'.
+    Their data lines can't be read afterwards, unless they were read before.
+    :sections: dictionary: As returned by 'map_sections' or 'read_sections'.
+    """
+    for section in sections.values():
+        if isinstance(section, MappedSection):
+            section.mapping.close()
+
+
+def iter_rows(name, lines):
+    """Converts the data lines of a section in typed rows, one line at a time.
+    :name: string: The section name, used to select the row type in
+        ROW_TYPES.
+    :lines: list of strings: The section data lines, as found by
+        'tokenize_dat'.
+    Returns an iterator over the rows.
+    """
+    row_type = ROW_TYPES.get(name)
+    if row_type is None:
+        return iter(lines)
+    return (row_type(line) for line in lines)
+
+
+def read_sections(lines):
+    """Reads the sections defined in .dat file lines.
+    :lines: iterable of strings: The .dat file lines. Can be an opened file.
     Returns an OrderedDict like:
     {"SECTION_NAME": {"arguments": "what follows SECTION_NAME",
                       "data": [list of lines in section data]}}
     """
-    print "  * Extracting sections"
     sections = OrderedDict()
+    for name, arguments, data in tokenize_dat(lines):
+        sections[name] = {"arguments": arguments, "data": data}
+    return sections
 
-    results = re.finditer(r"^([A-Z][A-Z]+)([ ]+.*)?$", data, re.M)
-    data_start = None
-    data_end = None
-    prev_section = None
-    cur_section = None
-    for res in results:
-        print "    * Found", res.groups()[0]
-        data_end = res.start()
-        if prev_section is not None:
-            # Get rid of potential comments at the end of a line.
-            _data = re.sub(r"\s*#.*", "", data[data_start:data_end])
-            sections[prev_section]["data"] = filter(None, _data.splitlines())
-        data_start = res.end()
-        cur_section = res.groups()[0]
-        sections[cur_section] = {"arguments": res.groups()[1], "data": ""}
-        prev_section = "%s" % cur_section # Only to be sure we get a brand new string...
 
-    return sections
+def get_sections(data):
+    """Parses 'data' to get the sections defined in.
+    :data: string: Raw .dat file content.
+    Returns an OrderedDict like:
+    {"SECTION_NAME": {"arguments": "what follows SECTION_NAME",
+                      "data": [list of lines in section data]}}
+    """
+    return read_sections(data.splitlines())
 
 
 def update_tex_map(tex_map, tex_keys):
@@ -480,11 +1017,47 @@ def update_tex_map(tex_map, tex_keys):
     return tex_map
 
 
+def _write_lines(fd_out, lines, size=WRITE_CHUNK_LINES):
+    """Writes lines separated by new lines, :size lines at once.
+    No new line is written after the last line.
+    :fd_out: file object: Where to write the lines.
+    :lines: list of strings, VectorLines or FaceLines: The lines to write.
+    :size: int: Number of lines joined in one write.
+        Defaults to WRITE_CHUNK_LINES.
+    """
+    if isinstance(lines, (VectorLines, FaceLines)):
+        chunks = lines.chunks(size)
+    else:
+        chunks = ("\n".join(lines[start:start + size])
+                  for start in xrange(0, len(lines), size))
+    write = fd_out.write
+    separator = ""
+    for chunk in chunks:
+        write(separator)
+        write(chunk)
+        separator = "\n"
+
+
 def write_obj(output_file_name, obj_name, mtl_lib_file, tex_lines,
               tex_map, n_verts, vertex_lines, n_normals,
               normals_lines, n_faces, faces_groups):
-    """Builds the data and writes the .obj file.
+    """Writes the .obj file.
     :output_file_name: string: File path to be written.
+    See 'stream_obj' for the other arguments.
+    """
+    with open(output_file_name, "w", WRITE_BUFFER_SIZE) as fd_out:
+        stream_obj(fd_out, obj_name, mtl_lib_file, tex_lines, tex_map,
+                   n_verts, vertex_lines, n_normals, normals_lines, n_faces,
+                   faces_groups)
+
+
+def stream_obj(fd_out, obj_name, mtl_lib_file, tex_lines,
+               tex_map, n_verts, vertex_lines, n_normals,
+               normals_lines, n_faces, faces_groups):
+    """Writes the .obj data to a file object.
+    The data is streamed by chunks, no full copy of the file content is built
+    in memory.
+    :fd_out: file object: Where to write the data.
     :obj_name: string: The object name.
     :mtl_lib_file: string: The .mtl file name.
     :tex_lines: list of strings: The texture data.
@@ -494,37 +1067,27 @@ def write_obj(output_file_name, obj_name, mtl_lib_file, tex_lines,
     :n_normals: int: Number of normals.
     :normals_lines: list of strings: Normals data.
     :n_faces: int: Number of faces.
-    :faces_groups: dictionary: Faces data groupped by texture index.
+    :faces_groups: dictionary: Faces data groupped by texture index, as
+        FaceLines or lists of strings.
     """
+    fd_out.write(OBJ_HEADER_TEMPLATE.format(header=COMMON_HEADER,
+                                            mtl_lib_file=mtl_lib_file,
+                                            obj_name=obj_name,
+                                            n_verts=n_verts,
+                                            n_faces=n_faces,
+                                            n_norms=n_normals))
+    for lines in (vertex_lines, tex_lines, normals_lines):
+        _write_lines(fd_out, lines)
+        fd_out.write("\n")
 
-    def _join(lns):
-        """Joins lines.
-        :lns: list of strings: Lines to join.
-        Returns joined lines as string.
-        """
-        return "\n".join(lns)
-
-    # Rebuild the faces data first.
-    faces = ""
     for idx, lines in faces_groups.items():
         # Get the texture 'alias' or use a default value
         tex_name = _get_tex_name(tex_map, idx)
-        faces += FACES_TEMPLATE.format(obj_name=obj_name, tex_name=tex_name,
-                                       faces_lines=_join(lines))
-
-    # 'Apply' data to the template.
-    with open(output_file_name, "w") as fd_out:
-        fd_out.write(OBJ_TEMPLATE.format(header=COMMON_HEADER,
-                                         mtl_lib_file=mtl_lib_file,
-                                         obj_name=obj_name,
-                                         n_verts=n_verts,
-                                         n_faces=n_faces,
-                                         n_norms=n_normals,
-                                         vertex_lines=_join(vertex_lines),
-                                         tex_lines=_join(tex_lines),
-                                         norms_lines=_join(normals_lines),
-                                         faces_lines=faces))
-        print "  * Saved '%s'." % output_file_name
+        fd_out.write(FACES_HEADER_TEMPLATE.format(obj_name=obj_name,
+                                                  tex_name=tex_name))
+        _write_lines(fd_out, lines)
+        fd_out.write("\n")
+    fd_out.write("\n\n")
 
 
 def write_mtl(output_file_name, tex_map):
@@ -532,6 +1095,15 @@ def write_mtl(output_file_name, tex_map):
     :output_file_name: string: File path to be written.
     :tex_map: dict: Texture map to find texture file names.
     """
+    with open(output_file_name, "w") as fd_out:
+        stream_mtl(fd_out, tex_map)
+
+
+def stream_mtl(fd_out, tex_map):
+    """Builds the .mtl data and writes it to a file object.
+    :fd_out: file object: Where to write the data.
+    :tex_map: dict: Texture map to find texture file names.
+    """
 
     def _build_entry(_tex_map, _idx="0"):
         """Builds a .mtl file entry.
@@ -552,108 +1124,622 @@ def write_mtl(output_file_name, tex_map):
         # Let define a default material when there's no map at all.
         materials += _build_entry(tex_map)
 
-    with open(output_file_name, "w") as fd_out:
-        fd_out.write(MATERIAL_TEMPLATE.format(header=COMMON_HEADER,
-                                              mat_num=mat_num,
-                                              materials=materials))
-    print "  * Saved '%s'." % output_file_name
+    fd_out.write(MATERIAL_TEMPLATE.format(header=COMMON_HEADER,
+                                          mat_num=mat_num,
+                                          materials=materials))
+
+
+class DatGeometry(object):
+    """The typed content of the .dat sections, kept in compact arrays.
+    Recorded by 'parse_sections' while it parses the text, then written to a
+    .mbin file. When read back from such a file, 'parse_sections' takes the
+    sections content from it instead of parsing the text again."""
+
+    def __init__(self, mesh=None, use_numpy=numpy is not None):
+        """:mesh: meshbin.MeshBin: The data read back from a .mbin file. Its
+            arrays can be array.array or read-only NumPy ones.
+            Defaults to None: the data will be recorded.
+        :use_numpy: bool: Whether to give the VERTEX and NORMALS coordinates
+            read back as NumPy arrays. Defaults to True when NumPy is
+            installed."""
+        self.loaded = mesh is not None
+        self.use_numpy = use_numpy and numpy is not None
+        if mesh is None:
+            self.n_sections = 0
+            self.names = []
+            self.tex_names = []
+            self.arrays = OrderedDict(
+                [("VERTEX", array.array("d")), ("NORMALS", array.array("d")),
+                 ("texture_ids", array.array("i")),
+                 ("texture_counts", array.array("i")),
+                 ("texture_points", array.array("d")),
+                 ("face_counts", array.array("i")),
+                 ("face_points", array.array("i"))])
+        else:
+            self.n_sections = mesh.meta["sections"]
+            self.names = mesh.names[:mesh.meta["names"]]
+            self.tex_names = mesh.names[mesh.meta["names"]:]
+            self.arrays = mesh.arrays
+
+    def to_meshbin(self):
+        """Returns the recorded data as a meshbin.MeshBin object."""
+        return meshbin.MeshBin(MESHBIN_KIND, MESHBIN_VERSION,
+                               {"sections": self.n_sections,
+                                "names": len(self.names)},
+                               self.names + self.tex_names, self.arrays.items())
+
+    def typed(self, name, data):
+        """Records the typed content of a section, or replays it.
+        :name: string: The section name.
+        :data: The section content: the NAMES lines, the TEXTURES and FACES
+            rows as given by 'iter_rows', or the VERTEX and NORMALS
+            coordinates as given by '_vector_coordinates'. Not read when the
+            content is replayed.
+        Returns the same content, or the one read back from the .mbin file.
+        """
+        return getattr(self, "_%s_%s" % ("replay" if self.loaded else "record",
+                                         name.lower()))(name, data)
+
+    def _record_names(self, name, lines):
+        """Records the NAMES lines."""
+        del name
+        self.names = list(lines)
+        return lines
+
+    def _replay_names(self, name, lines):
+        """Returns the NAMES lines read back."""
+        del name, lines
+        return self.names
+
+    def _record_vectors(self, name, coordinates):
+        """Records VERTEX or NORMALS coordinates."""
+        values = self.arrays[name]
+        if numpy is not None and isinstance(coordinates, numpy.ndarray):
+            values.fromstring(numpy.ascontiguousarray(coordinates, numpy.float64).tostring())
+        else:
+            values.extend(chain.from_iterable(coordinates))
+        return coordinates
+
+    def _replay_vectors(self, name, coordinates):
+        """Returns VERTEX or NORMALS coordinates read back, like
+        '_vector_coordinates' does."""
+        del coordinates
+        values = self.arrays[name]
+        if self.use_numpy:
+            if not isinstance(values, numpy.ndarray):
+                values = numpy.frombuffer(values, numpy.float64)
+            return values.reshape(-1, 3)
+        return zip(*[iter(values.tolist())] * 3)
+
+    _record_vertex = _record_normals = _record_vectors
+    _replay_vertex = _replay_normals = _replay_vectors
+
+    def _record_textures(self, name, rows):
+        """Records the TEXTURES rows while they are read."""
+        del name
+        ids = {}
+        id_append = self.arrays["texture_ids"].append
+        count_append = self.arrays["texture_counts"].append
+        points_extend = self.arrays["texture_points"].extend
+        for tex_name, points in rows:
+            if tex_name not in ids:
+                ids[tex_name] = len(self.tex_names)
+                self.tex_names.append(tex_name)
+            id_append(ids[tex_name])
+            count_append(len(points))
+            points_extend(chain.from_iterable(points))
+            yield tex_name, points
+
+    def _replay_textures(self, name, rows):
+        """Yields the TEXTURES rows read back, like '_texture_row' builds
+        them."""
+        del name, rows
+        points = self.arrays["texture_points"]
+        start = 0
+        for tex_id, count in zip(self.arrays["texture_ids"].tolist(),
+                                 self.arrays["texture_counts"].tolist()):
+            end = start + 2 * count
+            values = points[start:end].tolist()
+            yield self.tex_names[tex_id], zip(values[0::2], values[1::2])
+            start = end
+
+    def _record_faces(self, name, rows):
+        """Records the FACES rows while they are read. Lines without face
+        definition are recorded with a -1 count."""
+        del name
+        count_append = self.arrays["face_counts"].append
+        points_extend = self.arrays["face_points"].extend
+        for row in rows:
+            if row is None:
+                count_append(-1)
+            else:
+                count_append(len(row))
+                points_extend(row)
+            yield row
+
+    def _replay_faces(self, name, rows):
+        """Yields the FACES rows read back, like '_face_row' builds them."""
+        del name, rows
+        points = self.arrays["face_points"]
+        start = 0
+        for count in self.arrays["face_counts"].tolist():
+            if count < 0:
+                yield None
+            else:
+                yield points[start:start + count].tolist()
+                start += count
+
+
+def parse_sections(sections, tex_names=None, options=None, log=None,
+                   dump=None, stats=None, geometry=None):
+    """Checks and parses .dat file sections.
+    :sections: dictionary: As returned by 'read_sections' or 'map_sections'.
+        The data lines of each section are dropped once it is parsed.
+    :tex_names: list of strings: The real texture file names, in the NAMES
+        section order. Defaults to None.
+    :options: dictionary: See DEFAULT_OPTIONS. Defaults to None.
+    :log: callable: Called with each progress message. Defaults to None.
+    :dump: callable: Called with a file extension and a dict of internal data
+        after each step, like 'write_dump_file'. Defaults to None.
+    :stats: convstats.FileStats: Records the parsing stages. Defaults to None.
+    :geometry: DatGeometry: Records the typed content of the sections. If
+        it was read back from a .mbin file, the content is taken from it
+        and :sections is neither checked nor read. Defaults to None.
+    Returns a dict holding the 'stream_obj' keyword arguments, but
+    'obj_name' and 'mtl_lib_file'.
+    Raises ConversionError if the sections are not consistent.
+    """
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    log = log or _no_log
+    stats = stats or convstats.NULL_STATS
+
+    stats.stage("check")
+    if dump:
+        for section in sections.values():
+            # Mapped sections are decoded only when their data is read.
+            section.get("data")
+        dump("sec", {"sections": sections})
+
+    # Magically call the 'check' functions
+    for name in sections.keys():
+        f_name = "check_%s" % name.lower()
+        if f_name in globals().keys():
+            log("  * Checking %s" % name)
+            if not globals()[f_name](sections):
+                raise ConversionError("Number of entries in '%s' section is different "
+                                      "as declared!" % name)
+
+    def get_data(name, sections=sections):
+        """Returns the 'data' object from the 'name' one found in the
+        'sections' one.
+        :sections: dictionary: Object returned by 'read_sections'.
+        :name: string: The name of the section to get the 'data'.
+        Returns a list of 'lines'.
+        """
+        section = sections.get(name, {})
+        if isinstance(section, MappedSection):
+            # Not kept once parsed.
+            return section.lines()
+        return section.get("data", [])
+
+    def get_rows(name):
+        """Returns the typed rows of the 'name' section.
+        :name: string: The name of the section to get the rows.
+        Returns an iterator over the rows.
+        """
+        return iter_rows(name, get_data(name))
+
+    def release(name):
+        """Drops the data lines of the 'name' section once it is parsed, so
+        they are not kept while the next sections are parsed.
+        :name: string: The name of the section to release.
+        """
+        section = sections.get(name)
+        if section is not None:
+            section.pop("data", None)
+
+    def typed(name, data):
+        """Records or replays the typed content of the 'name' section, see
+        'DatGeometry.typed'."""
+        if geometry is None:
+            return data
+        return geometry.typed(name, data)
+
+    n_sections = len(sections)
+    if geometry is not None:
+        if geometry.loaded:
+            n_sections = geometry.n_sections
+        else:
+            geometry.n_sections = n_sections
+
+    log("  * Parsing names")
+    stats.stage("parse_names")
+    tex_map = parse_names(typed("NAMES", get_data("NAMES")), tex_names or [])
+    release("NAMES")
+
+    log("  * Parsing textures")
+    stats.stage("parse_textures")
+    tex_refs, tex_lines_out = parse_textures(typed("TEXTURES", get_rows("TEXTURES")),
+                                             options["quantize_uv"])
+    release("TEXTURES")
+
+    if dump:
+        dump("tex", {"tex_refs": tex_refs,
+                     "tex_lines_out": tex_lines_out})
+
+    # Update the tex_map object if textures indexes and names are both
+    # used in 'TEXTURES'.
+    if  sorted(tex_map.keys()) != sorted(tex_refs.get("named").keys()):
+        tex_map = update_tex_map(tex_map,
+                                 set(tex_refs["named"].keys()).difference(tex_map.keys()))
+
+    if dump:
+        dump("txm", {"tex_map": tex_map})
+
+    # With NumPy, VERTEX and NORMALS are parsed in arrays sized from NVERTS.
+    n_declared = None
+    if options["numpy"] and "NVERTS" in sections:
+        n_declared = int(sections["NVERTS"]["arguments"].split()[0])
+
+    log("  * Parsing vertex")
+    stats.stage("parse_vertex")
+    n_verts, vertex_lines_out = _format_vn(
+        typed("VERTEX", _vector_coordinates(get_data("VERTEX"), n_declared)),
+        VERTEX_FORMAT)
+    release("VERTEX")
+
+    if dump:
+        dump("ver", {"n_verts": n_verts,
+                     "vertex_lines_out": list(vertex_lines_out)})
+
+    log("  * Parsing normals")
+    stats.stage("parse_normals")
+    n_normals, normals_lines_out = _format_vn(
+        typed("NORMALS", _vector_coordinates(get_data("NORMALS"), n_declared)),
+        NORMALS_FORMAT)
+    release("NORMALS")
+
+    if dump:
+        dump("nor", {"n_normals": n_normals,
+                     "normals_lines_out": list(normals_lines_out)})
+
+    log("  * Parsing faces")
+    stats.stage("parse_faces")
+    n_faces, faces_groups = parse_faces(typed("FACES", get_rows("FACES")), tex_refs,
+                                        normals_lines_out)
+    release("FACES")
+
+    if dump:
+        dump("fac", {"n_faces": n_faces,
+                     "faces_groups": OrderedDict((tex_name, list(lines))
+                                                 for tex_name, lines in faces_groups.items())})
+
+    stats.end()
+    stats.count("sections", n_sections)
+    stats.count("materials", len(tex_map))
+    stats.count("vertices", n_verts)
+    stats.count("normals", n_normals)
+    stats.count("texture_coordinates", len(tex_lines_out))
+    stats.count("faces", n_faces)
+    stats.count("face_groups", len(faces_groups))
+
+    return {"tex_lines": tex_lines_out,
+            "tex_map": tex_map,
+            "n_verts": n_verts,
+            "vertex_lines": vertex_lines_out,
+            "n_normals": n_normals,
+            "normals_lines": normals_lines_out,
+            "n_faces": n_faces,
+            "faces_groups": faces_groups}
+
+
+def convert(data, tex_names=None, obj_name="model", mtl_lib_file=None,
+            obj_out=None, mtl_out=None, options=None, log=None, stats=None,
+            materials=None, dump=None, geometry=None):
+    """Converts .dat content to .obj and .mtl content.
+    Nothing is read from or written to the disk but through :data, :obj_out
+    and :mtl_out, and nothing is printed but through :log.
+    :data: string, iterable of strings or dictionary: The .dat file content
+        or lines, or its sections as returned by 'read_sections' or
+        'map_sections'.
+    :tex_names: list of strings: The real texture file names, in the NAMES
+        section order, like in .oti files. Defaults to None.
+    :obj_name: string: The object name. Defaults to 'model'.
+    :mtl_lib_file: string: The .mtl file name written in the .obj data.
+        Defaults to :obj_name with the 'mtl' extension.
+    :obj_out: file object: Where to write the .obj data. Defaults to None.
+    :mtl_out: file object: Where to write the .mtl data. Defaults to None.
+    :options: dictionary: See DEFAULT_OPTIONS. Defaults to None.
+    :log: callable: Called with each progress message. Defaults to None.
+    :stats: convstats.FileStats: Records the conversion stages.
+        Defaults to None.
+    :materials: dict: The model materials, as found in the
+        'plistindex.load_index' result. When given, the texture file names
+        are found from the NAMES aliases instead of :tex_names.
+        Defaults to None.
+    :dump: callable: See 'parse_sections'. Defaults to None.
+    :geometry: DatGeometry: See 'parse_sections'. If it was read back from
+        a .mbin file, :data is not read. Defaults to None.
+    Returns a tuple:
+    (string:obj_data, string:mtl_data)
+    Each element is None if the corresponding file object was given.
+    Raises ConversionError if :data can't be converted.
+    """
+    log = log or _no_log
+    stats = stats or convstats.NULL_STATS
+    if geometry is not None and geometry.loaded:
+        sections = OrderedDict()
+    else:
+        if isinstance(data, dict):
+            sections = data
+        else:
+            stats.stage("read_sections")
+            if isinstance(data, basestring):
+                data = data.splitlines()
+            log("  * Extracting sections")
+            sections = read_sections(data)
+            stats.end()
+        for name in sections:
+            log("    * Found %s" % name)
+        if not sections:
+            raise ConversionError("Nothing could be read.\nIs this Oolite .dat data?")
+
+    if materials is not None:
+        log("  * Texture names from the plist materials")
+        if geometry is not None and geometry.loaded:
+            aliases = geometry.names
+        else:
+            aliases = sections.get("NAMES", {}).get("data", [])
+        tex_names = plist_tex_names(aliases, materials)
+    model = parse_sections(sections, tex_names, options, log, dump, stats, geometry)
+
+    stats.stage("write")
+    if mtl_lib_file is None:
+        mtl_lib_file = os.path.extsep.join((obj_name, "mtl"))
+    obj_buf = StringIO() if obj_out is None else None
+    mtl_buf = StringIO() if mtl_out is None else None
+    stream_obj(obj_out or obj_buf, obj_name, mtl_lib_file, **model)
+    stream_mtl(mtl_out or mtl_buf, model["tex_map"])
+    stats.end()
+    return (obj_buf.getvalue() if obj_buf else None,
+            mtl_buf.getvalue() if mtl_buf else None)
+
+
+def convert_file(input_file_name, options, stats=None, log=None):
+    """Converts a .dat file to .obj and .mtl ones written alongside it.
+    The files are opened here, the conversion itself is left to 'convert'.
+    :input_file_name: string: The .dat file path.
+    :options: dictionary: Options as returned by 'check_cli'.
+    :stats: convstats.FileStats: Records the conversion stages.
+        Defaults to None.
+    :log: callable: Progress messages printing function. Defaults to the
+        one 'progress_log' returns for 'options'.
+    Raises ConversionError if the file can't be converted.
+    """
+    log = log or progress_log(options)
+    stats = stats or convstats.NULL_STATS
+    log("* Reading %s" % input_file_name)
+    file_base_name = os.path.splitext(os.path.basename(input_file_name))[0]
+    file_dir_name = os.path.dirname(input_file_name)
+    oti_file_name = build_file_path(file_dir_name, file_base_name, "oti")
+    output_file_name = build_file_path(file_dir_name,
+                                       file_base_name, 'obj')
+    material_file_name = build_file_path(file_dir_name,
+                                         file_base_name, 'mtl')
+    mtl_lib_file = os.path.basename(material_file_name)
+    output_file_names = [output_file_name, material_file_name]
+    materials = None
+    if options["plist"]:
+        stats.stage("plist")
+        materials = plistindex.load_index(options["plist"], options["cache_dir"],
+                                          options["cache"]).get(file_base_name + ".dat")
+        stats.end()
+
+    cache = cache_key = None
+    if options["cache"] and not options["debug"]:
+        # Debug dumps are written by the conversion: always convert.
+        stats.stage("cache")
+        cache = convcache.ConversionCache(options["cache_dir"],
+                                          options["cache_size"])
+        cache_key = cache.key(__prog_name__, __version__, input_file_name,
+                              [] if materials is not None else [oti_file_name],
+                              {"quantize_uv": options["quantize_uv"],
+                               "materials": materials},
+                              [__file__])
+        hit = cache.restore(cache_key, output_file_names)
+        stats.end()
+        stats.count("cache_hit", int(hit))
+        if hit:
+            for file_name in output_file_names:
+                stats.add_output(file_name)
+                log("  * Restored '%s' from cache." % file_name)
+            return
+
+    mbin_file_name = meshbin.file_name(input_file_name, MESHBIN_KIND)
+    geometry = source = None
+    if options["meshbin"] and not options["debug"]:
+        # Like the cache, not used when dumping the sections.
+        stats.stage("meshbin")
+        source = meshbin.source_info(input_file_name)
+        # With NumPy, the arrays are used in place from the mapped file.
+        mesh = meshbin.load(mbin_file_name, MESHBIN_KIND, MESHBIN_VERSION, source,
+                            in_place=options["numpy"])
+        geometry = DatGeometry(mesh, options["numpy"])
+        stats.end()
+
+    sections = OrderedDict()
+    if geometry is not None and geometry.loaded:
+        log("  * Reading parsed sections from '%s'" % mbin_file_name)
+    else:
+        log("  * Extracting sections")
+        # Sections are split while the file is read: both are a single stage.
+        stats.stage("read_sections")
+        if options["mmap"]:
+            sections = map_sections(input_file_name)
+        if not sections:
+            # Also catches files using other line ends than the system ones.
+            with open(input_file_name, 'rU') as in_fd:
+                sections = read_sections(in_fd)
+        stats.end()
+
+    def dump(ext, datas):
+        """Writes a dump file alongside the .dat one. See 'write_dump_file'.
+        """
+        write_dump_file(file_dir_name, file_base_name, ext, datas)
+
+    tex_names = read_oti(oti_file_name) if materials is None else None
+    # The outputs are written aside, and replace the previous ones only once
+    # complete.
+    partial_file_names = [convcache.partial_name(file_name)
+                          for file_name in output_file_names]
+    try:
+        with open(partial_file_names[0], "w", WRITE_BUFFER_SIZE) as obj_out:
+            with open(partial_file_names[1], "w") as mtl_out:
+                convert(sections, tex_names, file_base_name, mtl_lib_file,
+                        obj_out, mtl_out, options, log, stats, materials,
+                        dump if options["debug"] else None, geometry)
+    except:
+        for file_name in partial_file_names:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        raise
+    finally:
+        unmap_sections(sections)
+
+    stats.stage("write")
+    for partial_file_name, file_name in zip(partial_file_names, output_file_names):
+        if cache:
+            # Files already holding the same content are left untouched.
+            convcache.replace_if_changed(partial_file_name, file_name)
+        else:
+            if os.path.exists(file_name):
+                # 'os.rename' doesn't replace existing files on Windows.
+                os.remove(file_name)
+            os.rename(partial_file_name, file_name)
+        stats.add_output(file_name)
+        log("  * Saved '%s'." % file_name)
+
+    if geometry is not None and not geometry.loaded:
+        stats.stage("meshbin")
+        geometry.to_meshbin().write(mbin_file_name, source)
+        stats.add_output(mbin_file_name)
+        log("  * Saved '%s'." % mbin_file_name)
+
+    if cache:
+        stats.stage("cache")
+        cache.store(cache_key, output_file_names)
+    stats.end()
+
+
+def _worker_log(input_file_name, options):
+    """Returns the 'log' function of a process pool worker: each message is
+    prefixed with the input file name and written as a whole line, so the
+    messages of concurrent conversions don't get mixed up.
+    :input_file_name: string: The converted file path.
+    :options: dictionary: Options as returned by 'check_cli'.
+    """
+    if options["quiet"]:
+        return _no_log
+    std = sys.stderr if options["stats"] else sys.stdout
+
+    def worker_log(msg):
+        """Prints 'msg' after the input file name."""
+        std.write("%s: %s\n" % (input_file_name, msg))
+        std.flush()
+    return worker_log
+
+
+def _convert_job(job):
+    """Converts a file and catches the errors. Used by 'main', possibly as a
+    process pool worker.
+    :job: tuple: (string:input_file_name, dict:options, bool:pooled). The
+        progress messages are prefixed with the file name when 'pooled'.
+    Returns a tuple:
+    (string:input_file_name, string:error_message_or_None, float:seconds,
+     dict:statistics_or_None)
+    """
+    input_file_name, options, pooled = job
+    log = _worker_log(input_file_name, options) if pooled else None
+    start = time.time()
+    error = None
+    stats = None
+    if options["stats"]:
+        stats = convstats.FileStats(__prog_name__, input_file_name)
+    try:
+        convert_file(input_file_name, options, stats, log)
+    except Exception as exc:  # pylint: disable=broad-except
+        # One bad file must not stop the whole batch.
+        error = " ".join(("%s: %s" % (exc.__class__.__name__, exc)).splitlines())
+    record = None
+    if stats:
+        stats.finish(error)
+        record = stats.as_dict()
+    return input_file_name, error, time.time() - start, record
+
+
+def convert_files(input_file_names, options):
+    """Converts files, possibly on a process pool, then prints the summary
+    and the statistics as asked by 'options'.
+    :input_file_names: list of strings: The .dat file paths.
+    :options: dictionary: Options as returned by 'check_cli'.
+    Returns the number of files which could not be converted.
+    """
+    n_jobs = options["jobs"] or multiprocessing.cpu_count()
+    pooled = n_jobs > 1 and len(input_file_names) > 1
+    jobs = [(input_file_name, options, pooled) for input_file_name in input_file_names]
+    if pooled:
+        pool = multiprocessing.Pool(min(n_jobs, len(jobs)))
+        try:
+            results = pool.map(_convert_job, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_convert_job(job) for job in jobs]
+
+    if not options["quiet"]:
+        convstats.print_summary(results, sys.stderr if options["stats"] else sys.stdout)
+    if options["stats"]:
+        for result in results:
+            convstats.emit(result[3], options["stats"])
+    return len([result for result in results if result[1]])
+
+
+def dat_dependencies(input_file_name, plist_file_name=None):
+    """Returns the files a .dat file conversion depends on.
+    :input_file_name: string: The .dat file path.
+    :plist_file_name: string: The '--plist' file path. Defaults to None.
+    Returns a list of strings.
+    """
+    file_base_name = os.path.splitext(os.path.basename(input_file_name))[0]
+    dependencies = [build_file_path(os.path.dirname(input_file_name),
+                                    file_base_name, "oti")]
+    if plist_file_name:
+        dependencies.append(plist_file_name)
+    return dependencies
 
 
 def main():
     """Main function of the program."""
-    print "=" * 78
-    print "%s %s" % (__prog_name__, __version__)
-    debug, input_file_names = check_cli()
-    if not input_file_names:
+    options, input_file_names = check_cli()
+    log = progress_log(options)
+    log("=" * 78)
+    log("%s %s" % (__prog_name__, __version__))
+    if not (input_file_names or options["watch"]):
         _error("No input file name found!\n\n%s" % __help__)
-    for input_file_name in input_file_names:
-        print "* Reading", input_file_name
-        file_base_name = os.path.splitext(os.path.basename(input_file_name))[0]
-        file_dir_name = os.path.dirname(input_file_name)
-        sections = {}
-        tex_map = {}
-        with open(input_file_name, 'rU') as in_fd:
-            sections = get_sections(in_fd.read())
-
-            if debug:
-                write_dump_file(file_dir_name, file_base_name, "sec",
-                                {"sections": sections})
-
-            if not sections:
-                _error("Nothing could be read from '%s'.\nIs this an Oolite .dat file?" \
-                       % input_file_name)
-
-        # Magically call the 'check' functions
-        for name in sections.keys():
-            f_name = "check_%s" % name.lower()
-            if f_name in globals().keys():
-                if not globals()[f_name](sections):
-                    _error("Number of entries in '%s' section is different as declared!" % name)
-
-        def get_data(name, sections=sections):
-            """Returns the 'data' object from the 'name' one found in the
-            'sections' one.
-            :sections: dictionary: Object returned by 'get_sections'.
-            :name: string: The name of the section to get the 'data'.
-            Returns a list of 'lines'.
-            """
-            return sections.get(name, {}).get("data", [])
-
-        oti_file_name = build_file_path(file_dir_name, file_base_name, "oti")
-        tex_map = parse_names(get_data("NAMES"), oti_file_name)
-
-        tex_refs, tex_lines_out = parse_textures(get_data("TEXTURES"))
-
-        if debug:
-            write_dump_file(file_dir_name, file_base_name, "tex",
-                            {"tex_refs": tex_refs,
-                             "tex_lines_out": tex_lines_out})
-
-        # Update the tex_map object if textures indexes and names are both
-        # used in 'TEXTURES'.
-        if  sorted(tex_map.keys()) != sorted(tex_refs.get("named").keys()):
-            tex_map = update_tex_map(tex_map,
-                                     set(tex_refs["named"].keys()).difference(tex_map.keys()))
-
-        if debug:
-            write_dump_file(file_dir_name, file_base_name, "txm",
-                            {"tex_map": tex_map})
-
-        n_verts, vertex_lines_out = parse_vertex(get_data("VERTEX"))
-
-        if debug:
-            write_dump_file(file_dir_name, file_base_name, "ver",
-                            {"n_verts": n_verts,
-                             "vertex_lines_out": vertex_lines_out})
-
-        n_normals, normals_lines_out = parse_normals(get_data("NORMALS"))
-
-        if debug:
-            write_dump_file(file_dir_name, file_base_name, "nor",
-                            {"n_normals": n_normals,
-                             "normals_lines_out": normals_lines_out})
-
-        n_faces, faces_groups = parse_faces(get_data("FACES"), tex_refs,
-                                            normals_lines_out)
-
-        if debug:
-            write_dump_file(file_dir_name, file_base_name, "fac",
-                            {"n_faces": n_faces,
-                             "faces_groups": faces_groups})
-
-        output_file_name = build_file_path(file_dir_name,
-                                           file_base_name, 'obj')
-        material_file_name = build_file_path(file_dir_name,
-                                             file_base_name, 'mtl')
-        mtl_lib_file = os.path.basename(material_file_name)
-
-        write_obj(output_file_name, file_base_name, mtl_lib_file,
-                  tex_lines_out, tex_map, n_verts, vertex_lines_out,
-                  n_normals, normals_lines_out, n_faces, faces_groups)
-
-        write_mtl(material_file_name, tex_map)
-
-        _exit("* Done")
+    failed = 0
+    if input_file_names:
+        failed = convert_files(input_file_names, options)
+    if options["watch"]:
+        watcher = convwatch.Watcher(options["watch"], (".dat",), (".oti",),
+                                    lambda name: dat_dependencies(name, options["plist"]),
+                                    lambda names: convert_files(names, options),
+                                    log=log,
+                                    extra_file_names=filter(None, [options["plist"]]))
+        watcher.run()
+    if failed:
+        _error("%s file(s) could not be converted." % failed)
+    log("* Done")
 
 
 #--------------------------------- BOOTSTRAP ---------------------------------
@@ -0,0 +1,713 @@
+#!/usr/bin/python
+#
+# -*- coding: utf-8 -*-
+#
+"""
+Array backed mesh data model shared by the converters, with readers and
+writers for Oolite .dat, Wavefront .obj/.mtl and Meshwork .mesh files.
+
+A 'Mesh' keeps its geometry as a struct of arrays instead of lists of tuples:
+
+* per vertex: 'positions', 'normals' and 'tangents', 3 float64 values each;
+* per face: 'face_sizes' (the number of corners), 'material_ids' and
+  'face_normals' (3 float64 values);
+* per face corner: 'indices' (the vertex index) and 'uvs' (2 float64
+  values).
+
+'normals', 'tangents', 'face_normals' and 'uvs' may be empty. 'materials'
+lists the material names, usually texture file names. An empty name means
+"no texture".
+
+Coordinates follow the .dat conventions. The .obj reader and writer negate
+the x coordinates and flip the v texture coordinates, like dat2obj.py and
+Obj2DatTexNorm.py. .mesh texture coordinates are mapped like Mesh2Obj.py
+reads them: u = 1 - u_mesh, v = v_mesh.
+
+One vertex takes 24 bytes for its position, and 24 more for its normal and
+its tangent if any. One face corner takes 4 bytes, and 16 more for its
+texture coordinates.
+"""
+
+import os
+import re
+import math
+import array
+from itertools import chain
+
+
+# Section header in .dat files, like 'NVERTS 42' or 'VERTEX'.
+SECTION_RE = re.compile(r"([A-Z][A-Z]+)([ ]+.*)?$")
+
+# Comment at the end of a .dat line.
+COMMENT_RE = re.compile(r"\s*(#|//).*")
+
+# Number of lines joined and written at once.
+WRITE_CHUNK_LINES = 4096
+
+
+class MeshError(ValueError):
+    """Raised when a mesh file can't be read."""
+    pass
+
+
+class Mesh(object):
+    """A polygon mesh kept in flat arrays. See the module documentation."""
+    __slots__ = ("positions", "normals", "tangents", "face_sizes",
+                 "material_ids", "face_normals", "indices", "uvs", "materials")
+
+    def __init__(self):
+        self.positions = array.array("d")
+        self.normals = array.array("d")
+        self.tangents = array.array("d")
+        self.face_sizes = array.array("I")
+        self.material_ids = array.array("I")
+        self.face_normals = array.array("d")
+        self.indices = array.array("I")
+        self.uvs = array.array("d")
+        self.materials = []
+
+    def __repr__(self):
+        return "<Mesh %s vertices, %s faces, %s materials>" % (
+            self.n_vertices, self.n_faces, len(self.materials))
+
+    @property
+    def n_vertices(self):
+        """The number of vertices."""
+        return len(self.positions) // 3
+
+    @property
+    def n_faces(self):
+        """The number of faces."""
+        return len(self.face_sizes)
+
+    def vertex(self, index):
+        """Returns the (x, y, z) position of a vertex."""
+        return tuple(self.positions[3 * index:3 * index + 3])
+
+    def material_id(self, name):
+        """Returns the index of a material, adding it if needed.
+        :name: string: The material name.
+        """
+        try:
+            return self.materials.index(name)
+        except ValueError:
+            self.materials.append(name)
+            return len(self.materials) - 1
+
+    def faces(self):
+        """Yields a (int:material_id, int:first_corner, int:size) tuple for
+        each face. The face vertices are
+        'indices[first_corner:first_corner + size]'."""
+        corner = 0
+        for material_id, size in zip(self.material_ids, self.face_sizes):
+            yield material_id, corner, size
+            corner += size
+
+    def triangles(self):
+        """Yields the faces as triangle fans: (v0 v1 v2) (v0 v2 v3) ...
+        Yields (int:material_id, tuple:corners) tuples, where 'corners' are
+        three indexes in 'indices' and 'uvs'."""
+        for material_id, corner, size in self.faces():
+            for k in xrange(corner + 1, corner + size - 1):
+                yield material_id, (corner, k, k + 1)
+
+    def reverse_face(self, corner, size):
+        """Reverses the winding of a face, and of its texture coordinates.
+        :corner: int: The face first corner.
+        :size: int: The face number of corners.
+        """
+        end = corner + size
+        indices = self.indices[corner:end]
+        indices.reverse()
+        self.indices[corner:end] = indices
+        if self.uvs:
+            uvs = self.uvs[2 * corner:2 * end]
+            for index in xrange(size):
+                self.uvs[2 * (end - 1 - index):2 * (end - index)] = uvs[2 * index:2 * index + 2]
+
+    def face_normal(self, corner, size):
+        """Computes the normal of a face from its first three vertices.
+        :corner: int: The face first corner.
+        :size: int: The face number of corners.
+        Returns a normalized (x, y, z) tuple, (0, 0, 0) for degenerate
+        faces.
+        """
+        if size < 3:
+            return 0.0, 0.0, 0.0
+        (x_1, y_1, z_1), (x_2, y_2, z_2), (x_3, y_3, z_3) = [
+            self.vertex(index) for index in self.indices[corner:corner + 3]]
+        d_0 = (x_2 - x_1, y_2 - y_1, z_2 - z_1)
+        d_1 = (x_3 - x_2, y_3 - y_2, z_3 - z_2)
+        cross = (d_0[1] * d_1[2] - d_0[2] * d_1[1],
+                 d_0[2] * d_1[0] - d_0[0] * d_1[2],
+                 d_0[0] * d_1[1] - d_0[1] * d_1[0])
+        length = math.sqrt(cross[0] * cross[0] + cross[1] * cross[1] + cross[2] * cross[2])
+        if not length:
+            return 0.0, 0.0, 0.0
+        return cross[0] / length, cross[1] / length, cross[2] / length
+
+    def check(self):
+        """Checks the arrays sizes and the vertex indices.
+        Raises MeshError if they are not consistent.
+        """
+        n_vertices, n_faces = self.n_vertices, self.n_faces
+        n_corners = sum(self.face_sizes)
+        for name, values, expected in (("positions", self.positions, 3 * n_vertices),
+                                       ("normals", self.normals, 3 * n_vertices),
+                                       ("tangents", self.tangents, 3 * n_vertices),
+                                       ("material_ids", self.material_ids, n_faces),
+                                       ("face_normals", self.face_normals, 3 * n_faces),
+                                       ("indices", self.indices, n_corners),
+                                       ("uvs", self.uvs, 2 * n_corners)):
+            if values and len(values) != expected or not values and name in (
+                    "positions", "material_ids", "indices") and expected:
+                raise MeshError("'%s' holds %s values, %s expected."
+                                % (name, len(values), expected))
+        if self.indices and max(self.indices) >= n_vertices:
+            raise MeshError("Vertex index %s out of range." % max(self.indices))
+        if self.material_ids and max(self.material_ids) >= len(self.materials):
+            raise MeshError("Material index %s out of range." % max(self.material_ids))
+
+
+def _float_array(lines, width, name):
+    """Parses lines of comma or blank separated numbers in one pass.
+    :lines: list of strings: The lines to parse.
+    :width: int: The number of values of each line.
+    :name: string: What is parsed, for the error messages.
+    Returns an array.array('d').
+    Raises MeshError if the lines don't hold :width values each.
+    """
+    try:
+        values = array.array("d", map(float, " ".join(lines).replace(",", " ").split()))
+    except ValueError as exc:
+        raise MeshError("Bad %s value: %s" % (name, exc))
+    if len(values) != width * len(lines):
+        raise MeshError("%s lines must hold %s values each." % (name, width))
+    return values
+
+
+def _write_lines(file_name, lines):
+    """Writes 'lines' to 'file_name' by chunks.
+    :file_name: string: The file path.
+    :lines: iterable of strings: The lines, with their line ends.
+    """
+    with open(file_name, "wb") as fd_out:
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= WRITE_CHUNK_LINES:
+                fd_out.write("".join(chunk))
+                chunk = []
+        fd_out.write("".join(chunk))
+
+
+#------------------------------------ DAT -------------------------------------
+def dat_sections(lines):
+    """Splits .dat file lines in sections. Comments and empty lines are
+    removed.
+    :lines: iterable of strings: The .dat file lines.
+    Returns a dict like {"NAME": (string:arguments, list:data_lines)}.
+    """
+    sections = {}
+    data = None
+    match_section = SECTION_RE.match
+    strip_comment = COMMENT_RE.sub
+    for line in lines:
+        line = line.rstrip("\r\n")
+        res = match_section(line)
+        if res:
+            data = []
+            sections[res.group(1)] = ((res.group(2) or "").strip(), data)
+            continue
+        if data is None:
+            continue
+        if "#" in line or "//" in line:
+            line = strip_comment("", line)
+        line = line.strip()
+        if line:
+            data.append(line)
+    return sections
+
+
+def parse_dat(lines):
+    """Builds a Mesh from .dat file lines.
+    :lines: iterable of strings: The .dat file lines.
+    Returns a Mesh object.
+    Raises MeshError if the data is not consistent.
+    """
+    sections = dat_sections(lines)
+    mesh = Mesh()
+
+    def data(name):
+        """Returns the data lines of the 'name' section."""
+        return sections.get(name, ("", []))[1]
+
+    mesh.positions = _float_array(data("VERTEX"), 3, "VERTEX")
+    n_vertices = mesh.n_vertices
+    for name in ("NORMALS", "TANGENTS"):
+        values = _float_array(data(name), 3, name)
+        if values and len(values) != 3 * n_vertices:
+            raise MeshError("%s and VERTEX sizes differ." % name)
+        setattr(mesh, name.lower(), values)
+
+    sizes_append = mesh.face_sizes.append
+    normals_extend = mesh.face_normals.extend
+    indices_extend = mesh.indices.extend
+    for line in data("FACES"):
+        tokens = line.replace(",", " ").split()
+        try:
+            size = int(tokens[6])
+            indices = [int(token) for token in tokens[7:7 + size]]
+            normals_extend(float(token) for token in tokens[3:6])
+        except (IndexError, ValueError):
+            raise MeshError("Bad FACES line: '%s'." % line)
+        if len(indices) != size:
+            raise MeshError("Bad FACES line: '%s'." % line)
+        sizes_append(size)
+        indices_extend(indices)
+
+    names = data("NAMES")
+    mesh.materials = list(names)
+    textures = data("TEXTURES")
+    if textures and len(textures) != mesh.n_faces:
+        raise MeshError("TEXTURES and FACES sizes differ.")
+    ids = {}
+    for name in names:
+        ids.setdefault(name, len(ids))
+    uvs_extend = mesh.uvs.extend
+    for line, size in zip(textures, mesh.face_sizes):
+        tokens = line.split()
+        name = tokens[0]
+        try:
+            s_scale, t_scale = float(tokens[1]), float(tokens[2])
+            points = [float(token) for token in tokens[3:]]
+        except (IndexError, ValueError):
+            raise MeshError("Bad TEXTURES line: '%s'." % line)
+        if len(points) != 2 * size:
+            raise MeshError("Bad TEXTURES line: '%s'." % line)
+        if name.isdigit() and int(name) < len(names):
+            material_id = int(name)
+        else:
+            material_id = ids.get(name)
+            if material_id is None:
+                material_id = ids[name] = len(mesh.materials)
+                mesh.materials.append(name)
+        mesh.material_ids.append(material_id)
+        # Texture coordinates are given relative to the texture size.
+        uvs_extend(value / (t_scale if index % 2 else s_scale)
+                   for index, value in enumerate(points))
+    if not textures:
+        if mesh.n_faces:
+            mesh.materials = [""]
+        mesh.material_ids = array.array("I", [0] * mesh.n_faces)
+
+    for name, count in (("NVERTS", mesh.n_vertices), ("NFACES", mesh.n_faces)):
+        if name in sections:
+            declared = sections[name][0].split()
+            if declared and declared[0].isdigit() and int(declared[0]) != count:
+                raise MeshError("%s is %s, %s found." % (name, declared[0], count))
+    mesh.check()
+    return mesh
+
+
+def read_dat(file_name):
+    """Reads an Oolite .dat file.
+    :file_name: string: The .dat file path.
+    Returns a Mesh object.
+    """
+    with open(file_name, "rU") as in_fd:
+        return parse_dat(in_fd)
+
+
+def _dat_lines(mesh, use_names):
+    """Yields the .dat file lines of 'mesh'."""
+    textured = bool(mesh.uvs) and any(mesh.materials)
+    yield "NVERTS %d\nNFACES %d\n\nVERTEX\n" % (mesh.n_vertices, mesh.n_faces)
+    positions = mesh.positions
+    for index in xrange(0, len(positions), 3):
+        yield "%.6f, %.6f, %.6f\n" % tuple(positions[index:index + 3])
+    yield "\nFACES\n"
+    indices = mesh.indices
+    for face, (_, corner, size) in enumerate(mesh.faces()):
+        if mesh.face_normals:
+            normal = tuple(mesh.face_normals[3 * face:3 * face + 3])
+        else:
+            normal = mesh.face_normal(corner, size)
+        yield "0,0,0,\t%.6f,%.6f,%.6f,\t%d,\t%s\n" % (
+            normal + (size, ",".join(str(index) for index in indices[corner:corner + size])))
+    if textured:
+        yield "\nTEXTURES\n"
+        uvs = mesh.uvs
+        for material_id, corner, size in mesh.faces():
+            name = str(material_id) if use_names else mesh.materials[material_id]
+            yield "%s\t1.0 1.0\t%s\n" % (name, "\t".join(
+                "%.6f %.6f" % tuple(uvs[2 * index:2 * index + 2])
+                for index in xrange(corner, corner + size)))
+        if use_names:
+            yield "\nNAMES %d\n" % len(mesh.materials)
+            for name in mesh.materials:
+                yield "%s\n" % name
+    for name, values in (("NORMALS", mesh.normals), ("TANGENTS", mesh.tangents)):
+        if values:
+            yield "\n%s\n" % name
+            for index in xrange(0, len(values), 3):
+                yield "%.6f, %.6f, %.6f\n" % tuple(values[index:index + 3])
+    yield "\nEND\n"
+
+
+def write_dat(file_name, mesh, use_names=True):
+    """Writes an Oolite .dat file.
+    :file_name: string: The .dat file path.
+    :mesh: Mesh: The mesh to write.
+    :use_names: bool: Whether TEXTURES refer to the materials by index, the
+        names being in a NAMES section, or by name. Defaults to True.
+    """
+    _write_lines(file_name, _dat_lines(mesh, use_names))
+
+
+#------------------------------------ OBJ -------------------------------------
+def parse_mtl(lines):
+    """Reads the diffuse maps of a .mtl file.
+    :lines: iterable of strings: The .mtl file lines.
+    Returns a dict like {"<material name>": "<map_Kd file name>"}.
+    """
+    diffuse_maps = {}
+    name = None
+    for line in lines:
+        tokens = line.split()
+        if len(tokens) < 2:
+            continue
+        if tokens[0] == "newmtl":
+            name = tokens[1]
+        elif tokens[0] == "map_Kd" and name is not None:
+            # Options like '-s 1 1 1' may come before the file name.
+            diffuse_maps.setdefault(name, tokens[-1])
+    return diffuse_maps
+
+
+def _obj_index(token, count):
+    """Converts a 1 based, possibly negative, .obj index to a 0 based one."""
+    index = int(token)
+    return index + count if index < 0 else index - 1
+
+
+def parse_obj(lines, diffuse_maps=None):
+    """Builds a Mesh from .obj file lines.
+    Vertices using several normals are split, one per (position, normal)
+    pair.
+    :lines: iterable of strings: The .obj file lines.
+    :diffuse_maps: dict: Material names to texture file names, as returned
+        by 'parse_mtl'. Materials are named after their diffuse map when it
+        is known. Defaults to None.
+    Returns a Mesh object.
+    Raises MeshError if the data is not consistent.
+    """
+    diffuse_maps = diffuse_maps or {}
+    positions = array.array("d")
+    normals = array.array("d")
+    uvs = array.array("d")
+    corners = []
+    face_sizes = array.array("I")
+    material_ids = array.array("I")
+    materials = {}
+    material_names = []
+    material_id = None
+    for line in lines:
+        tokens = line.split()
+        if not tokens:
+            continue
+        keyword = tokens[0]
+        try:
+            if keyword == "v":
+                positions.extend((-float(tokens[1]), float(tokens[2]), float(tokens[3])))
+            elif keyword == "vn":
+                normals.extend((-float(tokens[1]), float(tokens[2]), float(tokens[3])))
+            elif keyword == "vt":
+                uvs.extend((float(tokens[1]), 1.0 - float(tokens[2])))
+            elif keyword == "usemtl":
+                name = diffuse_maps.get(tokens[1], tokens[1])
+                material_id = materials.get(name)
+                if material_id is None:
+                    material_id = materials[name] = len(material_names)
+                    material_names.append(name)
+            elif keyword == "f" and len(tokens) >= 4:
+                n_positions, n_uvs, n_normals = len(positions) // 3, len(uvs) // 2, len(normals) // 3
+                for token in tokens[1:]:
+                    bits = token.split("/")
+                    corners.append((
+                        _obj_index(bits[0], n_positions),
+                        _obj_index(bits[1], n_uvs) if len(bits) > 1 and bits[1] else -1,
+                        _obj_index(bits[2], n_normals) if len(bits) > 2 and bits[2] else -1))
+                if material_id is None:
+                    material_id = materials[""] = len(material_names)
+                    material_names.append("")
+                face_sizes.append(len(tokens) - 1)
+                material_ids.append(material_id)
+        except (IndexError, ValueError):
+            raise MeshError("Bad '%s' line: '%s'." % (keyword, line))
+
+    mesh = Mesh()
+    mesh.face_sizes = face_sizes
+    mesh.material_ids = material_ids
+    mesh.materials = material_names
+    has_normals = any(normal >= 0 for _, _, normal in corners)
+    has_uvs = any(uv >= 0 for _, uv, _ in corners)
+    # One vertex per (position, normal) pair.
+    vertex_for_pair = {}
+    for position, uv, normal in corners:
+        key = (position, normal) if has_normals else position
+        index = vertex_for_pair.get(key)
+        if index is None:
+            index = vertex_for_pair[key] = mesh.n_vertices
+            mesh.positions.extend(positions[3 * position:3 * position + 3])
+            if has_normals:
+                if normal >= 0:
+                    mesh.normals.extend(normals[3 * normal:3 * normal + 3])
+                else:
+                    mesh.normals.extend((0.0, 0.0, 0.0))
+        mesh.indices.append(index)
+        if has_uvs:
+            mesh.uvs.extend(uvs[2 * uv:2 * uv + 2] if uv >= 0 else (0.0, 0.0))
+    if not corners:
+        mesh.positions = positions
+    mesh.check()
+    return mesh
+
+
+def read_obj(file_name):
+    """Reads a Wavefront .obj file, and the .mtl files it refers to.
+    :file_name: string: The .obj file path.
+    Returns a Mesh object.
+    """
+    with open(file_name, "rU") as in_fd:
+        lines = in_fd.readlines()
+    diffuse_maps = {}
+    for line in lines:
+        tokens = line.split()
+        if len(tokens) > 1 and tokens[0] == "mtllib":
+            mtl_file_name = os.path.join(os.path.dirname(file_name), tokens[1])
+            if os.path.isfile(mtl_file_name):
+                with open(mtl_file_name, "rU") as mtl_fd:
+                    for name, diffuse_map in parse_mtl(mtl_fd).items():
+                        diffuse_maps.setdefault(name, diffuse_map)
+    return parse_obj(lines, diffuse_maps)
+
+
+def _material_names(mesh):
+    """Returns unique .obj material names, built from the material names."""
+    names = []
+    for index, name in enumerate(mesh.materials):
+        base = re.sub(r"\s", "_", os.path.splitext(os.path.basename(name))[0]) or "material"
+        names.append(base if base not in names else "%s_%d" % (base, index))
+    return names
+
+
+def _obj_lines(mesh, obj_name, mtl_lib_file):
+    """Yields the .obj file lines of 'mesh'."""
+    yield "mtllib %s\no %s\n" % (mtl_lib_file, obj_name)
+    positions = mesh.positions
+    for index in xrange(0, len(positions), 3):
+        yield "v %.6f %.6f %.6f\n" % (-positions[index], positions[index + 1],
+                                      positions[index + 2])
+    # Same texture coordinates are written once.
+    uv_indices = array.array("I")
+    uv_index = {}
+    uvs = mesh.uvs
+    for index in xrange(0, len(uvs), 2):
+        key = "%.6f %.6f" % (uvs[index], 1.0 - uvs[index + 1])
+        if key not in uv_index:
+            uv_index[key] = len(uv_index) + 1
+            yield "vt %s\n" % key
+        uv_indices.append(uv_index[key])
+    normals = mesh.normals
+    for index in xrange(0, len(normals), 3):
+        yield "vn %.6f %.6f %.6f\n" % (-normals[index], normals[index + 1],
+                                       normals[index + 2])
+    if uvs and normals:
+        corner_format = "%(v)d/%(t)d/%(v)d"
+    elif uvs:
+        corner_format = "%(v)d/%(t)d"
+    elif normals:
+        corner_format = "%(v)d//%(v)d"
+    else:
+        corner_format = "%(v)d"
+    names = _material_names(mesh)
+    current = None
+    indices = mesh.indices
+    for material_id, corner, size in mesh.faces():
+        if material_id != current:
+            current = material_id
+            yield "usemtl %s\n" % names[material_id]
+        yield "f %s\n" % " ".join(
+            corner_format % {"v": indices[index] + 1,
+                             "t": uv_indices[index] if uvs else 0}
+            for index in xrange(corner, corner + size))
+
+
+def _mtl_lines(mesh):
+    """Yields the .mtl file lines of 'mesh'."""
+    for name, texture in zip(_material_names(mesh), mesh.materials):
+        yield "newmtl %s\nKd 1.000000 1.000000 1.000000\n" % name
+        if texture:
+            yield "map_Kd %s\n" % texture
+        yield "\n"
+
+
+def write_obj(file_name, mesh, obj_name=None):
+    """Writes Wavefront .obj and .mtl files.
+    :file_name: string: The .obj file path. The .mtl file is written
+        alongside it.
+    :mesh: Mesh: The mesh to write.
+    :obj_name: string: The object name. Defaults to the file base name.
+    """
+    base_name = os.path.splitext(file_name)[0]
+    mtl_file_name = base_name + ".mtl"
+    _write_lines(file_name, _obj_lines(mesh, obj_name or os.path.basename(base_name),
+                                       os.path.basename(mtl_file_name)))
+    _write_lines(mtl_file_name, _mtl_lines(mesh))
+
+
+#---------------------------------- MESHWORK ----------------------------------
+def parse_meshwork(lines):
+    """Builds a Mesh from Meshwork .mesh file lines.
+    :lines: iterable of strings: The .mesh file lines. Their ends can be
+        carriage returns, like in the files written by Meshwork.
+    Returns a Mesh object.
+    Raises MeshError if the data is not consistent.
+    """
+    mesh = Mesh()
+    mode = None
+    # Per material: {vertex: (u, v)}.
+    vertex_uvs = []
+    triangles = array.array("I")
+    triangle_materials = array.array("I")
+    lines = chain.from_iterable(line.splitlines() for line in lines)
+    for line in lines:
+        tokens = line.split("\t")
+        keyword = tokens[0].split(" ")[0]
+        try:
+            if keyword in ("VERTICES", "EDGES", "UVS", "END", "Mesh"):
+                mode = keyword
+            elif keyword == "MATERIAL":
+                mode = "MATERIAL"
+                name_parts = tokens[0].split(" ", 1)
+                textured = len(tokens) == 15 and tokens[5] == "4"
+                mesh.materials.append(name_parts[1] if textured and len(name_parts) > 1 else "")
+                vertex_uvs.append({})
+            elif mode == "VERTICES" and len(tokens) == 4:
+                mesh.positions.extend(float(token) for token in tokens[1:])
+            elif mode == "MATERIAL" and len(tokens) == 3:
+                triangles.extend(int(token) for token in tokens)
+                triangle_materials.append(len(mesh.materials) - 1)
+            elif mode == "UVS" and len(tokens) == 3:
+                vertex_uvs[-1][int(tokens[0])] = (1.0 - float(tokens[1]), float(tokens[2]))
+        except ValueError:
+            raise MeshError("Bad .mesh line: '%s'." % line)
+    mesh.indices = triangles
+    mesh.face_sizes = array.array("I", [3] * len(triangle_materials))
+    mesh.material_ids = triangle_materials
+    if any(vertex_uvs):
+        for index, material_id in enumerate(triangle_materials):
+            for vertex in triangles[3 * index:3 * index + 3]:
+                mesh.uvs.extend(vertex_uvs[material_id].get(vertex, (0.0, 0.0)))
+    mesh.check()
+    return mesh
+
+
+def read_meshwork(file_name):
+    """Reads a Meshwork .mesh file.
+    :file_name: string: The .mesh file path.
+    Returns a Mesh object.
+    """
+    with open(file_name, "rb") as in_fd:
+        return parse_meshwork(in_fd.read().splitlines())
+
+
+def _meshwork_lines(mesh, extra_materials):
+    """Yields the Meshwork .mesh file lines of 'mesh'."""
+    triangles = list(mesh.triangles())
+    yield "Mesh\t1\t1\r"
+    yield "VERTICES\r"
+    positions = mesh.positions
+    for index in xrange(mesh.n_vertices):
+        yield "%d\t%f\t%f\t%f\r" % ((index,) + tuple(positions[3 * index:3 * index + 3]))
+    yield "EDGES\r"
+    indices = mesh.indices
+    # Edges are kept as directed pairs, like Dat2Mesh.py always wrote them:
+    # an edge shared by two faces can be written both ways.
+    edges = set()
+    for _, (c_a, c_b, c_c) in triangles:
+        p_a, p_b, p_c = indices[c_a], indices[c_b], indices[c_c]
+        edges.update(((p_a, p_b), (p_a, p_c), (p_b, p_c)))
+    for edge in sorted(edges):
+        yield "%d\t%d\r" % edge
+    uvs = mesh.uvs
+    for material_id, name in enumerate(mesh.materials):
+        if name and uvs:
+            yield ("MATERIAL %s\t65535\t65535\t65535\t0\t4\t0\t0\t0\t0\t0\t0\t0\t0\t0\r"
+                   % name)
+        else:
+            yield "MATERIAL\t65535\t65535\t65535\t0\t0\t0\r"
+        # One texture coordinate per vertex and material: the last one wins.
+        vertex_uvs = {}
+        for triangle_material, corners in triangles:
+            if triangle_material == material_id:
+                yield "%d\t%d\t%d\r" % tuple(indices[corner] for corner in corners)
+                for corner in corners:
+                    vertex_uvs[indices[corner]] = uvs[2 * corner:2 * corner + 2] if uvs else None
+        if name and uvs:
+            yield "UVS\r"
+            for vertex in sorted(vertex_uvs):
+                u_coord, v_coord = vertex_uvs[vertex]
+                yield "%d\t%.5f\t%.5f\r" % (vertex, 1.0 - u_coord, v_coord)
+    for red, green, blue in extra_materials:
+        yield "MATERIAL\t%d\t%d\t%d\t0\t0\t0\r" % (red, green, blue)
+    yield "END\r"
+
+
+def write_meshwork(file_name, mesh, extra_materials=()):
+    """Writes a Meshwork .mesh file. Faces are written as triangle fans.
+    :file_name: string: The .mesh file path.
+    :mesh: Mesh: The mesh to write.
+    :extra_materials: iterable of tuples: (int:red, int:green, int:blue)
+        colors, from 0 to 65535, of untextured materials written without
+        faces after the mesh ones, for the Meshwork user to pick from.
+        Defaults to an empty tuple.
+    """
+    _write_lines(file_name, _meshwork_lines(mesh, extra_materials))
+
+
+#----------------------------------- FILES ------------------------------------
+READERS = {".dat": read_dat,
+           ".obj": read_obj,
+           ".mesh": read_meshwork}
+
+WRITERS = {".dat": write_dat,
+           ".obj": write_obj,
+           ".mesh": write_meshwork}
+
+
+def _extension(file_name, known):
+    """Returns the lower case extension of 'file_name' if in 'known'."""
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension not in known:
+        raise MeshError("Unknown mesh file type '%s'." % file_name)
+    return extension
+
+
+def read(file_name):
+    """Reads a mesh file, its type being given by its extension.
+    :file_name: string: A .dat, .obj or .mesh file path.
+    Returns a Mesh object.
+    Raises MeshError if the file type is unknown or its data not consistent.
+    """
+    return READERS[_extension(file_name, READERS)](file_name)
+
+
+def write(file_name, mesh):
+    """Writes a mesh file, its type being given by its extension.
+    :file_name: string: A .dat, .obj or .mesh file path.
+    :mesh: Mesh: The mesh to write.
+    Raises MeshError if the file type is unknown.
+    """
+    WRITERS[_extension(file_name, WRITERS)](file_name, mesh)
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+#
+# -*- coding: utf-8 -*-
+#
+"""
+Binary container for parsed meshes, shared by the converters.
+
+Parsing text models is the slowest part of most conversions. The converters
+can write what they parsed in a '.mbin' file alongside their output, then
+read it back instead of the text on the next runs, as long as the source
+file didn't change.
+
+File layout, all numbers little-endian:
+
+* 4 bytes: the MAGIC string;
+* uint32: FORMAT_VERSION;
+* uint32: the JSON header size, in bytes;
+* the JSON header, padded with spaces to a multiple of 8 bytes;
+* the names table: names joined by NUL bytes, padded with NUL bytes to a
+  multiple of 8 bytes;
+* the arrays, each one starting on a multiple of 8 bytes.
+
+The JSON header holds:
+
+* "kind" and "version": which converter parsed the data, and the version of
+  its parsed data layout;
+* "source": the source file name, size and SHA-1 digest;
+* "meta": free metadata, like counts;
+* "names": the names table size and number of names;
+* "arrays": a list of {"name", "type", "count", "offset"} objects. "type" is
+  'd' for float64 values or 'i' for int32 ones, and "offset" counts from the
+  file start.
+
+Arrays are read back from a memory mapping of the file: copied in
+array.array objects, or used in place as read-only NumPy arrays if NumPy is
+installed and the reader asks for it. A file whose format version, kind,
+version or source doesn't match is stale and ignored.
+"""
+
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+
+import convcache
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional: the arrays are then always copied.
+    numpy = None
+
+
+MAGIC = b"OOMB"
+
+FORMAT_VERSION = 1
+
+# Extension of the container files.
+EXTENSION = ".mbin"
+
+# Array types: struct format of one item.
+ARRAY_TYPES = {"d": "<d", "i": "<i"}
+
+# Array types: NumPy type of one item, used to read the arrays in place.
+NUMPY_TYPES = {"d": "<f8", "i": "<i4"}
+
+_PREAMBLE = struct.Struct("<4sII")
+
+_ALIGNMENT = 8
+
+
+class MeshBinError(ValueError):
+    """Raised when a .mbin file can't be read."""
+    pass
+
+
+def _padding(size):
+    """Returns the number of bytes to add to 'size' to align it."""
+    return -size % _ALIGNMENT
+
+
+def _little_endian(values):
+    """Returns the bytes of an array.array, in little-endian order."""
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tostring()
+
+
+def file_name(input_file_name, kind):
+    """Returns the .mbin file path used for an input file.
+    :input_file_name: string: The parsed file path.
+    :kind: string: The kind of parsed data, see 'MeshBin'.
+    Returns a string like 'model.<kind>.mbin', alongside the input file.
+    """
+    return "%s.%s%s" % (os.path.splitext(input_file_name)[0], kind, EXTENSION)
+
+
+def source_info(source_file_name):
+    """Describes a source file, to be given to 'MeshBin.write' and 'load'.
+    Get it before parsing the source, so a change made meanwhile makes the
+    written file stale.
+    :source_file_name: string: The parsed file path.
+    Returns a dict like {"name": "<base name>", "size": int, "sha1": "<hex>"}.
+    """
+    return {"name": os.path.basename(source_file_name),
+            "size": os.path.getsize(source_file_name),
+            "sha1": convcache.file_digest(source_file_name).hexdigest()}
+
+
+class MeshBin(object):
+    """Parsed mesh data, as stored in .mbin files."""
+
+    def __init__(self, kind, version, meta=None, names=None, arrays=None):
+        """:kind: string: The kind of parsed data, usually the name of the
+            converter which parsed it.
+        :version: int: The version of the parsed data layout, changed when
+            the converter parses differently.
+        :meta: dict: JSON serializable metadata. Defaults to None.
+        :names: list of strings: The names table. Defaults to None.
+        :arrays: list of tuples: (string:name, array.array:values) tuples.
+            The values type code must be one of ARRAY_TYPES keys.
+            Defaults to None.
+        """
+        self.kind = kind
+        self.version = version
+        self.meta = meta or {}
+        self.names = names or []
+        self.arrays = dict(arrays or ())
+        self.array_names = [name for name, _ in arrays or ()]
+        # Set when read from a file.
+        self.source = None
+
+    def __getitem__(self, name):
+        """Returns the 'name' array."""
+        return self.arrays[name]
+
+    def write(self, output_file_name, source):
+        """Writes the data to a .mbin file.
+        The file is written under another name, then renamed: readers never
+        see a half written file.
+        :output_file_name: string: The .mbin file path.
+        :source: dict: The file the data was parsed from, as returned by
+            'source_info'.
+        """
+        names = b"\0".join(self.names)
+        names += b"\0" * _padding(len(names))
+        descriptions = []
+        for name in self.array_names:
+            values = self.arrays[name]
+            if values.typecode not in ARRAY_TYPES:
+                raise MeshBinError("Unsupported array type '%s'." % values.typecode)
+            descriptions.append({"name": name, "type": values.typecode,
+                                 "count": len(values), "offset": 0})
+        header = {"kind": self.kind, "version": self.version,
+                  "source": source, "meta": self.meta,
+                  "names": {"size": len(names), "count": len(self.names)},
+                  "arrays": descriptions}
+        # The offsets are known once the header size is: their digits count
+        # changes it, so try until it doesn't move.
+        header_size = 0
+        while True:
+            offset = _PREAMBLE.size + header_size + len(names)
+            for description in descriptions:
+                description["offset"] = offset
+                item_size = struct.calcsize(ARRAY_TYPES[description["type"]])
+                offset += description["count"] * item_size
+                offset += _padding(offset)
+            text = json.dumps(header, sort_keys=True).encode("utf-8")
+            text += b" " * _padding(_PREAMBLE.size + len(text))
+            if len(text) == header_size:
+                break
+            header_size = len(text)
+
+        tmp_file_name = convcache.partial_name(output_file_name)
+        with open(tmp_file_name, "wb") as out_fd:
+            out_fd.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(text)))
+            out_fd.write(text)
+            out_fd.write(names)
+            for description in descriptions:
+                data = _little_endian(self.arrays[description["name"]])
+                out_fd.write(data)
+                out_fd.write(b"\0" * _padding(len(data)))
+        if os.path.exists(output_file_name):
+            # 'os.rename' doesn't replace existing files on Windows.
+            os.remove(output_file_name)
+        os.rename(tmp_file_name, output_file_name)
+
+
+def read(input_file_name, in_place=False):
+    """Reads a .mbin file.
+    :input_file_name: string: The .mbin file path.
+    :in_place: bool: Whether to give the arrays as NumPy arrays using the
+        file mapping in place, instead of array.array copies. They are then
+        read-only, and the mapping is closed once none of them is used any
+        more. Ignored if NumPy is not installed. Defaults to False.
+    Returns a MeshBin object, with its 'source' attribute set.
+    Raises MeshBinError if the file is not a .mbin file, or uses another
+    format version.
+    """
+    in_place = in_place and numpy is not None
+    with open(input_file_name, "rb") as in_fd:
+        try:
+            mapping = mmap.mmap(in_fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can't be mapped.
+            raise MeshBinError("'%s' is empty." % input_file_name)
+    try:
+        if len(mapping) < _PREAMBLE.size:
+            raise MeshBinError("'%s' is truncated." % input_file_name)
+        magic, version, header_size = _PREAMBLE.unpack(mapping[:_PREAMBLE.size])
+        if magic != MAGIC:
+            raise MeshBinError("'%s' is not a .mbin file." % input_file_name)
+        if version != FORMAT_VERSION:
+            raise MeshBinError("'%s' uses the format version %s, not %s."
+                               % (input_file_name, version, FORMAT_VERSION))
+        start = _PREAMBLE.size
+        try:
+            header = json.loads(mapping[start:start + header_size].decode("utf-8"))
+        except ValueError:
+            raise MeshBinError("'%s' header is damaged." % input_file_name)
+        start += header_size
+        names = mapping[start:start + header["names"]["size"]].split(b"\0")
+        # Padding bytes give extra empty names.
+        names = names[:header["names"]["count"]]
+        arrays = []
+        for description in header["arrays"]:
+            item_size = struct.calcsize(ARRAY_TYPES[description["type"]])
+            start = description["offset"]
+            end = start + description["count"] * item_size
+            if end > len(mapping):
+                raise MeshBinError("'%s' is truncated." % input_file_name)
+            if in_place:
+                values = numpy.frombuffer(mapping, NUMPY_TYPES[description["type"]],
+                                          description["count"], start)
+            else:
+                values = array.array(str(description["type"]))
+                values.fromstring(mapping[start:end])
+                if sys.byteorder == "big":
+                    values.byteswap()
+            arrays.append((str(description["name"]), values))
+    except:
+        mapping.close()
+        raise
+    if not in_place:
+        mapping.close()
+    mesh = MeshBin(str(header["kind"]), header["version"], header["meta"], names, arrays)
+    mesh.source = header["source"]
+    return mesh
+
+
+def load(input_file_name, kind, version, source, in_place=False):
+    """Reads a .mbin file if it is up to date.
+    :input_file_name: string: The .mbin file path.
+    :kind: string: The expected kind of data.
+    :version: int: The expected data layout version.
+    :source: dict: The file the data must have been parsed from, as returned
+        by 'source_info'.
+    :in_place: bool: See 'read'. Defaults to False.
+    Returns a MeshBin object, or None if the file doesn't exist, can't be
+    read, or is stale.
+    """
+    if not os.path.isfile(input_file_name):
+        return None
+    try:
+        mesh = read(input_file_name, in_place)
+    except (MeshBinError, IOError, KeyError, TypeError):
+        return None
+    if mesh.kind != kind or mesh.version != version:
+        return None
+    stored = mesh.source or {}
+    if (stored.get("size"), stored.get("sha1")) != (source["size"], source["sha1"]):
+        return None
+    return mesh
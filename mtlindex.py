@@ -0,0 +1,160 @@
+#!/usr/bin/python
+#
+# -*- coding: utf-8 -*-
+#
+"""
+Material libraries (Wavefront .mtl files) parsed once per batch.
+
+The OBJ converters only need the 'newmtl' and 'map_Kd' lines of a library:
+the material names, in file order, and the diffuse map of each material.
+Many OBJ files often share one big library, so a parsed library is kept in
+memory for the rest of the run, and optionally cached on disk, in a JSON
+file named after the library path. The parsed library is used as long as the
+library modification time and size didn't change, or its content hash
+didn't.
+"""
+
+import os
+import json
+import string
+import hashlib
+
+import convcache
+
+
+# Keywords of the library lines kept.
+KEYWORDS = ("newmtl", "map_Kd")
+
+
+class MaterialLibrary(object):
+    """The materials of a .mtl file.
+    :entries: list: The ('newmtl' or 'map_Kd', name) pairs, in file order.
+    :diffuse_maps: dict: The diffuse map of each material: the first 'map_Kd'
+        following its 'newmtl'. Materials without diffuse map are left out.
+    """
+    __slots__ = ("entries", "diffuse_maps")
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.diffuse_maps = {}
+        material_name = None
+        for keyword, name in entries:
+            if keyword == "newmtl":
+                material_name = name
+            elif material_name is not None:
+                self.diffuse_maps[material_name] = name
+                material_name = None
+
+
+def parse_library(lines):
+    """Parses the lines of a material library.
+    :lines: iterable of strings: The library lines.
+    Returns the list of ('newmtl' or 'map_Kd', name) pairs, in file order.
+    """
+    entries = []
+    for line in lines:
+        tokens = string.split(line)
+        if tokens and tokens[0] in KEYWORDS:
+            entries.append((tokens[0], tokens[1]))
+    return entries
+
+
+def read_library(file_name):
+    """Reads a material library file.
+    :file_name: string: The .mtl file path.
+    Returns the list of ('newmtl' or 'map_Kd', name) pairs, in file order.
+    """
+    with open(file_name, "r") as in_fd:
+        return parse_library(in_fd.read().splitlines(0))
+
+
+def _library_cache_file(library_file_name, cache_dir):
+    """Returns the disk cache file of a parsed material library."""
+    digest = hashlib.sha1(os.path.abspath(library_file_name)).hexdigest()
+    return os.path.join(cache_dir or convcache.DEFAULT_CACHE_DIR, "mtl",
+                        digest + ".json")
+
+
+def _write_library_cache(cache_file_name, content):
+    """Writes a parsed material library cache file.
+    :cache_file_name: string: The cache file path.
+    :content: dict: The cache file content.
+    Raises UnicodeDecodeError if a name is not UTF-8 encoded.
+    """
+    text = json.dumps(content)
+    cache_parent = os.path.dirname(cache_file_name)
+    if not os.path.isdir(cache_parent):
+        try:
+            os.makedirs(cache_parent)
+        except OSError:
+            # Created meanwhile by another process.
+            if not os.path.isdir(cache_parent):
+                raise
+    tmp_file_name = "%s.%s%s" % (cache_file_name, os.getpid(), convcache.PARTIAL_SUFFIX)
+    with open(tmp_file_name, "w") as out_fd:
+        out_fd.write(text)
+    convcache.replace_if_changed(tmp_file_name, cache_file_name)
+
+
+def _decode_entries(entries):
+    """Returns the entries JSON gives back as lists of unicode strings, as
+    pairs of UTF-8 encoded strings, like the ones read from the library."""
+    return [(keyword.encode("utf-8"), name.encode("utf-8")) for keyword, name in entries]
+
+
+# Libraries already loaded by this process: {abspath: ((mtime, size), library)}.
+_LOADED = {}
+
+
+def load_library(library_file_name, cache_dir=None, use_cache=True):
+    """Returns a parsed material library, parsing it only if it changed since
+    it was last loaded by this process or written to the disk cache.
+    :library_file_name: string: The .mtl file path.
+    :cache_dir: string: The cache directory. Defaults to
+        convcache.DEFAULT_CACHE_DIR.
+    :use_cache: bool: Whether to read and write the disk cache. Libraries
+        are kept in memory in any case. Defaults to True.
+    Returns a MaterialLibrary.
+    """
+    path = os.path.abspath(library_file_name)
+    stat = os.stat(path)
+    state = (stat.st_mtime, stat.st_size)
+    loaded = _LOADED.get(path)
+    if loaded and loaded[0] == state:
+        return loaded[1]
+
+    if not use_cache:
+        library = MaterialLibrary(read_library(path))
+        _LOADED[path] = (state, library)
+        return library
+
+    cache_file_name = _library_cache_file(path, cache_dir)
+    cached = None
+    if os.path.isfile(cache_file_name):
+        try:
+            with open(cache_file_name, "r") as in_fd:
+                cached = json.load(in_fd)
+        except ValueError:
+            # Damaged cache file: rebuild it.
+            cached = None
+    if cached and [cached.get("mtime"), cached.get("size")] == list(state):
+        entries = _decode_entries(cached["entries"])
+    else:
+        digest = convcache.file_digest(path).hexdigest()
+        if cached and cached.get("sha1") == digest:
+            # Touched or copied, but the same content.
+            entries = _decode_entries(cached["entries"])
+        else:
+            entries = read_library(path)
+        try:
+            _write_library_cache(cache_file_name, {"library": path,
+                                                   "mtime": state[0],
+                                                   "size": state[1],
+                                                   "sha1": digest,
+                                                   "entries": entries})
+        except UnicodeDecodeError:
+            # Not storable as JSON: parsed again by the next runs.
+            pass
+    library = MaterialLibrary(entries)
+    _LOADED[path] = (state, library)
+    return library
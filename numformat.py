@@ -0,0 +1,85 @@
+#!/usr/bin/python
+#
+# -*- coding: utf-8 -*-
+#
+"""
+Number formatting shared by the converters.
+
+'format_number' gives the shortest text of a float rounded to five decimal
+places, trailing zeros dropped: '1', '-0.5', '0.00012'. Negative values
+rounding to zero keep their sign: '-0'. This is the text the former Decimal
+based 'format_number' of Obj2DatTexNorm.py gave, without building Decimal
+objects.
+
+'format_numbers' and 'format_rows' do the same for whole columns of values,
+like the coordinates of all the vertices: a single '%' operation formats all
+the values of a few thousand rows, and a single regular expression
+substitution drops the trailing zeros.
+"""
+
+import re
+
+
+# Number of decimal places kept.
+DECIMALS = 5
+
+_NUMBER_FORMAT = "%%.%df" % DECIMALS
+
+# Trailing zeros of the decimal part, and the decimal point if nothing is left
+# after it. Numbers formatted with _NUMBER_FORMAT always have a decimal part,
+# so zeros followed by neither a digit nor a point can't be in the integer
+# part.
+_TRAILING_ZEROS = re.compile(r"\.?0+(?![0-9.])")
+
+# Rows formatted by each '%' operation of 'format_rows', bounding the size of
+# the temporary tuple and text.
+ROWS_PER_CHUNK = 4096
+
+
+def format_number(n):
+    """Formats a number with up to five decimal places, as short as possible.
+    :n: float: The number.
+    Returns a string, 'bad' if 'n' is not a number.
+    """
+    try:
+        text = _NUMBER_FORMAT % n
+    except (TypeError, ValueError):
+        return "bad"
+    if "." in text:
+        text = text.rstrip("0")
+        if text[-1] == ".":
+            text = text[:-1]
+    return text
+
+
+def format_rows(values, width, separator=" "):
+    """Formats a flat sequence of numbers, 'width' numbers per row.
+    :values: sequence of floats: The numbers, like an array.array('d') or a
+        NumPy array. Its length must be a multiple of 'width'.
+    :width: int: The number of values in each row.
+    :separator: string: Put between the values of a row. It must not hold
+        digits or points. Defaults to a space.
+    Returns a list of strings, one per row, without line end.
+    Raises TypeError if a value is not a number.
+    """
+    rows = []
+    row_format = separator.join([_NUMBER_FORMAT] * width)
+    chunk_size = ROWS_PER_CHUNK * width
+    chunk_format = "\n".join([row_format] * ROWS_PER_CHUNK)
+    for start in xrange(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        if len(chunk) < chunk_size:
+            chunk_format = "\n".join([row_format] * (len(chunk) // width))
+        rows.extend(_TRAILING_ZEROS.sub("", chunk_format % tuple(chunk)).split("\n"))
+    return rows
+
+
+def format_numbers(values):
+    """Formats a sequence of numbers like 'format_number', all at once.
+    :values: sequence of floats: The numbers.
+    Returns a list of strings. Values which are not numbers give 'bad'.
+    """
+    try:
+        return format_rows(values, 1)
+    except TypeError:
+        return [format_number(value) for value in values]
@@ -0,0 +1,335 @@
+#!/usr/bin/python
+#
+# -*- coding: utf-8 -*-
+#
+"""
+Texture names index built from Oolite .plist files, like shipdata.plist.
+
+The index maps each model file name to its materials, and each material
+name (the aliases found in .dat files NAMES sections) to its diffuse map:
+
+{"oolite_anaconda.dat": {"Hull": "oolite_anaconda_diffuse.png", ...}, ...}
+
+It gives the same texture names as the .oti files written by
+'test/build_otis.py', without pbPlist: OpenStep (ASCII) plists are read by a
+small parser, XML ones by 'plistlib'.
+
+Reading a big plist is slow, so the index is cached on disk, in a JSON file
+named after the plist path. The cached index is used as long as the plist
+modification time and size didn't change, or its content hash didn't.
+"""
+
+import os
+import json
+import hashlib
+import plistlib
+from collections import OrderedDict
+
+import convcache
+
+
+class PlistError(ValueError):
+    """Raised when a .plist file can't be read."""
+    pass
+
+
+#------------------------------- OPENSTEP PLIST -------------------------------
+# Characters allowed in unquoted strings.
+_UNQUOTED_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+                            "0123456789_$+/:.-")
+
+_ESCAPES = {"a": "\a", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t",
+            "v": "\v", "\\": "\\", "\"": "\"", "'": "'"}
+
+
+class _OpenStepParser(object):
+    """Recursive descent parser for OpenStep plists."""
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.end = len(text)
+
+    def error(self, msg):
+        """Raises a PlistError about the current position."""
+        line = self.text.count("\n", 0, self.pos) + 1
+        raise PlistError("%s at line %s." % (msg, line))
+
+    def skip(self):
+        """Skips blank characters and comments."""
+        text = self.text
+        while self.pos < self.end:
+            char = text[self.pos]
+            if char.isspace():
+                self.pos += 1
+            elif text.startswith("//", self.pos):
+                newline = text.find("\n", self.pos)
+                self.pos = self.end if newline < 0 else newline + 1
+            elif text.startswith("/*", self.pos):
+                close = text.find("*/", self.pos + 2)
+                if close < 0:
+                    self.error("Unterminated comment")
+                self.pos = close + 2
+            else:
+                break
+
+    def peek(self):
+        """Skips blanks and returns the next character, or None at the end."""
+        self.skip()
+        return self.text[self.pos] if self.pos < self.end else None
+
+    def expect(self, char):
+        """Consumes 'char' or raises a PlistError."""
+        if self.peek() != char:
+            self.error("'%s' expected" % char)
+        self.pos += 1
+
+    def value(self):
+        """Parses and returns the next value."""
+        char = self.peek()
+        if char == "{":
+            return self.dictionary()
+        if char == "(":
+            return self.array()
+        if char in ("\"", "'"):
+            return self.quoted()
+        if char == "<":
+            return self.data()
+        if char is not None and char in _UNQUOTED_CHARS:
+            start = self.pos
+            while self.pos < self.end and self.text[self.pos] in _UNQUOTED_CHARS:
+                self.pos += 1
+            return self.text[start:self.pos]
+        self.error("Value expected")
+
+    def dictionary(self):
+        """Parses a '{ key = value; ... }' dictionary."""
+        self.expect("{")
+        result = OrderedDict()
+        while self.peek() != "}":
+            if self.peek() is None:
+                self.error("Unterminated dictionary")
+            key = self.value()
+            self.expect("=")
+            result[key] = self.value()
+            if self.peek() == ";":
+                self.pos += 1
+            elif self.peek() != "}":
+                self.error("';' expected")
+        self.pos += 1
+        return result
+
+    def array(self):
+        """Parses a '( value, ... )' array."""
+        self.expect("(")
+        result = []
+        while self.peek() != ")":
+            if self.peek() is None:
+                self.error("Unterminated array")
+            result.append(self.value())
+            if self.peek() == ",":
+                self.pos += 1
+            elif self.peek() != ")":
+                self.error("',' expected")
+        self.pos += 1
+        return result
+
+    def quoted(self):
+        """Parses a quoted string, handling the escape sequences."""
+        quote = self.text[self.pos]
+        self.pos += 1
+        chunks = []
+        start = self.pos
+        text = self.text
+        while True:
+            if self.pos >= self.end:
+                self.error("Unterminated string")
+            char = text[self.pos]
+            if char == quote:
+                chunks.append(text[start:self.pos])
+                self.pos += 1
+                return "".join(chunks)
+            if char != "\\":
+                self.pos += 1
+                continue
+            chunks.append(text[start:self.pos])
+            self.pos += 1
+            char = text[self.pos:self.pos + 1]
+            if char in ("U", "u"):
+                chunks.append(unichr(int(text[self.pos + 1:self.pos + 5], 16)).encode("utf-8"))
+                self.pos += 5
+            elif char and char in "01234567":
+                digits = text[self.pos:self.pos + 3]
+                n_digits = len(digits) - len(digits.lstrip("01234567"))
+                chunks.append(chr(int(digits[:n_digits], 8) & 0xff))
+                self.pos += n_digits
+            else:
+                chunks.append(_ESCAPES.get(char, char))
+                self.pos += 1
+            start = self.pos
+
+    def data(self):
+        """Parses a '<hex digits>' data value."""
+        close = self.text.find(">", self.pos)
+        if close < 0:
+            self.error("Unterminated data")
+        digits = "".join(self.text[self.pos + 1:close].split())
+        self.pos = close + 1
+        try:
+            return digits.decode("hex")
+        except TypeError:
+            self.error("Bad data")
+
+
+def parse_openstep(text):
+    """Parses an OpenStep plist.
+    :text: string: The plist content.
+    Returns the plist root object: dicts are OrderedDicts, strings are UTF-8
+    encoded strings.
+    Raises PlistError if the text is not an OpenStep plist.
+    """
+    parser = _OpenStepParser(text)
+    result = parser.value()
+    if parser.peek() is not None:
+        parser.error("End of file expected")
+    return result
+
+
+def read_plist(file_name):
+    """Reads an OpenStep or XML plist file.
+    :file_name: string: The .plist file path.
+    Returns the plist root object.
+    Raises PlistError if the file can't be parsed.
+    """
+    with open(file_name, "rb") as in_fd:
+        text = in_fd.read()
+    if text.startswith("bplist"):
+        raise PlistError("Binary plists are not supported: '%s'." % file_name)
+    if text.lstrip().startswith(("<?xml", "<!DOCTYPE", "<plist")):
+        try:
+            return plistlib.readPlistFromString(text)
+        except Exception as exc:  # pylint: disable=broad-except
+            raise PlistError("Bad XML plist '%s': %s" % (file_name, exc))
+    if text.startswith("\xef\xbb\xbf"):
+        text = text[3:]
+    return parse_openstep(text)
+
+
+#---------------------------------- INDEX -------------------------------------
+def _diffuse_map(material, alias):
+    """Returns the diffuse map file name of a material entry."""
+    if not isinstance(material, dict):
+        return alias
+    diffuse_map = material.get("diffuse_map", alias)
+    if isinstance(diffuse_map, dict):
+        # Texture specifier dictionary.
+        diffuse_map = diffuse_map.get("name", alias)
+    return diffuse_map
+
+
+def build_index(plist):
+    """Builds the texture names index.
+    When several entries use the same model, the last one wins, like in
+    'test/build_otis.py'.
+    :plist: dict: The plist root object.
+    Returns a dict like {"<model>": {"<alias>": "<diffuse_map>"}}.
+    """
+    index = {}
+    if not isinstance(plist, dict):
+        return index
+    for entry in plist.values():
+        if not isinstance(entry, dict) or "model" not in entry:
+            continue
+        materials = entry.get("materials", {})
+        if not isinstance(materials, dict):
+            materials = {}
+        index[entry["model"]] = dict((alias, _diffuse_map(material, alias))
+                                     for alias, material in materials.items())
+    return index
+
+
+def _encode(obj):
+    """Returns 'obj' with the unicode strings JSON gives back encoded in
+    UTF-8, like the ones read from the plist."""
+    if isinstance(obj, dict):
+        return dict((_encode(key), _encode(value)) for key, value in obj.items())
+    if isinstance(obj, unicode):
+        return obj.encode("utf-8")
+    return obj
+
+
+def _index_cache_file(plist_file_name, cache_dir):
+    """Returns the disk cache file of a plist index."""
+    digest = hashlib.sha1(os.path.abspath(plist_file_name)).hexdigest()
+    return os.path.join(cache_dir or convcache.DEFAULT_CACHE_DIR, "plist",
+                        digest + ".json")
+
+
+def _write_index_cache(cache_file_name, content):
+    """Writes a plist index cache file.
+    :cache_file_name: string: The cache file path.
+    :content: dict: The cache file content.
+    """
+    cache_parent = os.path.dirname(cache_file_name)
+    if not os.path.isdir(cache_parent):
+        try:
+            os.makedirs(cache_parent)
+        except OSError:
+            # Created meanwhile by another process.
+            if not os.path.isdir(cache_parent):
+                raise
+    tmp_file_name = "%s.%s%s" % (cache_file_name, os.getpid(), convcache.PARTIAL_SUFFIX)
+    with open(tmp_file_name, "w") as out_fd:
+        json.dump(content, out_fd)
+    convcache.replace_if_changed(tmp_file_name, cache_file_name)
+
+
+# Indexes already loaded by this process: {abspath: ((mtime, size), index)}.
+_LOADED = {}
+
+
+def load_index(plist_file_name, cache_dir=None, use_cache=True):
+    """Returns the texture names index of a plist file, from the disk cache
+    when the plist didn't change.
+    :plist_file_name: string: The .plist file path.
+    :cache_dir: string: The cache directory. Defaults to
+        convcache.DEFAULT_CACHE_DIR.
+    :use_cache: bool: Whether to read and write the disk cache.
+        Defaults to True.
+    Returns a dict like {"<model>": {"<alias>": "<diffuse_map>"}}.
+    Raises PlistError if the plist can't be parsed.
+    """
+    path = os.path.abspath(plist_file_name)
+    stat = os.stat(path)
+    state = (stat.st_mtime, stat.st_size)
+    loaded = _LOADED.get(path)
+    if loaded and loaded[0] == state:
+        return loaded[1]
+
+    cache_file_name = _index_cache_file(path, cache_dir)
+    cached = None
+    if use_cache and os.path.isfile(cache_file_name):
+        try:
+            with open(cache_file_name, "r") as in_fd:
+                cached = json.load(in_fd)
+        except ValueError:
+            # Damaged cache file: rebuild it.
+            cached = None
+    index = None
+    if cached and [cached.get("mtime"), cached.get("size")] == list(state):
+        index = _encode(cached["index"])
+    else:
+        digest = convcache.file_digest(path).hexdigest()
+        if cached and cached.get("sha1") == digest:
+            # Touched or copied, but the same content.
+            index = _encode(cached["index"])
+        else:
+            index = build_index(read_plist(path))
+        if use_cache:
+            _write_index_cache(cache_file_name, {"plist": path,
+                                                 "mtime": state[0],
+                                                 "size": state[1],
+                                                 "sha1": digest,
+                                                 "index": index})
+    _LOADED[path] = (state, index)
+    return index
@@ -0,0 +1,245 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# benchmark.py
+#
+# End-to-end benchmarks of the converters on synthetic meshes.
+#
+r"""
+Times the converters on synthetic meshes of several sizes, offline.
+
+The meshes are built by 'make_meshes.py' in a work directory, then each
+converter is run in its own process on each size:
+
+* dat2obj.py, DatScale.py and Dat2Mesh.py on the .dat file;
+* Obj2DatTexNorm.py and Obj2DatTex.py on the .obj file;
+* Mesh2Obj.py on the .mesh file.
+
+dat2obj.py and Obj2DatTexNorm.py are run with '--no-cache': a second run
+would otherwise restore their outputs from the conversion cache instead of
+converting.
+
+For each run, the wall time, the throughput in faces per second and the peak
+resident memory of the converter process are reported. The peak memory is
+read from the process resource usage, where 'os.wait4' is available (not on
+Windows).
+
+A converter which fails or takes longer than the timeout is reported as such,
+and is not run on the bigger sizes once it timed out.
+
+Usage
+-----
+
+python benchmark.py [--sizes 1000,10000,100000,1000000] [--tools dat2obj,...]
+    [--timeout SECONDS] [--textures N] [--no-normals] [--polygon-size K]
+    [--seed S] [--work-dir DIR] [--keep] [--json FILE]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from collections import OrderedDict
+
+from make_meshes import make_meshes
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+# Converter name: (script, input format, extra arguments). The conversion
+# cache is turned off, so that each run converts.
+TOOLS = OrderedDict((("dat2obj", ("dat2obj.py", "dat", ["--no-cache"])),
+                     ("Obj2DatTexNorm", ("Obj2DatTexNorm.py", "obj", ["--no-cache"])),
+                     ("Obj2DatTex", ("Obj2DatTex.py", "obj", [])),
+                     ("DatScale", ("DatScale.py", "dat", ["2"])),
+                     ("Dat2Mesh", ("Dat2Mesh.py", "dat", [])),
+                     ("Mesh2Obj", ("Mesh2Obj.py", "mesh", []))))
+
+ROW_TEMPLATE = "%-16s %9s %10s %12s %10s  %s"
+
+
+def _peak_rss_mib(rusage):
+    """Returns the peak resident memory in MiB from a resource usage.
+    :rusage: resource.struct_rusage: As returned by 'os.wait4'.
+    """
+    if sys.platform == "darwin":
+        # Bytes on macOS, kilobytes elsewhere.
+        return rusage.ru_maxrss / 1048576.0
+    return rusage.ru_maxrss / 1024.0
+
+
+def run_tool(command, cwd, timeout):
+    """Runs a converter and waits for it.
+    :command: list of strings: The command line.
+    :cwd: string: The working directory.
+    :timeout: float: Seconds after which the process is killed.
+    Returns a tuple:
+    (float:seconds, float:peak_rss_mib_or_None, string:error_or_None)
+    """
+    with open(os.devnull, "w") as devnull:
+        stderr = tempfile.TemporaryFile()
+        start = time.time()
+        process = subprocess.Popen(command, cwd=cwd, stdout=devnull, stderr=stderr)
+        rusage = None
+        timed_out = False
+        delay = 0.001
+        while True:
+            if hasattr(os, "wait4"):
+                pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    # The process is reaped: tell the Popen object.
+                    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+                    break
+            elif process.poll() is not None:
+                break
+            elapsed = time.time() - start
+            if elapsed > timeout:
+                process.kill()
+                timed_out = True
+                if hasattr(os, "wait4"):
+                    _, _, rusage = os.wait4(process.pid, 0)
+                    process.returncode = -1
+                else:
+                    process.wait()
+                break
+            # Poll often for short runs, without spinning on long ones.
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05, max(elapsed / 100.0, 0.001))
+        elapsed = time.time() - start
+
+    error = None
+    if timed_out:
+        error = "timeout after %ss" % timeout
+    elif process.returncode:
+        stderr.seek(0)
+        lines = [line for line in stderr.read().splitlines() if line.strip()]
+        error = "exit code %s%s" % (process.returncode,
+                                    ": %s" % lines[-1].strip() if lines else "")
+    stderr.close()
+    return elapsed, _peak_rss_mib(rusage) if rusage else None, error
+
+
+def benchmark(sizes, tools, work_dir, timeout, report=None, **mesh_kwargs):
+    """Builds the meshes and runs the converters on them.
+    :sizes: list of ints: The numbers of faces.
+    :tools: list of strings: Some of TOOLS keys.
+    :work_dir: string: Where to write the meshes and the converters outputs.
+    :timeout: float: Seconds after which a converter is killed.
+    :report: callable: Called with each result as soon as it is known.
+        Defaults to None.
+    Other keyword arguments are given to 'make_meshes.build_mesh'.
+    Returns a list of dicts, one per run.
+    """
+    formats = sorted(set(TOOLS[tool][1] for tool in tools))
+    timed_out = set()
+    results = []
+    for size in sizes:
+        size_dir = os.path.join(work_dir, str(size))
+        start = time.time()
+        file_names = make_meshes(size, size_dir, formats, **mesh_kwargs)
+        if report:
+            report({"tool": "(make_meshes)", "faces": size,
+                    "seconds": time.time() - start, "faces_per_second": None,
+                    "peak_rss_mib": None, "error": None})
+        for tool in tools:
+            script, fmt, arguments = TOOLS[tool]
+            result = OrderedDict((("tool", tool), ("faces", size)))
+            if tool in timed_out:
+                result.update((("seconds", None), ("faces_per_second", None),
+                               ("peak_rss_mib", None),
+                               ("error", "skipped, timed out on a smaller size")))
+            else:
+                command = ([sys.executable, os.path.join(REPO_DIR, script),
+                            os.path.basename(file_names[fmt])] + arguments)
+                seconds, rss, error = run_tool(command, os.path.dirname(file_names[fmt]),
+                                               timeout)
+                if error and error.startswith("timeout"):
+                    timed_out.add(tool)
+                result.update((("seconds", round(seconds, 3)),
+                               ("faces_per_second",
+                                None if error else int(round(size / max(seconds, 1e-9)))),
+                               ("peak_rss_mib", round(rss, 1) if rss else None),
+                               ("error", error)))
+            results.append(result)
+            if report:
+                report(result)
+    return results
+
+
+def print_result(result):
+    """Prints a result row.
+    :result: dict: As returned in 'benchmark' results.
+    """
+    def fmt(value, template):
+        """Returns '-' for missing values, 'value' formatted otherwise."""
+        return "-" if value is None else template % value
+
+    print ROW_TEMPLATE % (result["tool"], result["faces"],
+                          fmt(result["seconds"], "%.3f"),
+                          fmt(result["faces_per_second"], "%d"),
+                          fmt(result["peak_rss_mib"], "%.1f"),
+                          result["error"] or "OK")
+    sys.stdout.flush()
+
+
+def _int_list(text):
+    """Parses comma separated integers."""
+    return [int(value) for value in text.split(",") if value]
+
+
+def main():
+    """Main function of the program."""
+    parser = argparse.ArgumentParser(description="Benchmarks the converters on synthetic meshes.")
+    parser.add_argument("--sizes", type=_int_list, default=list(DEFAULT_SIZES),
+                        help="comma separated numbers of faces (default: %s)"
+                        % ",".join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument("--tools", default=",".join(TOOLS),
+                        help="comma separated converters to run (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=600.0,
+                        help="seconds after which a converter is killed (default: %(default)s)")
+    parser.add_argument("--textures", type=int, default=2,
+                        help="the number of textures (default: %(default)s)")
+    parser.add_argument("--no-normals", action="store_false", dest="normals",
+                        help="don't write vertex normals")
+    parser.add_argument("--polygon-size", type=int, default=3,
+                        help="the number of vertices of each face (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="the random generator seed (default: %(default)s)")
+    parser.add_argument("--work-dir",
+                        help="where to write the files (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the temporary work directory")
+    parser.add_argument("--json", metavar="FILE",
+                        help="also write the results to FILE, one JSON object a line")
+    args = parser.parse_args()
+
+    tools = [tool for tool in args.tools.split(",") if tool]
+    unknown = set(tools).difference(TOOLS)
+    if unknown:
+        parser.error("unknown converter(s): %s" % ", ".join(sorted(unknown)))
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="converters_benchmark_")
+    print "Work directory: %s" % work_dir
+    print ROW_TEMPLATE % ("Tool", "Faces", "Time (s)", "Faces/s", "RSS (MiB)", "Status")
+    try:
+        results = benchmark(args.sizes, tools, work_dir, args.timeout, print_result,
+                            n_textures=args.textures, normals=args.normals,
+                            polygon_size=args.polygon_size, seed=args.seed)
+    finally:
+        if not (args.work_dir or args.keep):
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w") as json_fd:
+            for result in results:
+                json_fd.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
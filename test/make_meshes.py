@@ -0,0 +1,345 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# make_meshes.py
+#
+# Deterministic synthetic meshes for the converters benchmarks.
+#
+r"""
+Builds synthetic meshes and writes them as Oolite .dat (with its .oti file),
+Wavefront .obj and .mtl, and Meshwork .mesh files.
+
+The same arguments and seed always give the same files.
+
+Geometry
+--------
+
+The mesh is a wavy height field laid on a grid:
+
+* polygon size 3: each grid cell is split in two triangles sharing their
+  vertices with the neighbour cells;
+* polygon size 4: each grid cell is a quad sharing its vertices;
+* polygon size 5 and over: each grid cell holds a standalone regular polygon.
+
+Vertex normals are the height field normals, texture coordinates are the
+vertex positions scaled to the 0-1 range. The faces are split in bands of
+equal size, one per texture.
+
+The .mesh format only knows triangles: bigger polygons are written as fans.
+
+Usage
+-----
+
+python make_meshes.py <number_of_faces> <output_dir> [--textures N]
+    [--no-normals] [--polygon-size K] [--seed S] [--formats dat,obj,mesh]
+"""
+
+import os
+import sys
+import math
+import random
+import argparse
+
+
+FORMATS = ("dat", "obj", "mesh")
+
+# Number of lines joined and written at once.
+WRITE_CHUNK_LINES = 4096
+
+
+class SyntheticMesh(object):  # pylint: disable=too-few-public-methods
+    """Mesh data, with zero based indices.
+    :vertices: list of (x, y, z) tuples.
+    :normals: list of (x, y, z) tuples, one per vertex, or None.
+    :uvs: list of (u, v) tuples, one per vertex.
+    :faces: list of (texture_index, [vertex indices]) tuples.
+    :texture_names: list of strings: The texture file names.
+    """
+    def __init__(self, vertices, normals, uvs, faces, texture_names):
+        self.vertices = vertices
+        self.normals = normals
+        self.uvs = uvs
+        self.faces = faces
+        self.texture_names = texture_names
+
+
+def _height(x, y):
+    """Returns the height field value at (x, y)."""
+    return 0.25 * math.sin(0.3 * x) * math.cos(0.2 * y)
+
+
+def _normal(x, y):
+    """Returns the normalized height field normal at (x, y)."""
+    d_x = 0.075 * math.cos(0.3 * x) * math.cos(0.2 * y)
+    d_y = -0.05 * math.sin(0.3 * x) * math.sin(0.2 * y)
+    length = math.sqrt(d_x * d_x + d_y * d_y + 1.0)
+    return (-d_x / length, -d_y / length, 1.0 / length)
+
+
+def _face_normal(vertices, points):
+    """Returns the normalized normal of the face made of 'points'.
+    :vertices: list of (x, y, z) tuples.
+    :points: list of ints: The face vertex indices.
+    """
+    (x_1, y_1, z_1), (x_2, y_2, z_2), (x_3, y_3, z_3) = [vertices[i] for i in points[:3]]
+    d_0 = (x_2 - x_1, y_2 - y_1, z_2 - z_1)
+    d_1 = (x_3 - x_2, y_3 - y_2, z_3 - z_2)
+    cross = (d_0[1] * d_1[2] - d_0[2] * d_1[1],
+             d_0[2] * d_1[0] - d_0[0] * d_1[2],
+             d_0[0] * d_1[1] - d_0[1] * d_1[0])
+    length = math.sqrt(sum(c * c for c in cross))
+    return tuple(c / length for c in cross)
+
+
+def build_mesh(n_faces, n_textures=2, normals=True, polygon_size=3, seed=1):
+    """Builds a synthetic mesh.
+    :n_faces: int: The number of faces (polygons).
+    :n_textures: int: The number of textures. 0 means no texture.
+        Defaults to 2.
+    :normals: bool: Whether vertex normals are generated. Defaults to True.
+    :polygon_size: int: The number of vertices of each face. Defaults to 3.
+    :seed: int: The random generator seed. Defaults to 1.
+    Returns a SyntheticMesh object.
+    """
+    if polygon_size < 3:
+        raise ValueError("Faces need at least 3 vertices.")
+    rand = random.Random(seed)
+    if polygon_size == 3:
+        n_cells = (n_faces + 1) // 2
+    else:
+        n_cells = n_faces
+    side = max(1, int(math.ceil(math.sqrt(n_cells))))
+    extent = float(side)
+
+    positions = []
+    if polygon_size <= 4:
+        for j in range(side + 1):
+            for i in range(side + 1):
+                # A small jitter keeps the values from being too regular.
+                positions.append((i + rand.uniform(-0.1, 0.1), float(j)))
+    else:
+        angles = [2.0 * math.pi * k / polygon_size for k in range(polygon_size)]
+        for cell in range(n_faces):
+            c_x, c_y = cell % side + 0.5, cell // side + 0.5
+            radius = rand.uniform(0.3, 0.45)
+            positions.extend((c_x + radius * math.cos(a), c_y + radius * math.sin(a))
+                             for a in angles)
+
+    vertices = [(x, y, _height(x, y)) for x, y in positions]
+    vertex_normals = [_normal(x, y) for x, y in positions] if normals else None
+    uvs = [(round(min(max(x / extent, 0.0), 1.0), 5), round(y / extent, 5))
+           for x, y in positions]
+
+    faces = []
+    for cell in range(n_cells):
+        i, j = cell % side, cell // side
+        if polygon_size <= 4:
+            p_a = j * (side + 1) + i
+            p_b, p_c, p_d = p_a + 1, p_a + side + 2, p_a + side + 1
+            if polygon_size == 3:
+                faces.append([p_a, p_b, p_c])
+                faces.append([p_a, p_c, p_d])
+            else:
+                faces.append([p_a, p_b, p_c, p_d])
+        else:
+            faces.append(range(cell * polygon_size, (cell + 1) * polygon_size))
+    del faces[n_faces:]
+
+    n_bands = max(n_textures, 1)
+    faces = [(index * n_bands // len(faces), points)
+             for index, points in enumerate(faces)]
+    texture_names = ["texture_%d.png" % index for index in range(n_textures)]
+    return SyntheticMesh(vertices, vertex_normals, uvs, faces, texture_names)
+
+
+def _write_lines(file_name, lines):
+    """Writes 'lines' to 'file_name' by chunks.
+    :file_name: string: The file path.
+    :lines: iterable of strings: The lines, with their line ends.
+    """
+    with open(file_name, "w") as fd_out:
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= WRITE_CHUNK_LINES:
+                fd_out.write("".join(chunk))
+                chunk = []
+        fd_out.write("".join(chunk))
+
+
+def _dat_lines(mesh):
+    """Yields the .dat file lines of 'mesh'."""
+    yield "// Synthetic mesh built by make_meshes.py\n\n"
+    yield "NVERTS %d\nNFACES %d\n\nVERTEX\n" % (len(mesh.vertices), len(mesh.faces))
+    for vertex in mesh.vertices:
+        yield "%.6f, %.6f, %.6f\n" % vertex
+    yield "\nFACES\n"
+    for _, points in mesh.faces:
+        normal = _face_normal(mesh.vertices, points)
+        yield "0,0,0,\t%.5f,%.5f,%.5f,\t%d,\t%s\n" % (normal + (len(points),
+                                                   ",".join(str(p) for p in points)))
+    if mesh.texture_names:
+        yield "\nTEXTURES\n"
+        for texture, points in mesh.faces:
+            yield "%d\t1.0 1.0\t%s\n" % (texture,
+                                          "\t".join("%.5f %.5f" % mesh.uvs[p] for p in points))
+        yield "\nNAMES %d\n" % len(mesh.texture_names)
+        for name in mesh.texture_names:
+            yield "%s\n" % os.path.splitext(name)[0]
+    if mesh.normals:
+        yield "\nNORMALS\n"
+        for normal in mesh.normals:
+            yield "%.5f, %.5f, %.5f\n" % normal
+    yield "\nEND\n"
+
+
+def write_dat(file_name, mesh):
+    """Writes 'mesh' as an Oolite .dat file, and its .oti file if the mesh is
+    textured.
+    :file_name: string: The .dat file path.
+    :mesh: SyntheticMesh: The mesh to write.
+    """
+    _write_lines(file_name, _dat_lines(mesh))
+    if mesh.texture_names:
+        _write_lines(os.path.splitext(file_name)[0] + ".oti",
+                     ("%s\n" % name for name in mesh.texture_names))
+
+
+def _obj_lines(mesh, mtl_lib_file):
+    """Yields the .obj file lines of 'mesh'."""
+    yield "# Synthetic mesh built by make_meshes.py\n"
+    if mesh.texture_names:
+        yield "mtllib %s\n" % mtl_lib_file
+    yield "o synthetic\n"
+    for vertex in mesh.vertices:
+        yield "v %.6f %.6f %.6f\n" % vertex
+    for u_v in mesh.uvs:
+        yield "vt %.5f %.5f\n" % u_v
+    if mesh.normals:
+        for normal in mesh.normals:
+            yield "vn %.5f %.5f %.5f\n" % normal
+    if mesh.normals:
+        corner = "{0}/{0}/{0}"
+    else:
+        corner = "{0}/{0}/"
+    texture = None
+    for face_texture, points in mesh.faces:
+        if mesh.texture_names and face_texture != texture:
+            texture = face_texture
+            yield "usemtl material_%d\n" % texture
+        yield "f %s\n" % " ".join(corner.format(p + 1) for p in points)
+
+
+def write_obj(file_name, mesh):
+    """Writes 'mesh' as Wavefront .obj and .mtl files.
+    :file_name: string: The .obj file path.
+    :mesh: SyntheticMesh: The mesh to write.
+    """
+    mtl_file_name = os.path.splitext(file_name)[0] + ".mtl"
+    _write_lines(file_name, _obj_lines(mesh, os.path.basename(mtl_file_name)))
+    if mesh.texture_names:
+        _write_lines(mtl_file_name,
+                     ("newmtl material_%d\nKd 1.00000 1.00000 1.00000\n"
+                      "map_Kd %s\n\n" % (index, name)
+                      for index, name in enumerate(mesh.texture_names)))
+
+
+def _mesh_lines(mesh):
+    """Yields the Meshwork .mesh file lines of 'mesh'."""
+    triangles = []
+    for texture, points in mesh.faces:
+        triangles.extend((texture, (points[0], points[k], points[k + 1]))
+                         for k in range(1, len(points) - 1))
+    yield "Mesh\t1\t1\r"
+    yield "VERTICES\r"
+    for index, vertex in enumerate(mesh.vertices):
+        yield "%d\t%f\t%f\t%f\r" % ((index,) + vertex)
+    yield "EDGES\r"
+    edges = set()
+    for _, (p_a, p_b, p_c) in triangles:
+        edges.update(((p_a, p_b), (p_a, p_c), (p_b, p_c)))
+    for edge in sorted(edges):
+        yield "%d\t%d\r" % edge
+    for index in range(max(len(mesh.texture_names), 1)):
+        if mesh.texture_names:
+            yield ("MATERIAL %s\t65535\t65535\t65535\t0\t4\t0\t0\t0\t0\t0\t0\t0\t0\t0\r"
+                   % mesh.texture_names[index])
+        else:
+            yield "MATERIAL\t65535\t65535\t65535\t0\t0\t0\r"
+        used = set()
+        for texture, triangle in triangles:
+            if texture == index or not mesh.texture_names:
+                used.update(triangle)
+                yield "%d\t%d\t%d\r" % triangle
+        if mesh.texture_names:
+            yield "UVS\r"
+            for point in sorted(used):
+                yield "%d\t%.5f\t%.5f\r" % ((point,) + mesh.uvs[point])
+    yield "END\r"
+
+
+def write_mesh(file_name, mesh):
+    """Writes 'mesh' as a Meshwork .mesh file.
+    :file_name: string: The .mesh file path.
+    :mesh: SyntheticMesh: The mesh to write.
+    """
+    _write_lines(file_name, _mesh_lines(mesh))
+
+
+WRITERS = {"dat": write_dat,
+           "obj": write_obj,
+           "mesh": write_mesh}
+
+
+def make_meshes(n_faces, output_dir, formats=FORMATS, base_name="mesh", **kwargs):
+    """Builds a synthetic mesh and writes it in each of 'formats', each one
+    in its own 'output_dir' sub directory named like the format, so the
+    converters outputs don't overwrite other inputs.
+    :n_faces: int: The number of faces.
+    :output_dir: string: The directory to write the files to.
+    :formats: iterable of strings: Some of FORMATS. Defaults to all of them.
+    :base_name: string: The files base name. Defaults to 'mesh'.
+    Other keyword arguments are given to 'build_mesh'.
+    Returns a dict like {"<format>": "<file_path>"}.
+    """
+    mesh = build_mesh(n_faces, **kwargs)
+    file_names = {}
+    for fmt in formats:
+        fmt_dir = os.path.join(output_dir, fmt)
+        if not os.path.isdir(fmt_dir):
+            os.makedirs(fmt_dir)
+        file_names[fmt] = os.path.join(fmt_dir, "%s.%s" % (base_name, fmt))
+        WRITERS[fmt](file_names[fmt], mesh)
+    return file_names
+
+
+def main():
+    """Main function of the program."""
+    parser = argparse.ArgumentParser(description="Writes deterministic synthetic meshes.")
+    parser.add_argument("faces", type=int, help="the number of faces")
+    parser.add_argument("output_dir", help="the directory to write the files to")
+    parser.add_argument("--textures", type=int, default=2,
+                        help="the number of textures (default: %(default)s)")
+    parser.add_argument("--no-normals", action="store_false", dest="normals",
+                        help="don't write vertex normals")
+    parser.add_argument("--polygon-size", type=int, default=3,
+                        help="the number of vertices of each face (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="the random generator seed (default: %(default)s)")
+    parser.add_argument("--formats", default=",".join(FORMATS),
+                        help="comma separated formats to write (default: %(default)s)")
+    args = parser.parse_args()
+    formats = [fmt for fmt in args.formats.split(",") if fmt]
+    unknown = set(formats).difference(FORMATS)
+    if unknown:
+        parser.error("unknown format(s): %s" % ", ".join(sorted(unknown)))
+    file_names = make_meshes(args.faces, args.output_dir, formats,
+                             n_textures=args.textures, normals=args.normals,
+                             polygon_size=args.polygon_size, seed=args.seed)
+    for fmt in formats:
+        print file_names[fmt]
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# test_convcache.py
+#
+# Unit tests of the conversion cache of convcache.py.
+#
+r"""
+Checks that the convcache.py keys change with everything shaping the output
+(input, sidecar files, options, converter source), and that a cache hit
+restores the stored outputs, leaving the up to date ones untouched.
+
+Usage
+-----
+
+python test_convcache.py
+
+It can also be run by a unittest compatible test runner, like pytest.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import convcache  # pylint: disable=wrong-import-position
+
+
+def write_file(file_name, content):
+    """Writes 'content' to 'file_name'."""
+    with open(file_name, "wb") as out_fd:
+        out_fd.write(content)
+
+
+def read_file(file_name):
+    """Returns the content of 'file_name'."""
+    with open(file_name, "rb") as in_fd:
+        return in_fd.read()
+
+
+class ConversionCacheTest(unittest.TestCase):
+    """Computes keys, then stores and restores outputs."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = convcache.ConversionCache(os.path.join(self.directory, "cache"))
+        self.input_file_name = self.path("model.obj")
+        self.sidecar_file_name = self.path("model.mtl")
+        self.source_file_name = self.path("converter.py")
+        write_file(self.input_file_name, b"v 0 0 0\n")
+        write_file(self.sidecar_file_name, b"newmtl hull\n")
+        write_file(self.source_file_name, b"VERSION = 1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        """Returns the path of 'name' in the test directory."""
+        return os.path.join(self.directory, name)
+
+    def key(self, options=None):
+        """Returns the cache key of the test model."""
+        return self.cache.key("converter", "1.0", self.input_file_name,
+                              [self.sidecar_file_name], options or {"scale": 1},
+                              [self.source_file_name])
+
+    def test_key_stable(self):
+        """The same conversion gives the same key."""
+        self.assertEqual(self.key(), self.key())
+
+    def test_key_input(self):
+        """The key changes with the input content."""
+        key = self.key()
+        write_file(self.input_file_name, b"v 0 0 1\n")
+        self.assertNotEqual(self.key(), key)
+
+    def test_key_sidecar(self):
+        """The key changes with a sidecar content, or its absence."""
+        keys = set([self.key()])
+        write_file(self.sidecar_file_name, b"newmtl engine\n")
+        keys.add(self.key())
+        os.remove(self.sidecar_file_name)
+        keys.add(self.key())
+        write_file(self.sidecar_file_name, b"")
+        keys.add(self.key())
+        self.assertEqual(len(keys), 4)
+
+    def test_key_options(self):
+        """The key changes with an option value."""
+        self.assertNotEqual(self.key({"scale": 2}), self.key())
+        self.assertNotEqual(self.key({"scale": 1, "normals": True}), self.key())
+
+    def test_key_source(self):
+        """The key changes with the converter source, compiled name or not."""
+        key = self.key()
+        self.assertEqual(self.cache.key("converter", "1.0", self.input_file_name,
+                                        [self.sidecar_file_name], {"scale": 1},
+                                        [self.path("converter.pyc")]), key)
+        write_file(self.source_file_name, b"VERSION = 2\n")
+        self.assertNotEqual(self.key(), key)
+
+    def test_restore(self):
+        """A hit restores the outputs, an unknown key doesn't."""
+        outputs = [self.path("model.dat"), self.path("model.oti")]
+        write_file(outputs[0], b"NVERTS 1\n")
+        write_file(outputs[1], b"hull.png\n")
+        key = self.key()
+        self.assertFalse(self.cache.restore(key, outputs))
+        self.cache.store(key, outputs)
+
+        os.remove(outputs[0])
+        write_file(outputs[1], b"changed\n")
+        self.assertTrue(self.cache.restore(key, outputs))
+        self.assertEqual(read_file(outputs[0]), b"NVERTS 1\n")
+        self.assertEqual(read_file(outputs[1]), b"hull.png\n")
+        self.assertFalse(os.path.exists(convcache.partial_name(outputs[0])))
+        self.assertFalse(self.cache.restore(self.key({"scale": 2}), outputs))
+
+    def test_restore_unchanged(self):
+        """Outputs already holding the stored bytes are not rewritten."""
+        outputs = [self.path("model.dat")]
+        write_file(outputs[0], b"NVERTS 1\n")
+        self.cache.store(self.key(), outputs)
+        os.utime(outputs[0], (1000000000, 1000000000))
+        self.assertTrue(self.cache.restore(self.key(), outputs))
+        self.assertEqual(os.path.getmtime(outputs[0]), 1000000000)
+
+    def test_evict(self):
+        """The least recently used entries are evicted first."""
+        output_file_name = self.path("model.dat")
+        write_file(output_file_name, b"x" * 1024)
+        self.cache.max_bytes = 2048
+        keys = [self.key({"scale": scale}) for scale in range(3)]
+        for index, key in enumerate(keys[:2]):
+            self.cache.store(key, [output_file_name])
+            os.utime(self.cache._entry_dir(key), (1000000000 + index, 1000000000 + index))
+        # Use the oldest one: the other is evicted.
+        self.assertTrue(self.cache.restore(keys[0], [output_file_name]))
+        self.cache.store(keys[2], [output_file_name])
+        self.assertTrue(self.cache.restore(keys[0], [output_file_name]))
+        self.assertFalse(self.cache.restore(keys[1], [output_file_name]))
+        self.assertTrue(self.cache.restore(keys[2], [output_file_name]))
+
+
+if __name__ == "__main__":
+    unittest.main()
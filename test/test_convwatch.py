@@ -0,0 +1,133 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# test_convwatch.py
+#
+# Unit tests of the watch mode of convwatch.py.
+#
+r"""
+Checks that a convwatch.py 'Watcher' converts again exactly the models whose
+content or sidecar files changed, and nothing for touched but unchanged
+files.
+
+Usage
+-----
+
+python test_convwatch.py
+
+It can also be run by a unittest compatible test runner, like pytest.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import convwatch  # pylint: disable=wrong-import-position
+
+
+def material_libraries(model):
+    """Returns the .mtl files named by the 'mtllib' lines of an .obj file."""
+    dir_name = os.path.dirname(model)
+    with open(model, "r") as in_fd:
+        return [os.path.join(dir_name, line.split()[1])
+                for line in in_fd if line.startswith("mtllib ")]
+
+
+class WatcherTest(unittest.TestCase):
+    """Changes files in a watched directory, then polls it."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.converted = []
+        # Each write gets its own modification time, however fast the test.
+        self.mtime = 1000000000
+        self.write("a.obj", "mtllib shared.mtl\nv 0 0 0\n")
+        self.write("b.obj", "mtllib shared.mtl\nv 1 0 0\n")
+        self.write("c.obj", "mtllib c.mtl\nv 2 0 0\n")
+        self.write("shared.mtl", "newmtl hull\n")
+        self.write("notes.txt", "not watched\n")
+        self.watcher = convwatch.Watcher(self.directory, [".obj"], [".mtl"],
+                                         material_libraries, self.converted.extend,
+                                         debounce=0)
+        self.watcher.start()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        """Returns the path of 'name' in the watched directory."""
+        return os.path.join(self.directory, name)
+
+    def write(self, name, content):
+        """Writes 'content' to the 'name' file, with a new modification time."""
+        with open(self.path(name), "w") as out_fd:
+            out_fd.write(content)
+        self.mtime += 10
+        os.utime(self.path(name), (self.mtime, self.mtime))
+
+    def poll(self):
+        """Polls the watcher, returns the converted model names."""
+        del self.converted[:]
+        result = self.watcher.poll()
+        self.assertEqual(result, self.converted)
+        return [os.path.basename(name) for name in result]
+
+    def test_start(self):
+        """Nothing is converted until something changes."""
+        self.assertEqual(self.poll(), [])
+
+    def test_model_changed(self):
+        """Only the changed model is converted."""
+        self.write("b.obj", "mtllib shared.mtl\nv 1 1 0\n")
+        self.assertEqual(self.poll(), ["b.obj"])
+        self.assertEqual(self.poll(), [])
+
+    def test_touched(self):
+        """Touched files with the same content are not converted."""
+        self.write("a.obj", "mtllib shared.mtl\nv 0 0 0\n")
+        self.write("shared.mtl", "newmtl hull\n")
+        self.assertEqual(self.poll(), [])
+
+    def test_sidecar_changed(self):
+        """A shared material library converts the models using it."""
+        self.write("shared.mtl", "newmtl engine\n")
+        self.assertEqual(self.poll(), ["a.obj", "b.obj"])
+
+    def test_sidecar_created(self):
+        """A missing sidecar file being created converts its model."""
+        self.write("c.mtl", "newmtl hull\n")
+        self.assertEqual(self.poll(), ["c.obj"])
+        os.remove(self.path("c.mtl"))
+        self.assertEqual(self.poll(), ["c.obj"])
+
+    def test_dependencies_changed(self):
+        """A model using another library isn't converted for the old one."""
+        self.write("a.obj", "mtllib c.mtl\nv 0 0 0\n")
+        self.assertEqual(self.poll(), ["a.obj"])
+        self.write("shared.mtl", "newmtl engine\n")
+        self.assertEqual(self.poll(), ["b.obj"])
+
+    def test_new_and_removed_models(self):
+        """New models are converted, removed ones are not."""
+        self.write("d.obj", "v 3 0 0\n")
+        os.remove(self.path("a.obj"))
+        self.write("notes.txt", "still not watched\n")
+        self.assertEqual(self.poll(), ["d.obj"])
+        self.write("shared.mtl", "newmtl engine\n")
+        self.assertEqual(self.poll(), ["b.obj"])
+
+    def test_debounce(self):
+        """Files are only looked at once they stopped changing."""
+        self.watcher.debounce = 3600
+        self.write("a.obj", "mtllib shared.mtl\nv 0 1 0\n")
+        self.assertEqual(self.poll(), [])
+        self.watcher.debounce = 0
+        self.assertEqual(self.poll(), ["a.obj"])
+
+
+if __name__ == "__main__":
+    unittest.main()
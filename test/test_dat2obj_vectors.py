@@ -0,0 +1,103 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# test_dat2obj_vectors.py
+#
+# Differential test of the VERTEX and NORMALS parsers of dat2obj.py.
+#
+r"""
+Checks that the NumPy and the pure Python parsers of the dat2obj.py VERTEX
+and NORMALS sections give the same coordinates for the same lines, well
+formed or not, and that 'dat2obj.convert' writes the same .obj data with and
+without NumPy.
+
+The NumPy tests are skipped if NumPy is not installed.
+
+Usage
+-----
+
+python test_dat2obj_vectors.py
+
+It can also be run by a unittest compatible test runner, like pytest.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dat2obj  # pylint: disable=wrong-import-position
+
+
+# Sections lines, each one given to both parsers.
+LINES = {"well formed": ["1 2 3", "4.5 -5 6e2", "-7 8.25 0"],
+         "commas": ["1, 2, 3", "4.5,-5,6e2", "-7 , 8.25 ,0"],
+         "tabs": ["1\t2\t3", "4.5  -5\t6e2", " -7 8.25 0 "],
+         "misaligned": ["1 2 3 4", "5 6", "7 8 9"],
+         "misaligned commas": ["1 2, 3", "4,5,6", "7 8 9"],
+         "empty values": ["1,,2,3", "4,5,6", "7,8,9"],
+         "short": ["1 2", "3 4", "5 6"]}
+
+DAT_TEMPLATE = """NVERTS 3
+NFACES 1
+
+VERTEX
+%s
+
+FACES
+0,0,0,\t0,0,1,\t3,\t0,1,2
+
+TEXTURES
+0\t1.0 1.0\t0.25 0.75\t0.5 0.5\t0.75 0.25
+
+NAMES 1
+hull
+
+NORMALS
+0 0 1
+0 0 1
+0 0 1
+
+END
+"""
+
+
+class VectorParsersTest(unittest.TestCase):
+    """Compares the NumPy and the pure Python parsers."""
+
+    @unittest.skipIf(dat2obj.numpy is None, "NumPy is not installed")
+    def test_vector_coordinates(self):
+        """Both parsers give the same coordinates."""
+        for name, lines in sorted(LINES.items()):
+            python_rows = dat2obj._vector_coordinates(lines)
+            numpy_rows = dat2obj._vector_coordinates(lines, len(lines))
+            if isinstance(numpy_rows, dat2obj.numpy.ndarray):
+                numpy_rows = [tuple(row) for row in numpy_rows.tolist()]
+            self.assertEqual(numpy_rows, python_rows, name)
+
+    @unittest.skipIf(dat2obj.numpy is None, "NumPy is not installed")
+    def test_vector_array(self):
+        """Only lines of three values are parsed with NumPy."""
+        self.assertEqual(dat2obj._vector_array(LINES["well formed"], 3).shape, (3, 3))
+        self.assertEqual(dat2obj._vector_array(LINES["commas"], 3).shape, (3, 3))
+        for name in ("misaligned", "misaligned commas", "empty values", "short"):
+            self.assertIsNone(dat2obj._vector_array(LINES[name], 3), name)
+        self.assertIsNone(dat2obj._vector_array(LINES["well formed"], 4))
+
+    @unittest.skipIf(dat2obj.numpy is None, "NumPy is not installed")
+    def test_convert(self):
+        """'convert' gives the same .obj data with and without NumPy."""
+        for name, lines in sorted(LINES.items()):
+            data = DAT_TEMPLATE % "\n".join(lines)
+            try:
+                expected = dat2obj.convert(data, options={"numpy": False})
+            except ValueError:
+                # Values the Python parser can't read are rejected either way.
+                self.assertRaises(ValueError, dat2obj.convert, data, options={"numpy": True})
+                continue
+            self.assertEqual(dat2obj.convert(data, options={"numpy": True}), expected, name)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# test_datscale.py
+#
+# Tests of the DatScale.py transform mode.
+#
+r"""
+Runs DatScale.py on a small .dat file and checks its --transform outputs:
+* face normals and NORMALS are transformed by the inverse transpose of the
+  matrix, then renormalized;
+* a negative determinant reverses the faces and their texture coordinates;
+* a uniform scale gives the same output as the matching scale factor.
+
+Usage
+-----
+
+python test_datscale.py
+
+It can also be run by a unittest compatible test runner, like pytest.
+"""
+
+import os
+import re
+import sys
+import math
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+DATSCALE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "DatScale.py")
+
+MODEL = """NVERTS 4
+NFACES 2
+
+VERTEX
+0 0 0
+1 0 0
+0 1 0
+1 1 1
+
+FACES
+0,0,0,\t0.70711,0.70711,0,\t3,\t0,1,2
+0,0,0,\t0,0,1,\t3,\t1,3,2  // top
+
+TEXTURES
+hull\t1.0 1.0\t0 0\t1 0\t0 1
+hull\t1.0 1.0\t1 0\t1 1\t0 1
+
+NAMES 1
+hull
+
+NORMALS
+0.70711 0.70711 0
+0.6 0.8 0
+0 0.6 0.8
+0 0 1
+
+END
+"""
+
+# Section header, like 'NAMES 1' or 'END'.
+SECTION = re.compile(r"([A-Z][A-Z]+)( .*)?$")
+
+
+def sections(text):
+    """Returns a dict like {"<section>": [[tokens], ...]} of a .dat file."""
+    result = {}
+    section = None
+    for line in text.splitlines():
+        line = re.sub(r"\s*(#|//).*", "", line).strip()
+        header = SECTION.match(line)
+        if header:
+            section = header.group(1)
+            result[section] = []
+        elif line and section:
+            result[section].append(re.split(r"[\s,]+", line))
+    return result
+
+
+def unit(x, y, z):
+    """Returns the (x, y, z) direction, renormalized."""
+    length = math.sqrt(x * x + y * y + z * z)
+    return (x / length, y / length, z / length)
+
+
+class TransformTest(unittest.TestCase):
+    """Runs DatScale.py in a temporary directory."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, "model.dat")
+        with open(self.file_name, "w") as out_fd:
+            out_fd.write(MODEL)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_datscale(self, *arguments):
+        """Runs DatScale.py quietly on the test model."""
+        subprocess.check_call([sys.executable, DATSCALE, "-q"] + list(arguments),
+                              cwd=self.directory)
+
+    def read(self, name):
+        """Returns the content of an output file."""
+        with open(os.path.join(self.directory, name), "r") as in_fd:
+            return in_fd.read()
+
+    def transform(self, spec):
+        """Transforms the test model, returns its output sections."""
+        self.run_datscale("--transform", spec, "model.dat")
+        return sections(self.read("model transformed.dat"))
+
+    def assertDirections(self, rows, expected):
+        """Checks the x, y, z values starting 'rows' tokens."""
+        self.assertEqual(len(rows), len(expected))
+        for row, direction in zip(rows, expected):
+            for value, expected_value in zip(row, direction):
+                self.assertAlmostEqual(float(value), expected_value, 4)
+
+    def test_inverse_transpose(self):
+        """Directions use the inverse transpose, not the matrix itself."""
+        result = self.transform("scale 2 1 1")
+        self.assertDirections([row[3:6] for row in result["FACES"]],
+                              [unit(0.5, 1, 0), (0, 0, 1)])
+        self.assertDirections(result["NORMALS"],
+                              [unit(0.5, 1, 0), unit(0.3, 0.8, 0), (0, 0.6, 0.8), (0, 0, 1)])
+        self.assertDirections(result["VERTEX"],
+                              [(0, 0, 0), (2, 0, 0), (0, 1, 0), (2, 1, 1)])
+        # Not flipped.
+        self.assertEqual([row[7:] for row in result["FACES"]], [["0", "1", "2"], ["1", "3", "2"]])
+
+    def test_shear(self):
+        """Normals stay orthogonal to the sheared surfaces."""
+        result = self.transform("matrix 1 1 0 0  0 1 0 0  0 0 1 0  0 0 0 1")
+        # (0.8, -0.6, 0) is orthogonal to the second normal, (0.6, 0.8, 0).
+        tangent = (0.8 - 0.6, -0.6, 0)
+        normal = [float(value) for value in result["NORMALS"][1]]
+        self.assertAlmostEqual(sum(a * b for a, b in zip(normal, tangent)), 0, 4)
+        self.assertDirections(result["NORMALS"][1:2], [unit(0.6, 0.2, 0)])
+
+    def test_negative_determinant(self):
+        """Mirroring reverses the faces and their texture coordinates."""
+        result = self.transform("mirror x")
+        self.assertEqual([row[7:] for row in result["FACES"]], [["2", "1", "0"], ["2", "3", "1"]])
+        self.assertEqual([row[3:] for row in result["TEXTURES"]],
+                         [["0", "1", "1", "0", "0", "0"], ["0", "1", "1", "1", "1", "0"]])
+        self.assertDirections([row[3:6] for row in result["FACES"]],
+                              [unit(-1, 1, 0), (0, 0, 1)])
+        # Two mirrors make a rotation: nothing is reversed.
+        result = self.transform("mirror x; mirror y")
+        self.assertEqual([row[7:] for row in result["FACES"]], [["0", "1", "2"], ["1", "3", "2"]])
+        self.assertEqual(result["TEXTURES"], sections(MODEL)["TEXTURES"])
+
+    def test_uniform_scale(self):
+        """A uniform scale gives the scale factor output."""
+        self.run_datscale("model.dat", "2.5")
+        expected = self.read("model x 2.5.dat").split("\n", 1)[1]
+        for spec in ("scale 2.5", "scale 2.5 2.5 2.5", "scale 5; scale 0.5"):
+            self.run_datscale("--transform", spec, "model.dat")
+            self.assertEqual(self.read("model transformed.dat").split("\n", 1)[1], expected, spec)
+
+    def test_uniform_scale_moved(self):
+        """A moved uniform scale copies everything after the vertices."""
+        result = self.transform("scale 3; translate 1 2 3")
+        self.assertDirections(result["VERTEX"],
+                              [(1, 2, 3), (4, 2, 3), (1, 5, 3), (4, 5, 6)])
+        tail = MODEL[MODEL.index("\n\nFACES"):]
+        self.assertTrue(self.read("model transformed.dat").endswith(tail))
+
+
+if __name__ == "__main__":
+    unittest.main()
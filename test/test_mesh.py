@@ -0,0 +1,203 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# test_mesh.py
+#
+# Round-trip tests of the mesh.py readers and writers, and of Dat2Mesh.py.
+#
+r"""
+Checks that a mesh.py 'Mesh' written to .dat, .obj or Meshwork .mesh files
+reads back the same, and that Dat2Mesh.py, built on it, writes the .dat
+geometry to .mesh files with the faces turning like their .dat normals.
+
+Usage
+-----
+
+python test_mesh.py
+
+It can also be run by a unittest compatible test runner, like pytest.
+"""
+
+import os
+import sys
+import array
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+import mesh  # pylint: disable=wrong-import-position
+
+
+# A square and a triangle. The triangle turns against its normal.
+MODEL = """// test model
+NVERTS 5
+NFACES 2
+
+VERTEX
+0 0 0
+1 0 0
+1 1 0
+0 1 0
+0.5, 0.5, 1  # apex
+
+FACES
+0,0,0,\t0,0,1,\t4,\t0,1,2,3
+0,0,0,\t0,-1,0,\t3,\t0,4,1
+
+TEXTURES
+0\t1.0 1.0\t0 0\t1 0\t1 1\t0 1
+engine.png\t2.0 4.0\t0 0\t1 2\t2 0
+
+NAMES 1
+hull.png
+
+NORMALS
+0 0 1
+0 0 1
+0 0 1
+0 0 1
+0 -1 0
+
+END
+"""
+
+
+def corner_positions(model):
+    """Returns the position of each face corner, rounded like the files."""
+    return [tuple(round(value, 5) for value in model.vertex(index))
+            for index in model.indices]
+
+
+def rounded(values):
+    """Returns 'values' rounded like the files."""
+    return [round(value, 5) for value in values]
+
+
+class MeshTest(unittest.TestCase):
+    """Writes the test model, then reads it back."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.model = mesh.parse_dat(MODEL.splitlines(True))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        """Returns the path of 'name' in the test directory."""
+        return os.path.join(self.directory, name)
+
+    def round_trip(self, name):
+        """Writes the test model to 'name', then reads it back."""
+        mesh.write(self.path(name), self.model)
+        return mesh.read(self.path(name))
+
+    def test_parse_dat(self):
+        """The .dat sections fill the arrays."""
+        model = self.model
+        self.assertEqual((model.n_vertices, model.n_faces), (5, 2))
+        self.assertEqual(list(model.face_sizes), [4, 3])
+        self.assertEqual(list(model.indices), [0, 1, 2, 3, 0, 4, 1])
+        self.assertEqual(model.materials, ["hull.png", "engine.png"])
+        self.assertEqual(list(model.material_ids), [0, 1])
+        # Relative to the texture size.
+        self.assertEqual(list(model.uvs[8:]), [0, 0, 0.5, 0.5, 1, 0])
+        self.assertEqual(list(model.face_normals), [0, 0, 1, 0, -1, 0])
+
+    def test_dat_errors(self):
+        """Inconsistent .dat data is rejected."""
+        for old, new in (("NVERTS 5", "NVERTS 6"), ("0.5, 0.5, 1", "0.5, 0.5"),
+                         ("0,4,1", "0,5,1"), ("\t3,\t", "\t4,\t")):
+            self.assertRaises(mesh.MeshError, mesh.parse_dat,
+                              MODEL.replace(old, new).splitlines())
+
+    def test_dat(self):
+        """.dat files read back the same."""
+        model = self.round_trip("model.dat")
+        for name in ("positions", "normals", "face_normals", "uvs"):
+            self.assertEqual(rounded(getattr(model, name)),
+                             rounded(getattr(self.model, name)), name)
+        for name in ("face_sizes", "indices", "material_ids", "materials"):
+            self.assertEqual(getattr(model, name), getattr(self.model, name), name)
+
+    def test_obj(self):
+        """.obj files read back the same, vertices being split per normal."""
+        model = self.round_trip("model.obj")
+        self.assertTrue(os.path.isfile(self.path("model.mtl")))
+        self.assertEqual(corner_positions(model), corner_positions(self.model))
+        self.assertEqual(rounded(model.uvs), rounded(self.model.uvs))
+        self.assertEqual(list(model.face_sizes), list(self.model.face_sizes))
+        self.assertEqual(model.materials, self.model.materials)
+        self.assertEqual(list(model.material_ids), list(self.model.material_ids))
+
+    def test_meshwork(self):
+        """.mesh files read back the same, as triangles."""
+        model = self.round_trip("model.mesh")
+        self.assertEqual(rounded(model.positions), rounded(self.model.positions))
+        self.assertEqual(list(model.face_sizes), [3, 3, 3])
+        self.assertEqual([tuple(model.indices[3 * face:3 * face + 3]) for face in range(3)],
+                         [tuple(self.model.indices[corner] for corner in corners)
+                          for _, corners in self.model.triangles()])
+        self.assertEqual(model.materials, self.model.materials)
+        self.assertEqual(list(model.material_ids), [0, 0, 1])
+        # One texture coordinate per vertex and material.
+        self.assertEqual(rounded(model.uvs[12:]), [0, 0, 0.5, 0.5, 1, 0])
+
+    def test_unknown_type(self):
+        """Unknown file types are rejected."""
+        self.assertRaises(mesh.MeshError, mesh.read, self.path("model.3ds"))
+        self.assertRaises(mesh.MeshError, mesh.write, self.path("model.3ds"), self.model)
+
+    def test_check(self):
+        """Inconsistent arrays are rejected."""
+        self.model.check()
+        self.model.indices[0] = 5
+        self.assertRaises(mesh.MeshError, self.model.check)
+        self.model.indices[0] = 0
+        self.model.uvs.append(0.0)
+        self.assertRaises(mesh.MeshError, self.model.check)
+
+    def test_reverse_face(self):
+        """Reversing a face reverses its corners and texture coordinates."""
+        uvs = self.model.uvs[8:]
+        normal = self.model.face_normal(4, 3)
+        self.model.reverse_face(4, 3)
+        self.assertEqual(list(self.model.indices), [0, 1, 2, 3, 1, 4, 0])
+        self.assertEqual(list(self.model.uvs[8:]), list(uvs[4:6] + uvs[2:4] + uvs[0:2]))
+        self.assertEqual(rounded(self.model.face_normal(4, 3)), rounded(-value for value in normal))
+
+
+class Dat2MeshTest(unittest.TestCase):
+    """Runs Dat2Mesh.py in a temporary directory."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, "Model.dat"), "w") as out_fd:
+            out_fd.write(MODEL)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_convert(self):
+        """The geometry is kept, the faces turn like their normals."""
+        with open(os.devnull, "w") as null_fd:
+            subprocess.check_call([sys.executable, os.path.join(ROOT_DIR, "Dat2Mesh.py"),
+                                   "Model.dat"], cwd=self.directory, stdout=null_fd)
+        model = mesh.read(os.path.join(self.directory, "model.mesh"))
+        self.assertEqual(rounded(model.positions),
+                         rounded(mesh.parse_dat(MODEL.splitlines()).positions))
+        self.assertEqual(list(model.indices), [0, 1, 2, 0, 2, 3, 1, 4, 0])
+        # One flat white material for the faces, then the palette.
+        self.assertEqual(len(model.materials), 8)
+        self.assertEqual(list(model.material_ids), [0, 0, 0])
+        self.assertEqual(model.uvs, array.array("d"))
+        self.assertEqual(model.face_normal(0, 3), (0, 0, 1))
+        self.assertLess(model.face_normal(6, 3)[1], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
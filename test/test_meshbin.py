@@ -0,0 +1,138 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# test_meshbin.py
+#
+# Unit tests of the .mbin container of meshbin.py.
+#
+r"""
+Checks that meshbin.py reads back what it wrote, as array.array copies or as
+read-only NumPy arrays, and that 'meshbin.load' ignores stale files: another
+format version, kind, data layout version or source.
+
+The in place tests are skipped if NumPy is not installed.
+
+Usage
+-----
+
+python test_meshbin.py
+
+It can also be run by a unittest compatible test runner, like pytest.
+"""
+
+import os
+import sys
+import array
+import shutil
+import struct
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import meshbin  # pylint: disable=wrong-import-position
+
+
+KIND = "test"
+
+VERSION = 3
+
+
+class MeshBinTest(unittest.TestCase):
+    """Writes a .mbin file, then reads it back."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_file_name = os.path.join(self.directory, "model.dat")
+        with open(self.source_file_name, "wb") as out_fd:
+            out_fd.write(b"NVERTS 3\n")
+        self.source = meshbin.source_info(self.source_file_name)
+        self.file_name = meshbin.file_name(self.source_file_name, KIND)
+        self.arrays = [("points", array.array("d", [0.5, -1.25, 3e10, 0.0, 7.0])),
+                       ("counts", array.array("i", [3, -4, 2 ** 31 - 1])),
+                       ("empty", array.array("i"))]
+        self.mesh = meshbin.MeshBin(KIND, VERSION, {"faces": 2}, [b"hull", b"engine"],
+                                    self.arrays)
+        self.mesh.write(self.file_name, self.source)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check_arrays(self, mesh):
+        """Checks the arrays of 'mesh' hold the written values."""
+        for name, values in self.arrays:
+            self.assertEqual(list(mesh[name]), list(values), name)
+
+    def test_file_name(self):
+        """The .mbin file is alongside the input file."""
+        self.assertEqual(self.file_name, os.path.join(self.directory, "model.test.mbin"))
+
+    def test_round_trip(self):
+        """The data is read back as written."""
+        mesh = meshbin.read(self.file_name)
+        self.assertEqual((mesh.kind, mesh.version), (KIND, VERSION))
+        self.assertEqual(mesh.meta, {"faces": 2})
+        self.assertEqual(mesh.names, [b"hull", b"engine"])
+        self.assertEqual(mesh.source, self.source)
+        self.check_arrays(mesh)
+        for name, values in self.arrays:
+            self.assertEqual(mesh[name].typecode, values.typecode, name)
+
+    @unittest.skipIf(meshbin.numpy is None, "NumPy is not installed")
+    def test_in_place(self):
+        """In place arrays are read-only NumPy arrays."""
+        mesh = meshbin.read(self.file_name, in_place=True)
+        self.check_arrays(mesh)
+        for name, _ in self.arrays:
+            self.assertIsInstance(mesh[name], meshbin.numpy.ndarray, name)
+            self.assertFalse(mesh[name].flags.writeable, name)
+        def assign():
+            mesh["points"][0] = 1.0
+        self.assertRaises(ValueError, assign)
+
+    def test_load(self):
+        """An up to date file is loaded."""
+        mesh = meshbin.load(self.file_name, KIND, VERSION, self.source)
+        self.assertIsNotNone(mesh)
+        self.check_arrays(mesh)
+
+    def test_stale(self):
+        """Files of another kind, version or source are ignored."""
+        self.assertIsNone(meshbin.load(self.file_name, "other", VERSION, self.source))
+        self.assertIsNone(meshbin.load(self.file_name, KIND, VERSION + 1, self.source))
+        with open(self.source_file_name, "ab") as out_fd:
+            out_fd.write(b"NFACES 1\n")
+        source = meshbin.source_info(self.source_file_name)
+        self.assertIsNone(meshbin.load(self.file_name, KIND, VERSION, source))
+        # Same size, other contents: only the digest changes.
+        with open(self.source_file_name, "wb") as out_fd:
+            out_fd.write(b"NVERTS 4\n")
+        source = meshbin.source_info(self.source_file_name)
+        self.assertEqual(source["size"], self.source["size"])
+        self.assertIsNone(meshbin.load(self.file_name, KIND, VERSION, source))
+
+    def test_format_version(self):
+        """Files of another format version are rejected."""
+        with open(self.file_name, "r+b") as io_fd:
+            io_fd.seek(len(meshbin.MAGIC))
+            io_fd.write(struct.pack("<I", meshbin.FORMAT_VERSION + 1))
+        self.assertRaises(meshbin.MeshBinError, meshbin.read, self.file_name)
+        self.assertIsNone(meshbin.load(self.file_name, KIND, VERSION, self.source))
+
+    def test_damaged(self):
+        """Empty, truncated or foreign files are not loaded."""
+        size = os.path.getsize(self.file_name)
+        with open(self.file_name, "r+b") as io_fd:
+            io_fd.truncate(size - 8)
+        self.assertRaises(meshbin.MeshBinError, meshbin.read, self.file_name)
+        with open(self.file_name, "wb") as out_fd:
+            out_fd.write(b"NVERTS 3\n")
+        self.assertRaises(meshbin.MeshBinError, meshbin.read, self.file_name)
+        open(self.file_name, "wb").close()
+        self.assertIsNone(meshbin.load(self.file_name, KIND, VERSION, self.source))
+        os.remove(self.file_name)
+        self.assertIsNone(meshbin.load(self.file_name, KIND, VERSION, self.source))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# test_numformat.py
+#
+# Differential test of the number formatting of numformat.py.
+#
+r"""
+Checks that 'numformat.format_number', 'format_numbers' and 'format_rows'
+give exactly the text of the Decimal based 'format_number' formerly used by
+Obj2DatTexNorm.py, copied below, over many random values.
+
+The values cover several magnitudes, values next to the rounding boundaries
+of the fifth decimal place, tiny negative values rounding to '-0', integers
+and zeros.
+
+Usage
+-----
+
+python test_numformat.py [--count N] [--seed S]
+
+It can also be run by a unittest compatible test runner, like pytest.
+"""
+
+import os
+import sys
+import random
+import decimal
+import argparse
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numformat  # pylint: disable=wrong-import-position
+
+
+DEFAULT_COUNT = 200000
+
+DEFAULT_SEED = 1
+
+
+def reference_format_number(n):
+    """The Decimal based 'format_number' of Obj2DatTexNorm.py."""
+    try:
+        dec = decimal.Decimal('%.5f' % n)
+    except:  # pylint: disable=bare-except
+        return 'bad'
+    tup = dec.as_tuple()
+    delta = len(tup.digits) + tup.exponent
+    digits = ''.join(str(d) for d in tup.digits)
+    if delta <= 0:
+        zeros = abs(tup.exponent) - len(tup.digits)
+        val = '0.' + ('0' * zeros) + digits
+    else:
+        val = digits[:delta] + ('0' * tup.exponent) + '.' + digits[delta:]
+    val = val.rstrip('0')
+    if val[-1] == '.':
+        val = val[:-1]
+
+    if tup.sign:
+        return '-' + val
+    else:
+        return val
+
+
+def random_values(count, seed):
+    """Returns a list of 'count' random floats of various kinds."""
+    rand = random.Random(seed)
+    kinds = [lambda: rand.uniform(-1.0, 1.0),
+             lambda: rand.gauss(0.0, 1000.0),
+             lambda: rand.uniform(-1e7, 1e7),
+             # Next to a rounding boundary of the fifth decimal place.
+             lambda: (rand.randint(-10 ** 7, 10 ** 7) + 0.5) / 1e5 + rand.uniform(-1e-12, 1e-12),
+             # Exact multiples of 0.00001, and integers.
+             lambda: rand.randint(-10 ** 7, 10 ** 7) / 1e5,
+             lambda: float(rand.randint(-10 ** 6, 10 ** 6)),
+             # Rounding to zero, with both signs.
+             lambda: rand.uniform(-1e-5, 1e-5),
+             lambda: rand.choice((0.0, -0.0, 1e-300, -1e-300, 1e15, -1e15))]
+    return [rand.choice(kinds)() for _ in xrange(count)]
+
+
+class FormatNumberTest(unittest.TestCase):
+    """Compares numformat with the reference formatter."""
+    count = DEFAULT_COUNT
+    seed = DEFAULT_SEED
+
+    @classmethod
+    def setUpClass(cls):
+        cls.values = random_values(cls.count, cls.seed)
+        cls.expected = [reference_format_number(value) for value in cls.values]
+
+    def assert_same(self, texts):
+        """Checks 'texts' against the reference texts of 'self.values'."""
+        self.assertEqual(len(texts), len(self.expected))
+        for value, text, expected in zip(self.values, texts, self.expected):
+            if text != expected:
+                self.fail("%r: %r instead of %r" % (value, text, expected))
+
+    def test_format_number(self):
+        """One value at a time."""
+        self.assert_same([numformat.format_number(value) for value in self.values])
+
+    def test_format_numbers(self):
+        """All the values at once."""
+        self.assert_same(numformat.format_numbers(self.values))
+
+    def test_format_rows(self):
+        """Rows of three values, like vertex coordinates."""
+        values = self.values[:len(self.values) // 3 * 3]
+        texts = []
+        for row in numformat.format_rows(values, 3):
+            texts.extend(row.split(" "))
+        self.assert_same(texts + [numformat.format_number(value)
+                                  for value in self.values[len(values):]])
+
+    def test_bad_values(self):
+        """Values which are not numbers."""
+        self.assertEqual(numformat.format_number("x"), reference_format_number("x"))
+        self.assertEqual(numformat.format_numbers([0.5, None]), ["0.5", "bad"])
+        self.assertEqual(numformat.format_rows([], 3), [])
+
+
+def main():
+    """Runs the test with the command line count and seed."""
+    parser = argparse.ArgumentParser(description="Differential test of numformat.py.")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT,
+                        help="number of random values (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                        help="random seed (default: %(default)s)")
+    options, remaining = parser.parse_known_args()
+    FormatNumberTest.count = options.count
+    FormatNumberTest.seed = options.seed
+    unittest.main(argv=[sys.argv[0]] + remaining)
+
+
+if __name__ == "__main__":
+    main()
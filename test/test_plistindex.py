@@ -0,0 +1,167 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# test_plistindex.py
+#
+# Unit tests of the texture names index of plistindex.py.
+#
+r"""
+Checks the texture names index plistindex.py builds from OpenStep and XML
+plists, and that its disk cache is reused while the plist didn't change, and
+rebuilt once its modification time and content hash changed.
+
+Usage
+-----
+
+python test_plistindex.py
+
+It can also be run by a unittest compatible test runner, like pytest.
+"""
+
+import os
+import sys
+import shutil
+import plistlib
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import plistindex  # pylint: disable=wrong-import-position
+
+
+PLIST = """// comment
+{
+    "oolite_template_anaconda" =
+    {
+        model = "oolite_anaconda.dat";
+        /* block
+           comment */
+        materials =
+        {
+            "Engine" = { diffuse_map = "oolite_anaconda_subents.png"; };
+            Gun = { diffuse_map = { name = "gun.png"; }; specular = 0.5; };
+            "Hull" = { diffuse_map = "hull \\"x\\".png"; emission_map = "e.png"; };
+        };
+        exhaust = ( "1 2 3 4 5 6", "7 8 9" , );
+        data = <0fbd 77>;
+    };
+    small = { model = small.dat; materials = { alpha = {diffuse_map = a_diffuse.png;}; }; };
+    nomodel = { like_ship = small; };
+}
+"""
+
+INDEX = {"oolite_anaconda.dat": {"Engine": "oolite_anaconda_subents.png",
+                                 "Gun": "gun.png",
+                                 "Hull": "hull \"x\".png"},
+         "small.dat": {"alpha": "a_diffuse.png"}}
+
+
+class PlistIndexTest(unittest.TestCase):
+    """Loads the index of a plist, changes it, then loads it again."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, "cache")
+        self.plist_file_name = os.path.join(self.directory, "shipdata.plist")
+        self.mtime = 1000000000
+        self.write(PLIST)
+        # Count the index builds, and forget the indexes of other tests.
+        self.builds = 0
+        self.build_index = plistindex.build_index
+        plistindex.build_index = self.counted_build_index
+        plistindex._LOADED.clear()
+
+    def tearDown(self):
+        plistindex.build_index = self.build_index
+        plistindex._LOADED.clear()
+        shutil.rmtree(self.directory)
+
+    def counted_build_index(self, plist):
+        """Counts the calls to 'plistindex.build_index'."""
+        self.builds += 1
+        return self.build_index(plist)
+
+    def write(self, content, mtime=None):
+        """Writes the plist, with a new modification time if not given."""
+        with open(self.plist_file_name, "w") as out_fd:
+            out_fd.write(content)
+        if mtime is None:
+            self.mtime += 10
+            mtime = self.mtime
+        os.utime(self.plist_file_name, (mtime, mtime))
+
+    def load(self, same_process=False):
+        """Loads the index, as another run would unless 'same_process'."""
+        if not same_process:
+            plistindex._LOADED.clear()
+        return plistindex.load_index(self.plist_file_name, self.cache_dir)
+
+    def test_openstep(self):
+        """OpenStep plists are parsed."""
+        plist = plistindex.read_plist(self.plist_file_name)
+        self.assertEqual(plist["oolite_template_anaconda"]["exhaust"],
+                         ["1 2 3 4 5 6", "7 8 9"])
+        self.assertEqual(plist["oolite_template_anaconda"]["data"], "\x0f\xbd\x77")
+        self.assertEqual(plistindex.build_index(plist), INDEX)
+
+    def test_xml(self):
+        """XML plists give the same index."""
+        plist = plistindex.read_plist(self.plist_file_name)
+        del plist["oolite_template_anaconda"]["data"]
+        plistlib.writePlist(plist, self.plist_file_name)
+        self.assertEqual(self.load(), INDEX)
+
+    def test_errors(self):
+        """Damaged plists are rejected."""
+        for content in ("{ a = b; ", "{ a = \"b; }", "{ a = b c; }", "{ a = b; } x",
+                        "bplist00"):
+            self.write(content)
+            self.assertRaises(plistindex.PlistError, self.load)
+
+    def test_cached(self):
+        """The index is built once, then read from the disk cache."""
+        self.assertEqual(self.load(), INDEX)
+        self.assertEqual(self.load(), INDEX)
+        self.assertEqual(self.load(same_process=True), INDEX)
+        self.assertEqual(self.builds, 1)
+
+    def test_touched(self):
+        """A plist touched without changing its content isn't parsed again."""
+        self.load()
+        self.write(PLIST)
+        self.assertEqual(self.load(), INDEX)
+        self.assertEqual(self.builds, 1)
+
+    def test_changed(self):
+        """The index is rebuilt once the plist changed."""
+        self.load()
+        self.write(PLIST.replace("gun.png", "cannon.png"))
+        index = self.load()
+        self.assertEqual(index["oolite_anaconda.dat"]["Gun"], "cannon.png")
+        self.assertEqual(self.builds, 2)
+        # Same process, same size, another content.
+        self.write(PLIST.replace("gun.png", "lamp.png"))
+        index = self.load(same_process=True)
+        self.assertEqual(index["oolite_anaconda.dat"]["Gun"], "lamp.png")
+        self.assertEqual(self.builds, 3)
+
+    def test_changed_same_mtime(self):
+        """A content change keeping the modification time changes the size."""
+        self.load()
+        self.write(PLIST.replace("gun.png", "gun2.png"), self.mtime)
+        self.assertEqual(self.load()["oolite_anaconda.dat"]["Gun"], "gun2.png")
+        self.assertEqual(self.builds, 2)
+
+    def test_no_cache(self):
+        """Without the disk cache, the index is built by each run."""
+        for _ in range(2):
+            plistindex._LOADED.clear()
+            self.assertEqual(plistindex.load_index(self.plist_file_name, self.cache_dir,
+                                                   use_cache=False), INDEX)
+        self.assertEqual(self.builds, 2)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/bin/env python2
+#
+# -*- encoding: utf-8 -*-
+#
+# test_triangulation.py
+#
+# Unit tests of the polygon triangulation of Obj2DatTexNorm.py.
+#
+r"""
+Checks the triangles Obj2DatTexNorm.py splits polygons into, with each
+triangulation mode: convex and concave polygons, polygons with collinear
+corners, in both windings and out of the xy plane. Each polygon with n
+corners must give n - 2 triangles, turning like the polygon and covering it
+exactly.
+
+Usage
+-----
+
+python test_triangulation.py
+
+It can also be run by a unittest compatible test runner, like pytest.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Obj2DatTexNorm  # pylint: disable=wrong-import-position
+
+
+# Counterclockwise polygons of the xy plane.
+CONVEX = {"triangle": [(0, 0), (1, 0), (0, 1)],
+          "square": [(0, 0), (1, 0), (1, 1), (0, 1)],
+          "hexagon": [(2, 0), (1, 2), (-1, 2), (-2, 0), (-1, -2), (1, -2)]}
+
+CONCAVE = {"chevron": [(0, 0), (2, 1), (4, 0), (2, 3)],
+           "L": [(0, 0), (2, 0), (2, 1), (1, 1), (1, 3), (0, 3)],
+           "star": [(0, 3), (-1, 1), (-3, 1), (-1.5, -0.5), (-2, -3), (0, -1.5),
+                    (2, -3), (1.5, -0.5), (3, 1), (1, 1)],
+           "comb": [(0, 0), (5, 0), (5, 3), (4, 3), (4, 1), (3, 1), (3, 3), (2, 3),
+                    (2, 1), (1, 1), (1, 3), (0, 3)],
+           # Reflex corner first: fans would go out of the polygon.
+           "dart": [(1, 1), (0, 3), (-2, -1), (3, 0)]}
+
+COLLINEAR = {"square with a middle": [(0, 0), (1, 0), (2, 0), (2, 2), (0, 2)],
+             "square with middles": [(0, 0), (1, 0), (2, 0), (2, 1), (2, 2), (1, 2),
+                                     (0, 2), (0, 1)],
+             "square with thirds": [(0, 0), (1, 0), (2, 0), (3, 0), (3, 3), (0, 3)],
+             "L with middles": [(0, 0), (1, 0), (2, 0), (2, 1), (1, 1), (1, 2), (1, 3),
+                                (0, 3), (0, 1.5)]}
+
+MODES = ("earclip", "auto")
+
+
+def signed_area(points):
+    """Returns twice the signed area of a 2D polygon."""
+    return sum(points[i - 1][0] * points[i][1] - points[i][0] * points[i - 1][1]
+               for i in range(len(points)))
+
+
+def planes(points):
+    """Returns a 2D polygon put in the xy, yz and xz planes, and tilted."""
+    return [("xy", [(x, y, 0.0) for x, y in points]),
+            ("yz", [(5.0, x, y) for x, y in points]),
+            ("zx", [(y, -1.0, x) for x, y in points]),
+            ("tilted", [(x, y, 0.5 * x + 0.25 * y) for x, y in points])]
+
+
+class TriangulationTest(unittest.TestCase):
+    """Splits polygons into triangles."""
+
+    def check(self, name, points, mode):
+        """Checks the triangles of a 2D polygon, in both windings and in
+        several planes."""
+        for winding, polygon in (("ccw", points), ("cw", points[::-1])):
+            area = signed_area(polygon)
+            for plane, polygon_3d in planes(polygon):
+                label = "%s, %s, %s, %s" % (name, mode, winding, plane)
+                triangles = Obj2DatTexNorm.triangulate(polygon_3d, mode)
+                self.assertEqual(len(triangles), len(polygon) - 2, label)
+                covered = 0.0
+                for triangle in triangles:
+                    self.assertEqual(len(set(triangle)), 3, label)
+                    self.assertTrue(all(0 <= corner < len(polygon) for corner in triangle), label)
+                    triangle_area = signed_area([polygon[corner] for corner in triangle])
+                    # Same winding as the polygon, and not flat.
+                    self.assertGreater(triangle_area * area, 0, "%s: %s" % (label, triangle))
+                    covered += triangle_area
+                # No overlap, nothing missing.
+                self.assertAlmostEqual(covered, area, 9, label)
+
+    def test_fan_triangles(self):
+        """Fans share the first corner."""
+        self.assertEqual(Obj2DatTexNorm.fan_triangles(3), [(0, 1, 2)])
+        self.assertEqual(Obj2DatTexNorm.fan_triangles(5), [(0, 1, 2), (0, 2, 3), (0, 3, 4)])
+
+    def test_fan_mode(self):
+        """Fan mode always gives fans."""
+        for points in CONCAVE.values():
+            for _, polygon in planes(points):
+                self.assertEqual(Obj2DatTexNorm.triangulate(polygon, "fan"),
+                                 Obj2DatTexNorm.fan_triangles(len(points)))
+
+    def test_convex(self):
+        """Convex polygons are split in triangles of the same winding."""
+        for name, points in sorted(CONVEX.items()):
+            for mode in MODES + ("fan",):
+                self.check(name, points, mode)
+
+    def test_auto_convex(self):
+        """Convex polygons are split as fans in auto mode."""
+        for points in CONVEX.values():
+            for _, polygon in planes(points):
+                self.assertEqual(Obj2DatTexNorm.triangulate(polygon, "auto"),
+                                 Obj2DatTexNorm.fan_triangles(len(points)))
+
+    def test_concave(self):
+        """Concave polygons are ear clipped."""
+        for name, points in sorted(CONCAVE.items()):
+            for mode in MODES:
+                self.check(name, points, mode)
+
+    def test_collinear(self):
+        """Collinear corners give no flat triangle."""
+        for name, points in sorted(COLLINEAR.items()):
+            for mode in MODES:
+                self.check(name, points, mode)
+
+    def test_flat(self):
+        """Flat and self-intersecting polygons fall back to fans."""
+        line = [(0, 0, 0), (1, 1, 1), (2, 2, 2), (3, 3, 3)]
+        bow_tie = [(0, 0, 0), (2, 2, 0), (2, 0, 0), (0, 2, 0)]
+        for polygon in (line, bow_tie):
+            for mode in MODES:
+                self.assertEqual(Obj2DatTexNorm.triangulate(polygon, mode),
+                                 Obj2DatTexNorm.fan_triangles(4))
+
+
+if __name__ == "__main__":
+    unittest.main()